@@ -0,0 +1,10 @@
+EMAIL_HOST = 'localhost'
+EMAIL_HOST_USER = 'noreply@example.org'
+EMAIL_HOST_PASSWORD = ''
+LDAP_AUTH_URL = 'ldap://localhost'
+LDAP_AUTH_SEARCH_BASE = ''
+LDAP_USERNAME = None
+LDAP_PASSWORD = None
+CLIENT_ID = 'x'
+CLIENT_SECRET = 'x'
+TENANT_ID = 'x'
@@ -14,6 +14,7 @@ import os
 from django.urls import reverse_lazy
 # earo_travel_tracker imports
 from earo_travel_tracker import secret_settings
+from utils.database import get_databases
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -57,6 +58,7 @@ INSTALLED_APPS = [
 # Authentication backends
 AUTHENTICATION_BACKENDS = (
     "django.contrib.auth.backends.ModelBackend",
+    "trip.backends.TripOwnerBackend",
     "guardian.backends.ObjectPermissionBackend",
     # "django_python3_ldap.auth.LDAPBackend",
     # "django_auth_adfs.backend.AdfsAuthCodeBackend",
@@ -65,6 +67,7 @@ AUTHENTICATION_BACKENDS = (
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'utils.instrumentation.RequestStatsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -96,13 +99,10 @@ WSGI_APPLICATION = 'earo_travel_tracker.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
+# The database is configured from the environment, see utils/database.py. Without any
+# DATABASE_* variables the bundled SQLite database is used.
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
-}
+DATABASES = get_databases(BASE_DIR, password=getattr(secret_settings, 'DATABASE_PASSWORD', ''))
 
 
 # Password validation
@@ -164,6 +164,26 @@ EMAIL_HOST_USER = secret_settings.EMAIL_HOST_USER
 EMAIL_HOST_PASSWORD = secret_settings.EMAIL_HOST_PASSWORD
 EMAIL_PORT = 587
 EMAIL_SUBJECT_PREFIX = 'Kenya Travel System'
+# Reuse authenticated SMTP connections across sends (utils.emailing.PooledEmailBackend).
+# Up to EMAIL_POOL_MAX_IDLE connections are kept open per server for EMAIL_POOL_IDLE_TIMEOUT
+# seconds.
+EMAIL_BACKEND = 'utils.emailing.PooledEmailBackend'
+EMAIL_POOL_MAX_IDLE = 4
+EMAIL_POOL_IDLE_TIMEOUT = 60
+# Scheme and host of the site, used for links in emails sent outside a request (the
+# sendapprovaldigests command).
+EMAIL_SITE_URL = 'http://localhost:8000'
+
+# Per-request query and timing statistics (utils.instrumentation.RequestStatsMiddleware).
+# REQUEST_STATS_SAMPLE_RATE of the requests are measured and the latest REQUEST_STATS_WINDOW
+# measurements per URL name are kept for the request_stats endpoint. Measured requests running
+# more than REQUEST_STATS_MAX_QUERIES queries, more than REQUEST_STATS_MAX_SQL_TIME seconds of
+# SQL or the same query more than REQUEST_STATS_MAX_DUPLICATES times are logged.
+REQUEST_STATS_SAMPLE_RATE = 0.1
+REQUEST_STATS_WINDOW = 500
+REQUEST_STATS_MAX_QUERIES = 50
+REQUEST_STATS_MAX_SQL_TIME = 0.5
+REQUEST_STATS_MAX_DUPLICATES = 5
 
 # --------------------------------------------------------------------------------------------
 # All third-party apps / plugins settings should be below here
@@ -248,6 +268,40 @@ LOGGING = {
 TEMPUS_DOMINUS_INCLUDE_ASSETS = True
 TEMPUS_DOMINUS_LOCALIZE = True
 
+# Seconds after which each process reloads its trip interval index (trip.intervals) to pick
+# up trips saved by other processes.
+TRIP_INTERVAL_INDEX_TTL = 300
+
+# Queued emails (trip.models.OutboxEmail) are given up after EMAIL_OUTBOX_MAX_ATTEMPTS failed
+# attempts. The wait before a retry starts at EMAIL_OUTBOX_RETRY_DELAY seconds and doubles
+# after each failure. A worker claims the emails it sends for EMAIL_OUTBOX_CLAIM_TIMEOUT
+# seconds; emails claimed by a worker that died are sent by another once the claim expires.
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 300
+
+# The delta sync API (trip.sync) hands out tokens SYNC_TOKEN_OVERLAP seconds older than each
+# sync so that changes still being committed are sent on the next one. Tombstones of deleted
+# rows are purged by the purgesynctombstones command after SYNC_TOMBSTONE_DAYS days; clients
+# with older tokens get a full sync.
+SYNC_TOKEN_OVERLAP = 60
+SYNC_TOMBSTONE_DAYS = 90
+
+# django rest framework
+# The API is only served to logged on users, by session or by an ADFS access token (the
+# latter needs django_auth_adfs.backend.AdfsAccessTokenBackend in AUTHENTICATION_BACKENDS).
+# Lists are paged by keyset (utils.pagination), so a page costs the same whatever its depth.
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'django_auth_adfs.rest_framework.AdfsAccessTokenAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'utils.pagination.KeysetCursorPagination',
+}
+
 # django-guardian settings
 GUARDIAN_RENDER_403 = True
 # TODO: design and set GUARDIAN_TEMPLATE_403
@@ -290,5 +344,9 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'DEBUG',
         },
+        'utils.instrumentation': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
     },
 }
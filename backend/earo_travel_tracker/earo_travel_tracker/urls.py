@@ -19,27 +19,29 @@ from django.views.generic import RedirectView
 from django.conf.urls.static import static
 from django.conf import settings
 # Earo_travel_tracker imports
+from traveler.urls import api_url_patterns as traveler_api
 from traveler.urls import urlpatterns as traveler
 from trip.urls import api_url_patterns as trip_api
 from trip.urls import urlpatterns as trip
+from utils.instrumentation import request_stats_view
 
 
 # url patterns for restful APIs
-# ***** Disabled API URLs until authentication is enforced *****
-# api_urlpatterns = [
-#     path('traveler/', include(traveler_api)),
-#     path('trip/', include(trip_api)),
-# ]
+api_urlpatterns = [
+    path('traveler/', include(traveler_api)),
+    path('trip/', include(trip_api)),
+]
 
 # All url patterns
 urlpatterns = [
     path('administration/', admin.site.urls),
     path('admin/', include('grappelli.urls')),
-    # path('api/', include(api_urlpatterns)),
+    path('api/', include(api_urlpatterns)),
     path('traveler/', include(traveler)),
     path('trip/', include(trip)),
     path('accounts/', include('django.contrib.auth.urls')),
     path('oauth2/', include('django_auth_adfs.urls')),
+    path('request-stats/', request_stats_view, name='request_stats'),
     # Redirect domain root to List trip
     path('', RedirectView.as_view(pattern_name='u_list_my_trips')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,36 @@
+"""
+this script defines a command to deactivate expired delegations of approval.
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+# earo-travel-tracker imports
+from traveler.models import ApprovalDelegation, ApproverAssignment
+
+
+class Command(BaseCommand):
+    """
+    Definition of the expiredelegations command.
+
+    Delegations are only followed within their start and end dates, but they stay marked as
+    active until revoked. This command deactivates all delegations that ended before today in
+    one statement and brings the approver assignments in line with the delegations that
+    expired or are in force. The assignments of every approver with a delegation in force are
+    rebuilt, so a delegation that started on a day the command didn't run is still assigned
+    on the next run. It is meant to be scheduled to run daily, e.g.
+    from cron shortly after midnight:
+
+        5 0 * * * python manage.py expiredelegations
+    """
+    help = 'Deactivate delegations of approval whose end date has passed.'
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        expired_approver_ids = ApprovalDelegation.deactivate_expired(today)
+        delegating_approver_ids = set(ApprovalDelegation.in_force(today).values_list(
+            'approver_id', flat=True))
+        changed_approver_ids = expired_approver_ids | delegating_approver_ids
+        if changed_approver_ids:
+            ApproverAssignment.objects.rebuild_for_approvers(changed_approver_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Deactivated the expired delegations of {len(expired_approver_ids)} approver(s), '
+            f'{len(delegating_approver_ids)} approver(s) have delegations in force'))
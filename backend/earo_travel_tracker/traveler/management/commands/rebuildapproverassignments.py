@@ -0,0 +1,20 @@
+"""
+this script defines a command to rebuild the approver assignments of all travelers.
+"""
+from django.core.management.base import BaseCommand
+# earo-travel-tracker imports
+from traveler.models import ApproverAssignment
+
+
+class Command(BaseCommand):
+    """
+    Definition of the rebuildapproverassignments command.
+
+    The assignments are kept up to date by signals. This command recomputes them from scratch,
+    for instance after approvers were changed with bulk updates that don't send signals.
+    """
+    help = 'Rebuild the approver assignments of all travelers from their configured approvers.'
+
+    def handle(self, *args, **options):
+        count = ApproverAssignment.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{count} approver assignments rebuilt'))
@@ -0,0 +1,78 @@
+# Generated by Django 2.2.24 on 2026-10-17 11:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_approver_assignments(apps, schema_editor):
+    """
+    Build the approver assignments of the existing travelers.
+    """
+    TravelerProfile = apps.get_model('traveler', 'TravelerProfile')
+    ApprovalDelegation = apps.get_model('traveler', 'ApprovalDelegation')
+    ApproverAssignment = apps.get_model('traveler', 'ApproverAssignment')
+    delegates = {}
+    for approver_id, delegate_id in ApprovalDelegation.objects.filter(active=True).values_list(
+            'approver_id', 'delegate_id'):
+        delegates.setdefault(approver_id, delegate_id)
+    assignments = []
+    for traveler_id, approver_id, level_1_id, level_2_id, level_3_id in \
+            TravelerProfile.objects.values_list(
+                'id',
+                'approver_id',
+                'department__security_level_1_approver_id',
+                'department__security_level_2_approver_id',
+                'country_of_duty__security_level_3_approver_id'):
+        for security_level, configured_id in (
+                ('1', approver_id or level_1_id), ('2', level_2_id), ('3', level_3_id)):
+            if configured_id is not None:
+                assignments.append(ApproverAssignment(
+                    traveler_id=traveler_id,
+                    security_level=security_level,
+                    approver_id=delegates.get(configured_id, configured_id),
+                    delegated_by_id=configured_id if configured_id in delegates else None,
+                ))
+    ApproverAssignment.objects.bulk_create(assignments)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traveler', '0005_auto_20210430_1333'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='approver',
+            name='security_level',
+            field=models.CharField(choices=[('1', 'Level 1'), ('2', 'Level 2'), ('3', 'Level 3')], default=1, max_length=1, verbose_name='Security Approval Level'),
+        ),
+        migrations.AlterField(
+            model_name='countrysecuritylevel',
+            name='security_level',
+            field=models.CharField(choices=[('1', 'Level 1'), ('2', 'Level 2'), ('3', 'Level 3')], max_length=1),
+        ),
+        migrations.CreateModel(
+            name='ApproverAssignment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('security_level', models.CharField(choices=[('1', 'Level 1'), ('2', 'Level 2'), ('3', 'Level 3')], max_length=1)),
+                ('approver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to='traveler.Approver')),
+                ('delegated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='delegated_assignments', to='traveler.Approver')),
+                ('traveler', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='approver_assignments', to='traveler.TravelerProfile')),
+            ],
+            options={
+                'verbose_name': 'Approver Assignment',
+                'verbose_name_plural': 'Approver Assignments',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='approverassignment',
+            index=models.Index(fields=['approver', 'security_level'], name='approverassignment_level_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='approverassignment',
+            unique_together={('traveler', 'security_level')},
+        ),
+        migrations.RunPython(build_approver_assignments, migrations.RunPython.noop),
+    ]
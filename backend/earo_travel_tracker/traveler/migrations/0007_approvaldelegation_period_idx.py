@@ -0,0 +1,17 @@
+# Generated by Django 2.2.24 on 2026-10-17 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traveler', '0006_approverassignment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='approvaldelegation',
+            index=models.Index(fields=['active', 'start_date', 'end_date'], name='approvaldelegation_period_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.24 on 2026-10-17 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traveler', '0007_approvaldelegation_period_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='approver',
+            name='notification_mode',
+            field=models.CharField(choices=[('immediate', 'Email each approval request'), ('digest', 'Daily digest of pending approval requests')], default='immediate', max_length=10, verbose_name='Approval Request Emails'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.24 on 2026-10-17 15:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traveler', '0008_approver_notification_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='travelerprofile',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
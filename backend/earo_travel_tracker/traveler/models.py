@@ -3,11 +3,13 @@ Data models for the traveler app are defined in this file.
 """
 import logging
 # django imports
-from django.db import models
+from django.apps import apps
+from django.db import connection, models, transaction
 from django.conf import settings
 from django.urls import reverse
 from django.contrib.auth.models import Group
 from django.utils import timezone
+# earo_travel_tracker imports
 
 LEVELS_OF_SECURITY = (
     ('1','Level 1'),
@@ -15,6 +17,11 @@ LEVELS_OF_SECURITY = (
     ('3','Level 3'),
 )
 
+NOTIFICATION_MODES = (
+    ('immediate', 'Email each approval request'),
+    ('digest', 'Daily digest of pending approval requests'),
+)
+
 
 logger = logging.getLogger(__name__)
 
@@ -30,10 +37,19 @@ class Approver(models.Model):
     security_level = models.CharField(max_length=1, choices=LEVELS_OF_SECURITY, null=False,
                             blank=False, default=1, verbose_name="Security Approval Level")
     is_active = models.BooleanField(null=False, blank=True, default=True)
+    notification_mode = models.CharField(max_length=10, choices=NOTIFICATION_MODES,
+                            default='immediate', verbose_name="Approval Request Emails")
 
     def __str__(self):
         return " ".join([self.user.first_name, self.user.last_name])
 
+    def wants_immediate_email(self, trip):
+        """
+        Check whether the approver is emailed as soon as approval of the trip is requested.
+        Approvers on the digest are still emailed immediately for mission critical trips.
+        """
+        return self.notification_mode == 'immediate' or trip.is_mission_critical
+
     def get_absolute_url(self):
         """
         absolute url to an Approver instance
@@ -44,15 +60,23 @@ class Approver(models.Model):
         """
         Check if there is an existing active delegation.
         """
-        return ApprovalDelegation.objects.filter(approver=self).filter(active=True).exists()
+        return self.get_active_delegation() is not None
 
-    def get_delegate(self):
-        """Get the approver to whom approval has been delegated"""
-        return self.get_active_delegation().approver
+    def get_delegate(self, date=None):
+        """
+        Get the approver who approves on behalf of this approver on a date, following
+        delegation chains. Returns None if approval isn't delegated.
+        """
+        return ApprovalDelegation.get_delegates([self.id], date=date).get(self.id)
 
     def get_active_delegation(self):
-        """Get the active delegation"""
-        return ApprovalDelegation.objects.filter(approver=self, active=True)[0]
+        """
+        Get the active delegation that is in force or yet to start, or None if there
+        isn't one.
+        """
+        return ApprovalDelegation.objects.filter(
+            approver=self, active=True, end_date__gte=timezone.now().date()
+        ).order_by('start_date').first()
 
     def add_to_approvers_group(self):
         """
@@ -93,6 +117,99 @@ class ApprovalDelegation(models.Model):
         """Permalink to an objects details"""
         return reverse('u_trip_details', kwargs={'approval_delegation_id':self.id})
 
+    @classmethod
+    def in_force(cls, date=None):
+        """
+        Get the delegations that are active and whose period includes the date, which
+        defaults to today.
+        """
+        date = date or timezone.now().date()
+        return cls.objects.filter(active=True, start_date__lte=date, end_date__gte=date)
+
+    @classmethod
+    def get_delegate_ids(cls, approver_ids, date=None):
+        """
+        Get the ids of the approvers to whom the given approvers have delegated approval on a
+        date, in one query. Delegation chains are followed, so if A delegated to B who
+        delegated to C, C is returned for A. A chain that loops back on itself is ignored.
+        When an approver has several delegations in force, the one that started first is
+        followed.
+        The chains are followed by a recursive common table expression, which carries the ids
+        met along each chain to detect loops.
+        Returns a dict mapping the id of each delegating approver to the id of their delegate.
+        """
+        approver_ids = list(approver_ids)
+        if not approver_ids:
+            return {}
+        date = connection.ops.adapt_datefield_value(date or timezone.now().date())
+        table = connection.ops.quote_name(cls._meta.db_table)
+        in_force = "active = %s AND start_date <= %s AND end_date >= %s"
+        sql = f"""
+            WITH RECURSIVE delegation (approver_id, delegate_id) AS (
+                SELECT d.approver_id, d.delegate_id FROM {table} d
+                WHERE d.{in_force.replace(' AND ', ' AND d.')} AND NOT EXISTS (
+                    SELECT 1 FROM {table} e
+                    WHERE e.approver_id = d.approver_id
+                    AND e.{in_force.replace(' AND ', ' AND e.')}
+                    AND (e.start_date < d.start_date OR
+                         (e.start_date = d.start_date AND e.id < d.id)))
+            ), chain (root_id, delegate_id, path, looped) AS (
+                SELECT approver_id, delegate_id,
+                       ',' || approver_id || ',' || delegate_id || ',', 0
+                FROM delegation WHERE approver_id IN ({', '.join(['%s'] * len(approver_ids))})
+                UNION ALL
+                SELECT chain.root_id, delegation.delegate_id,
+                       chain.path || delegation.delegate_id || ',',
+                       CASE WHEN chain.path LIKE '%%,' || delegation.delegate_id || ',%%'
+                            THEN 1 ELSE 0 END
+                FROM chain JOIN delegation ON delegation.approver_id = chain.delegate_id
+                WHERE chain.looped = 0
+            )
+            SELECT root_id, delegate_id, looped FROM chain
+            WHERE looped = 1 OR NOT EXISTS (
+                SELECT 1 FROM delegation WHERE delegation.approver_id = chain.delegate_id)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [True, date, date] * 2 + approver_ids)
+            rows = cursor.fetchall()
+        delegate_ids = {}
+        for approver_id, delegate_id, looped in rows:
+            if looped:
+                logger.warning("Delegation of approval by approver %s loops back on itself",
+                               approver_id)
+            else:
+                delegate_ids[approver_id] = delegate_id
+        return delegate_ids
+
+    @classmethod
+    def get_delegates(cls, approver_ids, date=None):
+        """
+        Get the approvers to whom the given approvers have delegated approval on a date,
+        following delegation chains as get_delegate_ids does. The delegates are loaded with
+        their user accounts in a second query, which is only run if approval is delegated.
+        Returns a dict mapping the id of each delegating approver to their delegate.
+        """
+        delegate_ids = cls.get_delegate_ids(approver_ids, date=date)
+        if not delegate_ids:
+            return {}
+        delegates = Approver.objects.select_related('user').in_bulk(set(delegate_ids.values()))
+        return {approver_id: delegates[delegate_id]
+                for approver_id, delegate_id in delegate_ids.items()}
+
+    @classmethod
+    def deactivate_expired(cls, date=None):
+        """
+        Deactivate all active delegations that ended before the date, which defaults to
+        today, with a single update.
+        Returns the ids of the approvers whose delegations were deactivated.
+        """
+        date = date or timezone.now().date()
+        expired = cls.objects.filter(active=True, end_date__lt=date)
+        approver_ids = set(expired.values_list('approver_id', flat=True))
+        if approver_ids:
+            expired.update(active=False)
+        return approver_ids
+
     def revoke_approval_delegation(self, reason_for_revocation):
         """
         Enables an approver to revoke an existing delegation of their approval rights.
@@ -102,6 +219,12 @@ class ApprovalDelegation(models.Model):
         self.end_date = timezone.now().today()
         self.save()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['active', 'start_date', 'end_date'],
+                         name='approvaldelegation_period_idx'),
+        ]
+
 
 class Departments(models.Model):
     """
@@ -154,6 +277,24 @@ class CountrySecurityLevel(models.Model):
         verbose_name_plural = "Countries Security Levels"
 
 
+class TravelerProfileQuerySet(models.QuerySet):
+    """
+    Queryset for TravelerProfile instances.
+    """
+
+    def with_list_details(self):
+        """
+        Load the related rows shown when listing travelers in the same query.
+        """
+        return self.select_related(
+            'user_account',
+            'department',
+            'department__security_level_1_approver__user',
+            'approver__user',
+            'is_managed_by__user_account',
+        )
+
+
 class TravelerProfile(models.Model):
     """
     This model defines details of travelers. They can be employees, dependants of employees,
@@ -183,6 +324,9 @@ class TravelerProfile(models.Model):
                                     related_name='Line_Manager')
     approver = models.ForeignKey(Approver, on_delete=models.PROTECT, blank=True,
                                 null=True, related_name='trip_approver')
+    updated_on = models.DateTimeField(auto_now=True)
+
+    objects = TravelerProfileQuerySet.as_manager()
 
     def __str__(self):
         if self.user_account:
@@ -193,6 +337,11 @@ class TravelerProfile(models.Model):
         """Return the absolute url of the detail view of an instance."""
         return reverse('u_traveler_details', args=[(self.id)])
 
+    def save(self, *args, **kwargs):
+        # the memoized approvers may change with the saved details
+        self._approvers = None
+        return super().save(*args, **kwargs)
+
     def is_line_managed_by(self, user):
         """
         Check that the logged on user is the line manager of a traveler.
@@ -200,42 +349,155 @@ class TravelerProfile(models.Model):
         """
         return bool(self.is_managed_by == user)
 
+    def resolve_approvers(self):
+        """
+        Look up the approvers of all security levels from the database.
+        The configured approvers are loaded in one query and the delegations in force for them
+        in another. Returns a dict mapping each security level to the Approver who should
+        approve it or None.
+        """
+        traveler = TravelerProfile.objects.select_related(
+            'approver__user',
+            'department__security_level_1_approver__user',
+            'department__security_level_2_approver__user',
+            'country_of_duty__security_level_3_approver__user',
+        ).get(id=self.id)
+        department = traveler.department
+        country = traveler.country_of_duty
+        approvers = {
+            # the traveler's own approver takes precedence over the department's
+            1: traveler.approver or (department and department.security_level_1_approver),
+            2: department and department.security_level_2_approver,
+            3: country and country.security_level_3_approver,
+        }
+        approvers = {level: approver or None for level, approver in approvers.items()}
+
+        # check if approval has been delegated.
+        delegates = ApprovalDelegation.get_delegates(
+            {approver.id for approver in approvers.values() if approver is not None})
+        return {level: delegates.get(approver.id, approver) if approver is not None else None
+                for level, approver in approvers.items()}
+
+    def get_approvers(self):
+        """
+        Get the approvers of all security levels. They are memoized on the instance, which
+        lives for one request.
+        """
+        approvers = getattr(self, '_approvers', None)
+        if approvers is None:
+            approvers = self._approvers = self.resolve_approvers()
+        return approvers
+
     def get_approver(self, security_level=1):
         """
         Get the approver for a traveler profile, given the security level
         return None if no approver is set.
         """
-        approver = None
-        # security level 1 approver
-        print("passed arg type:", type(security_level)) # debugging code
-        security_level = int(security_level)
-        if security_level == 1:
-            if self.approver is not None:
-                print(self.approver) # Debug code
-                approver = self.approver
-            elif (self.department is not None and
-                self.department.security_level_1_approver is not None):
-                print("trying to get department approver") # debug code
-                print(self.department.security_level_1_approver) # debug code
-                approver = self.department.security_level_1_approver
-
-        # security level 2 approver
-        elif security_level == 2:
-            approver = self.department.security_level_2_approver
-
-        # security level 3 approver
-        elif security_level == 3:
-            approver = self.country_of_duty.security_level_3_approver
-            print(f"sec level 3 {approver}")
-        else:
-            print("Invalid Security Level")  # debug code
+        try:
+            security_level = int(security_level)
+        except (TypeError, ValueError):
+            security_level = None
+        if security_level not in (1, 2, 3):
+            logger.warning("Invalid security level %s", security_level)
             return None
-
-        # check if approval has been delegated.
-        if approver is not None and approver.active_delegation_exists():
-            return approver.get_delegate()
-        return approver
+        return self.get_approvers()[security_level]
 
     class Meta:
         verbose_name = "Traveler Profile"
         verbose_name_plural = "Travelers Profiles"
+
+
+class ApproverAssignmentManager(models.Manager):
+    """
+    Manager for ApproverAssignment that rebuilds the assignments from their sources.
+    """
+
+    def rebuild(self, travelers=None):
+        """
+        Recompute the assignments of the given TravelerProfile queryset, or of all travelers
+        if none is given, and replace the stored ones in a single transaction.
+        This runs one query for the configured approvers, one for delegations, one for the
+        stored assignments, a delete and a bulk insert regardless of the number of travelers.
+        The trips of travelers whose approvers changed are stamped as modified, since other
+        users may now see them, so that the delta sync (trip.sync) sends them again.
+        Returns the number of assignments created.
+        """
+        if travelers is None:
+            travelers = TravelerProfile.objects.all()
+        configured = list(travelers.values_list(
+            'id',
+            'approver_id',
+            'department__security_level_1_approver_id',
+            'department__security_level_2_approver_id',
+            'country_of_duty__security_level_3_approver_id',
+        ))
+        delegates = ApprovalDelegation.get_delegate_ids(
+            {approver_id for row in configured for approver_id in row[1:] if approver_id})
+
+        assignments = []
+        for traveler_id, approver_id, level_1_id, level_2_id, level_3_id in configured:
+            # the traveler's own approver takes precedence over the department's
+            for security_level, configured_id in (
+                    ('1', approver_id or level_1_id), ('2', level_2_id), ('3', level_3_id)):
+                if configured_id is None:
+                    continue
+                delegate_id = delegates.get(configured_id)
+                assignments.append(self.model(
+                    traveler_id=traveler_id,
+                    security_level=security_level,
+                    approver_id=delegate_id or configured_id,
+                    delegated_by_id=configured_id if delegate_id else None,
+                ))
+
+        rebuilt = {(assignment.traveler_id, assignment.security_level, assignment.approver_id,
+                    assignment.delegated_by_id) for assignment in assignments}
+        with transaction.atomic():
+            stored = self.filter(traveler_id__in=[row[0] for row in configured])
+            changed = set(stored.values_list(
+                'traveler_id', 'security_level', 'approver_id', 'delegated_by_id')) ^ rebuilt
+            stored.delete()
+            self.bulk_create(assignments)
+            if changed:
+                apps.get_model('trip', 'Trip').objects.filter(
+                    traveler_id__in={row[0] for row in changed}).update(created_on=timezone.now())
+        return len(assignments)
+
+    def rebuild_for_approvers(self, approver_ids):
+        """
+        Recompute the assignments of the travelers for whom any of the approvers is
+        configured at any security level. This is used when the approvers' delegations change.
+        """
+        return self.rebuild(TravelerProfile.objects.filter(
+            models.Q(approver__in=approver_ids) |
+            models.Q(department__security_level_1_approver__in=approver_ids) |
+            models.Q(department__security_level_2_approver__in=approver_ids) |
+            models.Q(country_of_duty__security_level_3_approver__in=approver_ids)
+        ))
+
+
+class ApproverAssignment(models.Model):
+    """
+    Materialized mapping of the approver who currently approves each security level of a
+    traveler's trips, taking delegation into account.
+    The rows are derived from TravelerProfile.approver, the Departments and
+    CountrySecurityLevel approvers and active ApprovalDelegation instances. They are kept up
+    to date by signals and can be rebuilt with the rebuildapproverassignments command.
+    """
+    traveler = models.ForeignKey(TravelerProfile, on_delete=models.CASCADE,
+                            related_name='approver_assignments')
+    security_level = models.CharField(max_length=1, choices=LEVELS_OF_SECURITY)
+    approver = models.ForeignKey(Approver, on_delete=models.CASCADE,
+                            related_name='assignments')
+    delegated_by = models.ForeignKey(Approver, on_delete=models.CASCADE, null=True, blank=True,
+                            related_name='delegated_assignments')
+
+    objects = ApproverAssignmentManager()
+
+    class Meta:
+        verbose_name = "Approver Assignment"
+        verbose_name_plural = "Approver Assignments"
+        unique_together = [['traveler', 'security_level']]
+        indexes = [
+            models.Index(fields=['approver', 'security_level'],
+                         name='approverassignment_level_idx'),
+        ]
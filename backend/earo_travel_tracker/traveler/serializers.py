@@ -10,12 +10,18 @@ from traveler.models import TravelerProfile, Departments
 class TravelerProfileSerializer(serializers.ModelSerializer):
     """
     This class serializes the TravelerDetails Model.
+    The names are read from the user account, which the queryset should load.
     """
+    first_name = serializers.CharField(source='user_account.first_name', read_only=True,
+                                       allow_null=True)
+    last_name = serializers.CharField(source='user_account.last_name', read_only=True,
+                                      allow_null=True)
+
     class Meta:
         model = TravelerProfile
-        fields = ['first_name', 'last_name', 'date_of_birth', 'department',
-            'type_of_traveler', 'nationality', 'is_dependant_of', 'country_of_duty',
-            'contact_telephone', 'contact_email', 'user_account', 'is_managed_by']
+        fields = ['id', 'first_name', 'last_name', 'department', 'type_of_traveler',
+            'nationality', 'country_of_duty', 'contact_telephone', 'contact_email',
+            'user_account', 'is_managed_by', 'approver', 'updated_on']
 
 
 class DepartmentSerializer(serializers.ModelSerializer):
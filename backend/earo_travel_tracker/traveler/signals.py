@@ -6,17 +6,22 @@ Many signals will be post-save to assign various permissions.
 """
 import logging
 # django imports
-from django.db.models.signals import post_save
+from django.apps import apps
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.conf import settings
 from django.contrib.auth.models import Group
 from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from django.utils import timezone
 # third-party app imports
-from guardian.shortcuts import assign_perm, get_anonymous_user
+from guardian.shortcuts import get_anonymous_user
 # earo_travel_tracker imports
-from traveler.models import TravelerProfile, ApprovalDelegation
+from traveler.models import (
+    TravelerProfile, ApprovalDelegation, Departments, CountrySecurityLevel, ApproverAssignment,
+)
+from utils.emailing import render_email
+from utils.permissions import grant_perms
 
 logger = logging.getLogger(__name__)
 
@@ -35,9 +40,10 @@ def create_traveler_profile(sender, **kwargs):
                     contact_telephone='',
                     contact_email=user.email,
                     user_account=user,
-        ).save()
+        )
+        profile.save()
         logger.debug("Created profile for %s", user.username)
-        assign_perm("traveler.change_travelerprofile", user, profile)
+        grant_perms(user, ("change_travelerprofile",), profile)
         logger.debug("Granted %s permission to change own profile", user.username)
         try:
             travelers = Group.objects.get(name='travelers')
@@ -57,8 +63,7 @@ def alert_admin_initial_login(sender, **kwargs):
             "subject": "New User Logged On",
             "recipient": kwargs["instance"].first_name,
         }
-        html_message = render_to_string("emails/new_user_login.html", context)
-        plain_message = strip_tags(html_message)
+        plain_message, html_message = render_email("new_user_login", context)
         send_mail(
             subject=context["subject"],
             message= plain_message,
@@ -76,5 +81,73 @@ def assign_trip_perms(sender, **kwargs):
     if kwargs['created']:
         approval_delegation = kwargs['instance']
         user = approval_delegation.approver.user
-        assign_perm('change_approvaldelegation', user, approval_delegation)
+        grant_perms(user, ('change_approvaldelegation',), approval_delegation)
         logger.debug("Change permission for the %s instance assigned to the delegating approver", sender)
+
+@receiver(post_save, sender=TravelerProfile)
+def update_traveler_approver_assignments(sender, **kwargs):
+    """
+    Recompute the approver assignments of a saved traveler.
+    """
+    traveler = kwargs['instance']
+    ApproverAssignment.objects.rebuild(TravelerProfile.objects.filter(id=traveler.id))
+
+@receiver(post_save, sender=Departments)
+def update_department_approver_assignments(sender, **kwargs):
+    """
+    Recompute the approver assignments of the travelers in a saved department.
+    """
+    department = kwargs['instance']
+    ApproverAssignment.objects.rebuild(TravelerProfile.objects.filter(department=department))
+
+@receiver(post_save, sender=CountrySecurityLevel)
+def update_country_approver_assignments(sender, **kwargs):
+    """
+    Recompute the approver assignments of the travelers based in a saved country.
+    """
+    country = kwargs['instance']
+    ApproverAssignment.objects.rebuild(TravelerProfile.objects.filter(country_of_duty=country))
+
+@receiver(post_save, sender=ApprovalDelegation)
+@receiver(post_delete, sender=ApprovalDelegation)
+def update_delegated_approver_assignments(sender, **kwargs):
+    """
+    Recompute the approver assignments affected by a change in delegation of approval.
+    """
+    approval_delegation = kwargs['instance']
+    ApproverAssignment.objects.rebuild_for_approvers([approval_delegation.approver_id])
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def touch_traveler_profiles(sender, **kwargs):
+    """
+    Stamp the profiles and trips showing the user's names as modified so that conditional
+    requests for them see the change: the user's own profile, those of the travelers they
+    manage and the trips they travel on, as the traveler or a dependant. Saves that only
+    change other fields, such as the last_login of every login, are left out.
+    """
+    update_fields = kwargs['update_fields']
+    if kwargs['created'] or (update_fields is not None and
+                             not {'first_name', 'last_name'} & set(update_fields)):
+        return
+    user = kwargs['instance']
+    now = timezone.now()
+    TravelerProfile.objects.filter(
+        Q(user_account=user) | Q(is_managed_by__user_account=user)
+    ).update(updated_on=now)
+    # imported here since the trip app's models depend on this app's
+    trip_model = apps.get_model('trip', 'Trip')
+    dependants_model = apps.get_model('trip', 'TripTravelerDependants')
+    trip_model.objects.filter(
+        Q(traveler__user_account=user) |
+        Q(id__in=dependants_model.objects.filter(
+            dependants_travelling__user_account=user).values('trip_id'))
+    ).update(created_on=now)
+
+@receiver(post_save, sender=Departments)
+def touch_department_traveler_profiles(sender, **kwargs):
+    """
+    Stamp the profiles of the travelers in a saved department as modified, since they show
+    the department's name.
+    """
+    TravelerProfile.objects.filter(department=kwargs['instance']).update(
+        updated_on=timezone.now())
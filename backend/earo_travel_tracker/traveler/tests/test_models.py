@@ -1,5 +1,225 @@
 """Models  unittests for travelers app"""
+from datetime import timedelta
+from io import StringIO
+
 from django.test import TestCase
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from traveler.models import (
+    ApprovalDelegation, Approver, ApproverAssignment, CountrySecurityLevel, Departments,
+    TravelerProfile,
+)
+
+user_model = get_user_model()
 
 
 # Test model methods
+class TestTravelerProfileApprover(TestCase):
+    """
+    Test the resolution of a traveler's approvers.
+    """
+    def setUp(self):
+        self.approvers = [
+            Approver.objects.create(user=user_model.objects.create_user(username=f"approver{n}"))
+            for n in range(4)
+        ]
+        self.department = Departments.objects.create(
+            department="ICT", description="ICT",
+            security_level_1_approver=self.approvers[0],
+            security_level_2_approver=self.approvers[1])
+        country = CountrySecurityLevel.objects.create(
+            country="Kenya", security_level="2", security_level_3_approver=self.approvers[2])
+        user = user_model.objects.create_user(username="traveler")
+        TravelerProfile.objects.filter(user_account=user).update(
+            department=self.department, country_of_duty=country)
+        self.traveler_id = TravelerProfile.objects.get(user_account=user).id
+
+    def get_traveler(self):
+        """Load the traveler afresh as a new request would."""
+        return TravelerProfile.objects.get(id=self.traveler_id)
+
+    def test_approvers_by_security_level(self):
+        """
+        Test that each security level resolves to the configured approver.
+        """
+        traveler = self.get_traveler()
+        self.assertEqual(traveler.get_approver(1), self.approvers[0])
+        self.assertEqual(traveler.get_approver("2"), self.approvers[1])
+        self.assertEqual(traveler.get_approver(3), self.approvers[2])
+        self.assertIsNone(traveler.get_approver(4))
+
+    def test_traveler_approver_takes_precedence(self):
+        """
+        Test that an approver set on the traveler replaces the department's level 1 approver.
+        """
+        traveler = self.get_traveler()
+        traveler.approver = self.approvers[3]
+        traveler.save()
+        self.assertEqual(self.get_traveler().get_approver(1), self.approvers[3])
+
+    def test_delegated_approval(self):
+        """
+        Test that the delegate is returned when approval has been delegated.
+        """
+        ApprovalDelegation.objects.create(
+            approver=self.approvers[1], delegate=self.approvers[3],
+            reason_for_delegation="Leave", end_date=timezone.now().date() + timedelta(days=5))
+        self.assertEqual(self.get_traveler().get_approver(2), self.approvers[3])
+
+    def test_approvers_are_memoized(self):
+        """
+        Test that resolved approvers are memoized on the instance only, so that a department
+        changed since is seen by the next instance loaded.
+        """
+        traveler = self.get_traveler()
+        with self.assertNumQueries(2):
+            traveler.get_approver(1)
+        with self.assertNumQueries(0):
+            for security_level in (1, 2, 3):
+                self.assertIsNotNone(traveler.get_approver(security_level))
+                self.assertIsNotNone(traveler.get_approver(security_level).user.username)
+
+        self.department.security_level_2_approver = self.approvers[3]
+        self.department.save()
+        self.assertEqual(traveler.get_approver(2), self.approvers[1])
+        self.assertEqual(self.get_traveler().get_approver(2), self.approvers[3])
+
+
+class TestApproverAssignment(TestCase):
+    """
+    Test that the materialized approver assignments follow their sources.
+    """
+    def setUp(self):
+        self.approvers = [
+            Approver.objects.create(user=user_model.objects.create_user(username=f"approver{n}"))
+            for n in range(3)
+        ]
+        self.department = Departments.objects.create(
+            department="ICT", description="ICT", security_level_1_approver=self.approvers[0])
+        user = user_model.objects.create_user(username="traveler")
+        self.traveler = TravelerProfile.objects.get(user_account=user)
+        self.traveler.department = self.department
+        self.traveler.save()
+
+    def get_assignments(self):
+        """Return the traveler's assignments as (security level, approver, delegated by)."""
+        return list(self.traveler.approver_assignments.order_by('security_level').values_list(
+            'security_level', 'approver_id', 'delegated_by_id'))
+
+    def test_department_changes(self):
+        """
+        Test that department approvers are assigned as they change.
+        """
+        self.assertEqual(self.get_assignments(), [('1', self.approvers[0].id, None)])
+        self.department.security_level_2_approver = self.approvers[1]
+        self.department.save()
+        self.assertEqual(self.get_assignments(), [
+            ('1', self.approvers[0].id, None), ('2', self.approvers[1].id, None)])
+
+    def test_delegation(self):
+        """
+        Test that delegation moves the assignment to the delegate and revocation moves it back.
+        """
+        delegation = ApprovalDelegation.objects.create(
+            approver=self.approvers[0], delegate=self.approvers[2],
+            reason_for_delegation="Leave", end_date=timezone.now().date() + timedelta(days=5))
+        self.assertEqual(self.get_assignments(),
+                         [('1', self.approvers[2].id, self.approvers[0].id)])
+        delegation.revoke_approval_delegation("Back from leave")
+        self.assertEqual(self.get_assignments(), [('1', self.approvers[0].id, None)])
+
+    def test_full_rebuild(self):
+        """
+        Test that a full rebuild restores assignments changed without signals.
+        """
+        TravelerProfile.objects.filter(id=self.traveler.id).update(approver=self.approvers[1])
+        self.assertEqual(ApproverAssignment.objects.rebuild(), 1)
+        self.assertEqual(self.get_assignments(), [('1', self.approvers[1].id, None)])
+
+
+class TestApprovalDelegation(TestCase):
+    """
+    Test the date-aware resolution and expiry of delegations of approval.
+    """
+    def setUp(self):
+        self.approvers = [
+            Approver.objects.create(user=user_model.objects.create_user(username=f"approver{n}"))
+            for n in range(3)
+        ]
+        self.today = timezone.now().date()
+
+    def delegate(self, approver, delegate, start_days=0, end_days=5):
+        """Create a delegation relative to today."""
+        return ApprovalDelegation.objects.create(
+            approver=approver, delegate=delegate, reason_for_delegation="Leave",
+            start_date=self.today + timedelta(days=start_days),
+            end_date=self.today + timedelta(days=end_days))
+
+    def test_delegation_period(self):
+        """
+        Test that delegations are only followed within their period.
+        """
+        self.delegate(self.approvers[0], self.approvers[1], start_days=2)
+        self.assertIsNone(self.approvers[0].get_delegate())
+        self.assertEqual(self.approvers[0].get_delegate(self.today + timedelta(days=2)),
+                         self.approvers[1])
+        self.assertIsNone(self.approvers[0].get_delegate(self.today + timedelta(days=6)))
+        self.assertTrue(self.approvers[0].active_delegation_exists())
+
+    def test_delegation_chain(self):
+        """
+        Test that chains are followed in one query, whatever the other delegations, and loops
+        are ignored.
+        """
+        self.delegate(self.approvers[0], self.approvers[1])
+        self.delegate(self.approvers[1], self.approvers[2])
+        for number in range(5):
+            self.delegate(
+                Approver.objects.create(user=user_model.objects.create_user(
+                    username=f"unrelated{number}")), self.approvers[0])
+        with self.assertNumQueries(1):
+            self.assertEqual(ApprovalDelegation.get_delegate_ids([self.approvers[0].id]),
+                             {self.approvers[0].id: self.approvers[2].id})
+        with self.assertNumQueries(2):
+            self.assertEqual(self.approvers[0].get_delegate().user.username, "approver2")
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.approvers[2].get_delegate())
+        self.delegate(self.approvers[2], self.approvers[1])
+        self.assertIsNone(self.approvers[0].get_delegate())
+        self.assertEqual(ApprovalDelegation.get_delegate_ids(
+            [approver.id for approver in self.approvers]), {})
+
+    def test_first_delegation_followed(self):
+        """
+        Test that the delegation that started first is followed when several are in force.
+        """
+        self.delegate(self.approvers[0], self.approvers[2])
+        self.delegate(self.approvers[0], self.approvers[1], start_days=-1)
+        self.assertEqual(self.approvers[0].get_delegate(), self.approvers[1])
+
+    def test_missed_delegation_assigned(self):
+        """
+        Test that expiredelegations assigns a delegation that started on a day it didn't run.
+        """
+        user = user_model.objects.create_user(username="traveler")
+        TravelerProfile.objects.filter(user_account=user).update(approver=self.approvers[0])
+        ApproverAssignment.objects.rebuild()
+        ApprovalDelegation.objects.bulk_create([ApprovalDelegation(
+            approver=self.approvers[0], delegate=self.approvers[1],
+            reason_for_delegation="Leave", start_date=self.today - timedelta(days=2),
+            end_date=self.today + timedelta(days=5))])
+        call_command("expiredelegations", stdout=StringIO())
+        self.assertEqual(list(ApproverAssignment.objects.values_list(
+            "approver_id", "delegated_by_id")), [(self.approvers[1].id, self.approvers[0].id)])
+
+    def test_deactivate_expired(self):
+        """
+        Test that expired delegations are deactivated and current ones are left alone.
+        """
+        self.delegate(self.approvers[0], self.approvers[1], start_days=-5, end_days=-1)
+        current = self.delegate(self.approvers[1], self.approvers[2])
+        self.assertEqual(ApprovalDelegation.deactivate_expired(), {self.approvers[0].id})
+        self.assertEqual(list(ApprovalDelegation.objects.filter(active=True)), [current])
+        self.assertFalse(self.approvers[0].active_delegation_exists())
@@ -4,6 +4,7 @@ Model tests for models in the Traveler app.
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.db import connection
 from django.shortcuts import get_object_or_404
 from guardian.shortcuts import get_anonymous_user
 from traveler.models import TravelerProfile
@@ -25,6 +26,15 @@ class TestCreateTravelerProfileSignal(TestCase):
             self.fail("The user profile was not created. "\
                 "The traveler.signals.create_traveler_profile signal isn't working")
 
+    def run_on_commit_callbacks(self):
+        """
+        Run the callbacks waiting for the transaction of the test to commit, which it never
+        does in a TestCase.
+        """
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        for _, callback in callbacks:
+            callback()
+
     def test_traveler_profile_created(self):
         """
         Test that the User Model post save signal creates a traveler profile for every new user.
@@ -34,7 +44,9 @@ class TestCreateTravelerProfileSignal(TestCase):
     def test_traveler_profile_permission_granted(self):
         """
         Test that the Traveler post save signal grants the user permissions to their own profile.
+        The permission is granted once the transaction commits.
         """
+        self.run_on_commit_callbacks()
         self.assertTrue(self.user.has_perm("change_travelerprofile", self.traveler))
 
     def test_user_added_to_travelers_group(self):
@@ -0,0 +1,177 @@
+"""
+Tests for the views in the traveler app.
+"""
+from datetime import timedelta
+
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from traveler.models import Departments, TravelerProfile
+
+user_model = get_user_model()
+
+
+class TestTravelerDataTableView(TestCase):
+    """
+    Test the endpoint serving the travelers table to DataTables.
+    """
+    def setUp(self):
+        self.user = user_model.objects.create_superuser(
+            username="admin", password="admin", email="admin@example.org")
+        self.client.force_login(self.user)
+        department = Departments.objects.create(department="ICT", description="ICT")
+        for number in range(12):
+            user = user_model.objects.create_user(
+                username=f"traveler_{number}", first_name=f"Traveler{number:02}")
+            TravelerProfile.objects.filter(user_account=user).update(department=department)
+        self.url = reverse("u_list_travelers_data")
+
+    def test_returns_requested_page(self):
+        """
+        Test that only the requested page is returned along with the DataTables counters.
+        """
+        response = self.client.get(self.url, {
+            "draw": 3, "start": 5, "length": 5, "order[0][column]": 0, "order[0][dir]": "asc",
+        })
+        data = response.json()
+        self.assertEqual(data["draw"], 3)
+        self.assertEqual(data["recordsTotal"], 13)
+        self.assertEqual(len(data["data"]), 5)
+        self.assertIn("Traveler04", data["data"][0][0])
+
+    def test_search(self):
+        """
+        Test that the search term filters the travelers.
+        """
+        response = self.client.get(self.url, {"draw": 1, "search[value]": "Traveler1"})
+        data = response.json()
+        self.assertEqual(data["recordsFiltered"], 2)
+        self.assertEqual(len(data["data"]), 2)
+
+    def test_query_count_is_constant(self):
+        """
+        Test that the number of queries doesn't depend on the page length.
+        """
+        with self.assertNumQueries(4):
+            self.client.get(self.url, {"length": 2})
+        with self.assertNumQueries(4):
+            self.client.get(self.url, {"length": 10})
+
+    def test_invalid_parameters(self):
+        """
+        Test that malformed parameters are rejected.
+        """
+        response = self.client.get(self.url, {"start": "first"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_view_renders_first_page(self):
+        """
+        Test that the travelers list renders only the first page of travelers.
+        """
+        response = self.client.get(reverse("u_list_travelers"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["travelers_count"], 13)
+        self.assertContains(response, "deferLoading: 13")
+
+    def test_other_lists_render(self):
+        """
+        Test that the paginated department, approver and country lists render.
+        """
+        for url_name in ("u_list_departments", "list_approvers", "list_countries"):
+            response = self.client.get(reverse(url_name))
+            self.assertEqual(response.status_code, 200, url_name)
+
+
+class TestTravelerAPI(TestCase):
+    """
+    Test the traveler API.
+    """
+    def setUp(self):
+        self.user = user_model.objects.create_user(username="traveler", first_name="Amani")
+        self.client.force_login(self.user)
+        self.profile = TravelerProfile.objects.get(user_account=self.user)
+        self.other = user_model.objects.create_user(username="other")
+
+    def test_scope(self):
+        """
+        Test that travelers see their own profile and those of the travelers they manage.
+        """
+        response = self.client.get(reverse("travelerprofile-list"))
+        self.assertEqual([traveler["first_name"] for traveler in response.json()["results"]],
+                         ["Amani"])
+        other_profile = TravelerProfile.objects.get(user_account=self.other)
+        url = reverse("travelerprofile-detail", args=[other_profile.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        other_profile.is_managed_by = self.profile
+        other_profile.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_conditional_get(self):
+        """
+        Test that a profile answers with 304 until it is saved again.
+        """
+        url = reverse("travelerprofile-detail", args=[self.profile.id])
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.profile.contact_telephone = "+254700000000"
+        self.profile.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["contact_telephone"], "+254700000000")
+
+    def test_related_changes_change_etag(self):
+        """
+        Test that renaming the traveler, their manager or their department changes the
+        profile's validators, but logging in doesn't.
+        """
+        department = Departments.objects.create(department="ICT", description="ICT")
+        manager = TravelerProfile.objects.get(user_account=self.other)
+        TravelerProfile.objects.filter(id=self.profile.id).update(
+            department=department, is_managed_by=manager)
+        url = reverse("travelerprofile-detail", args=[self.profile.id])
+        changes = ((self.user, "first_name", "Baraka"), (self.other, "last_name", "Otieno"),
+                   (department, "department", "IT"))
+        for instance, field, value in changes:
+            TravelerProfile.objects.update(updated_on=timezone.now() - timedelta(days=1))
+            response = self.client.get(url)
+            update_last_login(None, self.user)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+                             .status_code, 304)
+            setattr(instance, field, value)
+            instance.save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+                             .status_code, 200)
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(response.status_code, 200)
+
+    def test_details_page_loads_profile_once(self):
+        """
+        Test that the profile page loads the profile once, with what it shows.
+        """
+        manager = user_model.objects.create_superuser(
+            username="manager", password="manager", email="manager@example.org")
+        self.client.force_login(manager)
+        url = reverse("u_traveler_details", kwargs={"traveler_id": self.profile.id})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        profile_queries = [query for query in context.captured_queries
+                           if 'FROM "traveler_travelerprofile"' in query["sql"]]
+        self.assertEqual(len(profile_queries), 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+                         .status_code, 304)
+
+    def test_department_changes_need_permission(self):
+        """
+        Test that departments can be listed but not created without the model permission.
+        """
+        self.assertEqual(self.client.get(reverse("departments-list")).status_code, 200)
+        response = self.client.post(reverse("departments-list"),
+                                    {"department": "ICT", "description": "ICT"})
+        self.assertEqual(response.status_code, 403)
@@ -8,10 +8,11 @@ from rest_framework import routers
 from .views import (
     TravelerViewSet, DepartmentViewSet, DepartmentCreateView, DepartmentListView,
     DepartmentDetailView, DepartmentUpdateView, DepartmentDeleteView, TravelerCreateView,
-    TravelerListView, TravelerDetailView, TravelerUpdateView, CountrySecurityLevelCreateView,
-    CountrySecurityLevelDeleteView, CountrySecurityLevelDetailView, CountrySecurityLevelUpdateView,
-    CountrySecurityLevelListView, ApproverCreateView, ApproverDetailView, ApproverUpdateView,
-    ApproverDeleteView, ApproverListView, DelegateApprovalCreateView, RevokeApprovalDelegationView,
+    TravelerListView, TravelerDataTableView, TravelerDetailView, TravelerUpdateView,
+    CountrySecurityLevelCreateView, CountrySecurityLevelDeleteView, CountrySecurityLevelDetailView,
+    CountrySecurityLevelUpdateView, CountrySecurityLevelListView, ApproverCreateView,
+    ApproverDetailView, ApproverUpdateView, ApproverDeleteView, ApproverListView,
+    DelegateApprovalCreateView, RevokeApprovalDelegationView,
 )
 
 
@@ -32,6 +33,7 @@ urlpatterns = [
     # Traveler views urls
     path('new-traveler', TravelerCreateView.as_view(), name='u_create_traveler'),
     path('list-travelers', TravelerListView.as_view(), name='u_list_travelers'),
+    path('list-travelers/data', TravelerDataTableView.as_view(), name='u_list_travelers_data'),
     path('traveler-profile/traveler=<traveler_id>',
         TravelerDetailView.as_view(), name='u_traveler_details'),
     path('edit-traveler/traveler=<traveler_id>',
@@ -1,13 +1,19 @@
 """
 This file provides all view functionality for the traveler app.
 """
-from django.views.generic import CreateView, ListView, DetailView, UpdateView, DeleteView
-from django.urls import reverse_lazy
-from django.http import HttpResponseRedirect
+from functools import partial
+
+from django.views.generic import CreateView, ListView, DetailView, UpdateView, DeleteView, View
+from django.urls import reverse, reverse_lazy
+from django.http import HttpResponseRedirect, HttpResponseBadRequest, JsonResponse
+from django.db.models import Q
+from django.utils.html import escape, format_html
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 # Third party apps imports
 from rest_framework import viewsets
+from rest_framework.permissions import DjangoModelPermissions
+from rest_framework.response import Response
 from guardian.mixins import LoginRequiredMixin, PermissionRequiredMixin, PermissionListMixin
 # Earo_travel_tracker imports
 from .models import (
@@ -15,23 +21,56 @@ from .models import (
 )
 from .serializers import TravelerProfileSerializer, DepartmentSerializer
 from .forms import TravelerBioForm, ApprovalDelegationForm, ApprovalDelegationRevocationForm
+from utils.conditional import conditional_response, make_etag
+from utils.pagination import KeysetPaginationMixin
 
 USER_MODEL = get_user_model()
+
+
+def get_traveler_validators(traveler, *keys):
+    """
+    Return the ETag and Last-Modified date of a representation of the traveler profile,
+    identified by keys. They change whenever the profile is saved, and whenever the names of
+    the traveler or of their manager or the department change (traveler.signals).
+    """
+    return make_etag(*keys, traveler.id, traveler.updated_on.isoformat()), traveler.updated_on
+
+
 # Rest API Views
-class TravelerViewSet(viewsets.ModelViewSet):
+class TravelerViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    This class provides the requisite functionality to manipulate traveler details.
+    This class provides the requisite functionality to read traveler details.
+    Users with the view_travelerprofile permission see all travelers, others see their own
+    profile and those of the travelers they manage. Profiles are edited through the views
+    below.
     """
     queryset = TravelerProfile.objects.all()
     serializer_class = TravelerProfileSerializer
 
+    def get_queryset(self):
+        queryset = TravelerProfile.objects.select_related('user_account')
+        user = self.request.user
+        if user.has_perm('traveler.view_travelerprofile'):
+            return queryset
+        return queryset.filter(Q(user_account=user) | Q(is_managed_by__user_account=user))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Return the traveler profile, or 304 Not Modified if the client's copy is current.
+        """
+        traveler = self.get_object()
+        return conditional_response(request, get_traveler_validators(traveler, 'traveler'),
+                                    lambda: Response(self.get_serializer(traveler).data))
+
 
 class DepartmentViewSet(viewsets.ModelViewSet):
     """
-    This class implements the view functionality for departments
+    This class implements the view functionality for departments.
+    Changing departments takes the model permissions.
     """
     queryset = Departments.objects.all()
     serializer_class = DepartmentSerializer
+    permission_classes = [DjangoModelPermissions]
 
 
 # classes below are Non-API views
@@ -43,7 +82,7 @@ class ApproverCreateView(LoginRequiredMixin,CreateView):
     """
     permission_required = 'traveler.add_approver'
     model = Approver
-    fields = ['user', 'security_level']
+    fields = ['user', 'security_level', 'notification_mode']
     template_name = 'traveler/add_edit_approver.html'
     extra_context = {
         'page_title': 'Add Approver'
@@ -63,14 +102,25 @@ class ApproverDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView
     context_object_name = "approver"
     pk_url_kwarg = "approver_id"
 
+    def get_context_data(self, **kwargs):
+        """
+        Add the travelers the approver currently approves at each security level.
+        """
+        context = super().get_context_data(**kwargs)
+        context['assignments'] = self.object.assignments.select_related(
+            'traveler__user_account', 'delegated_by__user').order_by('security_level', 'id')
+        return context
+
 
-class ApproverListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class ApproverListView(LoginRequiredMixin, PermissionRequiredMixin, KeysetPaginationMixin,
+                       ListView):
     """
     Show the details of a single country.
     """
     permission_required = "traveler.view_approver"
     return_403 = True
     model = Approver
+    queryset = Approver.objects.select_related("user")
     template_name = "traveler/list_approvers.html"
     context_object_name = "approvers"
 
@@ -82,7 +132,7 @@ class ApproverUpdateView(LoginRequiredMixin, PermissionListMixin, UpdateView):
     permission_required = "traveler.change_approver"
     return_403 = True
     model = Approver
-    fields = ['user', 'security_level', 'is_active']
+    fields = ['user', 'security_level', 'is_active', 'notification_mode']
     template_name = "traveler/add_edit_approver.html"
     pk_url_kwarg = "approver_id"
     context_object_name = "approver"
@@ -123,11 +173,12 @@ class CountrySecurityLevelDetailView(LoginRequiredMixin, DetailView):
     context_object_name = "country"
 
 
-class CountrySecurityLevelListView(LoginRequiredMixin, ListView):
+class CountrySecurityLevelListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
     Show the details of a single country.
     """
     model = CountrySecurityLevel
+    queryset = CountrySecurityLevel.objects.select_related("security_level_3_approver__user")
     template_name = "traveler/list_countries.html"
     context_object_name = "countries"
 
@@ -168,7 +219,7 @@ class DepartmentCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateVi
     }
 
 
-class DepartmentListView(LoginRequiredMixin, ListView):
+class DepartmentListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
     View all departments.
     """
@@ -235,11 +286,15 @@ class TravelerCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView
     }
 
 
-class TravelerListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class TravelerListView(LoginRequiredMixin, PermissionRequiredMixin, KeysetPaginationMixin,
+                       ListView):
     """
     View all registered travelers.
+    The first page is rendered here, subsequent pages are fetched by DataTables from
+    TravelerDataTableView.
     """
     model = TravelerProfile
+    queryset = TravelerProfile.objects.with_list_details()
     context_object_name = 'travelers'
     permission_required = 'traveler.view_travelerdetails'
     return_403 = True
@@ -248,6 +303,103 @@ class TravelerListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
         'page_title': 'All Travelers'
     }
 
+    def get_context_data(self, *args, **kwargs):
+        ctx = super().get_context_data(*args, **kwargs)
+        ctx['travelers_count'] = TravelerProfile.objects.count()
+        return ctx
+
+
+class TravelerDataTableView(LoginRequiredMixin, PermissionRequiredMixin, View):
+    """
+    Serve pages of the traveler directory to DataTables' server-side processing mode.
+    Only the rows of the page being displayed are loaded.
+    """
+    permission_required = 'traveler.view_travelerdetails'
+    return_403 = True
+    max_page_length = 100
+    # fields that the DataTables columns are sorted on, in column order
+    order_fields = [
+        'user_account__first_name',
+        'department__department',
+        'nationality',
+        'contact_telephone',
+        'user_account__email',
+    ]
+    search_fields = [
+        'user_account__first_name',
+        'user_account__last_name',
+        'user_account__email',
+        'department__department',
+        'nationality',
+    ]
+
+    def get_ordering(self):
+        """
+        Translate the DataTables sort parameters into queryset ordering. Without sort
+        parameters the travelers are ordered as in TravelerListView.
+        """
+        if 'order[0][column]' not in self.request.GET:
+            return ["id"]
+        column = int(self.request.GET['order[0][column]'])
+        if not 0 <= column < len(self.order_fields):
+            raise ValueError("Invalid sort column")
+        field = self.order_fields[column]
+        if self.request.GET.get('order[0][dir]') == 'desc':
+            return [f"-{field}", "-id"]
+        return [field, "id"]
+
+    @staticmethod
+    def get_row(traveler):
+        """
+        Render a traveler as a row of the travelers table.
+        """
+        approver = traveler.approver
+        if approver is None and traveler.department is not None:
+            approver = traveler.department.security_level_1_approver
+        return [
+            format_html('<a href="{}">{}&nbsp;{}</a>',
+                        reverse('u_traveler_details', args=[traveler.id]),
+                        traveler.user_account.first_name if traveler.user_account else '',
+                        traveler.user_account.last_name if traveler.user_account else ''),
+            escape(traveler.department or ''),
+            escape(traveler.nationality),
+            escape(traveler.contact_telephone),
+            escape(traveler.user_account.email if traveler.user_account else ''),
+            escape(traveler.is_managed_by or ''),
+            escape(approver or 'No approver set'),
+        ]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Return the requested page of travelers in the format DataTables expects.
+        """
+        try:
+            draw = int(request.GET.get('draw', 0))
+            start = max(int(request.GET.get('start', 0)), 0)
+            length = min(max(int(request.GET.get('length', 10)), 1), self.max_page_length)
+            ordering = self.get_ordering()
+        except ValueError:
+            return HttpResponseBadRequest("Invalid DataTables parameters.")
+
+        queryset = TravelerProfile.objects.all()
+        records_total = queryset.count()
+        records_filtered = records_total
+        search = request.GET.get('search[value]', '').strip()
+        if search:
+            search_filter = Q()
+            for field in self.search_fields:
+                search_filter |= Q(**{f"{field}__icontains": search})
+            queryset = queryset.filter(search_filter)
+            records_filtered = queryset.count()
+
+        travelers = queryset.with_list_details().order_by(*ordering)[start:start + length]
+        return JsonResponse({
+            'draw': draw,
+            'recordsTotal': records_total,
+            'recordsFiltered': records_filtered,
+            'data': [self.get_row(traveler) for traveler in travelers],
+        })
+
 
 class TravelerDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
     """
@@ -263,6 +415,29 @@ class TravelerDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView
         'page_title': 'Traveler Profile'
     }
 
+    def get_object(self, queryset=None):
+        """
+        Return the traveler with the user accounts and department the page shows. The
+        traveler is loaded once per request, although the permission check, the validators
+        and the rendering all ask for it.
+        """
+        if getattr(self, 'object', None) is None:
+            if queryset is None:
+                queryset = self.get_queryset().select_related(
+                    'user_account', 'department', 'is_managed_by__user_account')
+            self.object = super().get_object(queryset)
+        return self.object
+
+    def get(self, request, *args, **kwargs):
+        """
+        Answer with 304 Not Modified if the user's copy of the page is current, without
+        rendering the page.
+        """
+        traveler = self.get_object()
+        return conditional_response(
+            request, get_traveler_validators(traveler, 'traveler_details', request.user.id),
+            partial(super().get, request, *args, **kwargs))
+
 
 class TravelerUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
     """
@@ -323,10 +498,8 @@ class DelegateApprovalCreateView(LoginRequiredMixin, PermissionRequiredMixin, Cr
         """
         user = self.request.user
         try:
-            approver = user.approver
-            if approver.active_delegation_exists():
-                self.active_delegation = approver.get_active_delegation()
-        except USER_MODEL.DoesNotExist:
+            self.active_delegation = user.approver.get_active_delegation()
+        except USER_MODEL.approver.RelatedObjectDoesNotExist:
             pass
 
 
@@ -0,0 +1,53 @@
+"""
+Authentication backend answering the permissions travelers have on their own trips.
+"""
+from trip.models import Trip, TripPOET, TripItinerary
+
+
+class TripOwnerBackend:
+    """
+    Grant travelers the view and change permissions on their trips and on the POET and
+    itinerary legs of their trips.
+
+    Ownership is read from Trip.traveler.user_account instead of one guardian
+    UserObjectPermission row per object; guardian only holds permissions granted to anyone
+    else. The owner of each trip is cached on the user object, which lives for one request.
+    This backend never authenticates anyone.
+    """
+    owner_models = (Trip, TripPOET, TripItinerary)
+
+    def authenticate(self, request, **credentials):
+        return None
+
+    @staticmethod
+    def get_owner_id(user_obj, obj):
+        """
+        Return the id of the user owning the trip obj is or belongs to.
+        """
+        trip_id = obj.pk if isinstance(obj, Trip) else obj.trip_id
+        owners = user_obj.__dict__.setdefault('_trip_owner_cache', {})
+        if trip_id not in owners:
+            trip = obj if isinstance(obj, Trip) else None
+            if trip is None and type(obj).trip.is_cached(obj):
+                trip = obj.trip
+            if trip is not None and Trip.traveler.is_cached(trip):
+                owners[trip_id] = trip.traveler.user_account_id
+            else:
+                owners[trip_id] = Trip.objects.filter(pk=trip_id).values_list(
+                    'traveler__user_account_id', flat=True).first()
+        return owners[trip_id]
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if (obj is None or not isinstance(obj, self.owner_models) or obj.pk is None or
+                not user_obj.is_active or user_obj.is_anonymous):
+            return set()
+        if self.get_owner_id(user_obj, obj) != user_obj.id:
+            return set()
+        model_name = obj._meta.model_name
+        return {f'trip.view_{model_name}', f'trip.change_{model_name}'}
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if '.' not in perm:
+            # guardian style permission codename without the app label
+            perm = f'trip.{perm}'
+        return perm in self.get_all_permissions(user_obj, obj)
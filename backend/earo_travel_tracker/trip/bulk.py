@@ -0,0 +1,115 @@
+"""
+Bulk saving of the itinerary legs and POET lines of a trip.
+
+The create views save one row per form post. The functions here check all the rows of a trip
+together and save them in one transaction, with one bulk_create for the new rows and one
+bulk_update for the changed ones. bulk_create and bulk_update send no post_save signals, so the
+work of trip.signals is done once for the whole batch: the trip is stamped as modified and its
+legs are indexed in trip_index when the transaction commits.
+
+Owners' permissions on the rows are answered by trip.backends.TripOwnerBackend, so saving grants
+no object permissions.
+"""
+from django.db import transaction
+from django.utils import timezone
+# earo_travel_tracker imports
+from trip.models import Trip, TripItinerary, TripPOET
+from trip.intervals import trip_index
+
+ITINERARY_FIELDS = ['date_of_departure', 'time_of_departure', 'city_of_departure',
+                    'destination', 'mode_of_travel', 'leg_status', 'comment']
+POET_FIELDS = ['project', 'task']
+
+
+def validate_itinerary(trip, legs, others=()):
+    """
+    Check the legs being saved against the trip dates and the other legs of the itinerary,
+    which are the saved legs left unchanged.
+    Returns a dict mapping the position of each invalid leg in legs to its error messages by
+    field.
+    """
+    errors = {}
+    departures = {(leg.date_of_departure, leg.time_of_departure) for leg in others}
+    for index, leg in enumerate(legs):
+        if not trip.start_date <= leg.date_of_departure <= trip.end_date:
+            errors.setdefault(index, {})['date_of_departure'] = [
+                f"The departure date must be within the trip dates ({trip.start_date} to "
+                f"{trip.end_date})."]
+        departure = (leg.date_of_departure, leg.time_of_departure)
+        if departure in departures:
+            errors.setdefault(index, {})['time_of_departure'] = [
+                "Another leg of the trip departs at the same time."]
+        departures.add(departure)
+    return errors
+
+
+def validate_poet(trip, lines, others=()):
+    """
+    Check the POET lines being saved against the other lines of the trip, which are the saved
+    lines left unchanged.
+    Returns a dict mapping the position of each invalid line in lines to its error messages by
+    field.
+    """
+    errors = {}
+    codes = {(line.project, line.task) for line in others}
+    for index, line in enumerate(lines):
+        code = (line.project, line.task)
+        if code in codes:
+            errors[index] = {
+                'task': ["This project and task are already charged for the trip."]}
+        codes.add(code)
+    return errors
+
+
+def save_rows(trip, model, rows, fields):
+    """
+    Save the itinerary legs or POET lines of the trip: the unsaved rows with one bulk_create
+    and the fields of the saved ones with one bulk_update, in one transaction.
+    Returns all the rows of the trip's model once saved.
+    """
+    now = timezone.now()
+    new_rows = []
+    changed_rows = []
+    for row in rows:
+        row.trip = trip
+        if row.pk is None:
+            new_rows.append(row)
+        else:
+            # bulk_update doesn't apply auto_now
+            row.updated_on = now
+            changed_rows.append(row)
+    with transaction.atomic():
+        model.objects.bulk_create(new_rows)
+        model.objects.bulk_update(changed_rows, fields + ['updated_on'])
+        Trip.objects.filter(id=trip.id).update(created_on=now)
+        trip.created_on = now
+        # bulk_create doesn't set the ids on every database, so the rows are read back
+        saved = list(model.objects.filter(trip=trip).order_by('id'))
+        if model is TripItinerary:
+            transaction.on_commit(lambda: index_legs(saved, trip.traveler_id))
+    return saved
+
+
+def index_legs(legs, traveler_id):
+    """
+    Add or move the legs in the trip interval index.
+    """
+    for leg in legs:
+        trip_index.update_leg(leg, traveler_id)
+
+
+def save_itinerary(trip, legs):
+    """
+    Save the itinerary legs of the trip in bulk. The legs should be validated first with
+    validate_itinerary. Returns the trip's itinerary in the order of departure.
+    """
+    saved = save_rows(trip, TripItinerary, legs, ITINERARY_FIELDS)
+    return sorted(saved, key=lambda leg: (leg.date_of_departure, leg.time_of_departure, leg.id))
+
+
+def save_poet(trip, lines):
+    """
+    Save the POET lines of the trip in bulk. The lines should be validated first with
+    validate_poet. Returns the trip's POET lines.
+    """
+    return save_rows(trip, TripPOET, lines, POET_FIELDS)
@@ -0,0 +1,74 @@
+"""
+Filtering of the trip app's API lists by query parameters.
+"""
+from django.utils.dateparse import parse_date
+# Third party imports
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+# earo_travel_tracker imports
+from trip.models import Trip
+
+
+class TripFilterBackend(BaseFilterBackend):
+    """
+    Filter API lists on the trips their rows belong to.
+
+    Views set trip_lookup to the path from their model to Trip, "" for Trip itself. The
+    query parameters are:
+        start_date_from, start_date_to  trips starting on or after / on or before a date
+        end_date_from, end_date_to      trips ending on or after / on or before a date
+        approval_stage                  one of Trip.APPROVAL_STAGES
+        approval_complete               true or false
+        is_travel_completed             true or false
+        traveler                        the id of the traveler profile
+        trip                            the id of the trip
+    Invalid values are answered with 400 Bad Request.
+    """
+    date_params = {
+        'start_date_from': 'start_date__gte',
+        'start_date_to': 'start_date__lte',
+        'end_date_from': 'end_date__gte',
+        'end_date_to': 'end_date__lte',
+    }
+    boolean_params = ('approval_complete', 'is_travel_completed')
+    id_params = {'traveler': 'traveler', 'trip': 'id'}
+    boolean_values = {'true': True, '1': True, 'false': False, '0': False}
+
+    def get_filters(self, query_params):
+        """
+        Return the lookups on Trip selected by the query parameters.
+        """
+        filters = {}
+        for param, lookup in self.date_params.items():
+            if param in query_params:
+                try:
+                    date = parse_date(query_params[param])
+                except ValueError:
+                    date = None
+                if date is None:
+                    raise ValidationError({param: 'Enter a date as YYYY-MM-DD.'})
+                filters[lookup] = date
+        if 'approval_stage' in query_params:
+            stage = query_params['approval_stage']
+            if stage not in dict(Trip.APPROVAL_STAGES):
+                raise ValidationError({'approval_stage': f'"{stage}" is not a valid stage.'})
+            filters['approval_stage'] = stage
+        for param in self.boolean_params:
+            if param in query_params:
+                value = query_params[param].lower()
+                if value not in self.boolean_values:
+                    raise ValidationError({param: 'Enter true or false.'})
+                filters[param] = self.boolean_values[value]
+        for param, lookup in self.id_params.items():
+            if param in query_params:
+                if not query_params[param].isdigit():
+                    raise ValidationError({param: 'Enter the id of the instance.'})
+                filters[lookup] = int(query_params[param])
+        return filters
+
+    def filter_queryset(self, request, queryset, view):
+        trip_lookup = getattr(view, 'trip_lookup', '')
+        filters = self.get_filters(request.query_params)
+        return queryset.filter(**{
+            f'{trip_lookup}{lookup}': value for lookup, value in filters.items()
+        })
@@ -6,7 +6,8 @@ from django.utils import timezone
 # third-party library imports
 from tempus_dominus.widgets import DatePicker, TimePicker
 # earo_travel_tracker imports
-from .models import Trip, TripApproval, TripItinerary
+from .models import Trip, TripApproval, TripItinerary, TripPOET
+from .bulk import validate_itinerary, validate_poet, save_itinerary, save_poet
 
 
 class TripForm(forms.ModelForm):
@@ -47,21 +48,48 @@ class TripForm(forms.ModelForm):
                             ),
         }
 
+    def __init__(self, *args, traveler=None, **kwargs):
+        """
+        traveler is the TravelerProfile the trip is for. It defaults to the traveler of the
+        instance being edited.
+        """
+        super().__init__(*args, **kwargs)
+        self.traveler = traveler
+        if self.traveler is None and self.instance.traveler_id is not None:
+            self.traveler = self.instance.traveler
+
     def clean(self):
         """
-        Check that the supplied trip dates are logical.
+        Check that the supplied trip dates are logical and don't overlap another trip of
+        the traveler.
         """
         cleaned_data = super().clean()
         start_date = cleaned_data.get("start_date")
         end_date = cleaned_data.get("end_date")
-        if start_date < timezone.now().date():
+        if start_date and start_date < timezone.now().date():
             msg = "The trip cannot begin in the past."
             self.add_error('start_date', msg)
         if start_date and end_date and start_date > end_date:
             msg ="The trip end date cannot be earlier than the trip start date."
             self.add_error('end_date', msg)
+        elif start_date and end_date and self.traveler is not None:
+            self.clean_overlapping_trips(start_date, end_date)
         return cleaned_data
 
+    def clean_overlapping_trips(self, start_date, end_date):
+        """
+        Reject trip dates that overlap another trip of the traveler. The database decides
+        rather than trip_index, whose copy of the trips in this process may be stale.
+        """
+        trips = Trip.objects.filter(
+            traveler=self.traveler, start_date__lte=end_date, end_date__gte=start_date,
+        ).exclude(id=self.instance.id).only('trip_name', 'start_date', 'end_date')
+        trips = list(trips.order_by('start_date'))
+        if trips:
+            msg = "These dates overlap your other trip(s): " + ", ".join(
+                f"{trip.trip_name} ({trip.start_date} to {trip.end_date})" for trip in trips)
+            self.add_error(None, msg)
+
 
 class ApprovalRequestForm(forms.Form):
     """
@@ -122,3 +150,66 @@ class TripItineraryForm(forms.ModelForm):
                                         }
                                 )
         }
+
+
+class BaseTripBulkFormSet(forms.BaseInlineFormSet):
+    """
+    Inline formset editing all the itinerary legs or POET lines of a trip at once. The rows are
+    checked together by validate_rows and the changed ones are saved in bulk by save_rows,
+    which are functions of trip.bulk.
+    """
+    validate_rows = None
+    save_rows = None
+
+    def get_changed_forms(self):
+        """Return the forms of the rows added or changed."""
+        return [form for form in self.forms if form.has_changed()]
+
+    def clean(self):
+        """
+        Check the rows added or changed against the trip and the rows left unchanged.
+        """
+        super().clean()
+        if any(self.errors):
+            return
+        changed_forms = self.get_changed_forms()
+        others = [form.instance for form in self.forms
+                  if not form.has_changed() and form.instance.pk is not None]
+        errors = self.validate_rows(
+            self.instance, [form.instance for form in changed_forms], others)
+        for index, field_errors in errors.items():
+            for field, messages in field_errors.items():
+                for message in messages:
+                    changed_forms[index].add_error(field, message)
+
+    def save(self, commit=True):
+        """
+        Save the rows added or changed in one transaction and return all the rows of the trip.
+        """
+        return self.save_rows(
+            self.instance, [form.instance for form in self.get_changed_forms()])
+
+
+class BaseTripItineraryFormSet(BaseTripBulkFormSet):
+    """
+    Formset of the itinerary legs of a trip, checked against the trip dates.
+    """
+    validate_rows = staticmethod(validate_itinerary)
+    save_rows = staticmethod(save_itinerary)
+
+
+class BaseTripPOETFormSet(BaseTripBulkFormSet):
+    """
+    Formset of the POET lines of a trip.
+    """
+    validate_rows = staticmethod(validate_poet)
+    save_rows = staticmethod(save_poet)
+
+
+TripItineraryFormSet = forms.inlineformset_factory(
+    Trip, TripItinerary, form=TripItineraryForm, formset=BaseTripItineraryFormSet, extra=3,
+    can_delete=False)
+
+TripPOETFormSet = forms.inlineformset_factory(
+    Trip, TripPOET, fields=['project', 'task'], formset=BaseTripPOETFormSet, extra=2,
+    can_delete=False)
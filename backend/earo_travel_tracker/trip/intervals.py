@@ -0,0 +1,272 @@
+"""
+In-process interval index over trips and itinerary legs.
+
+The index answers "which travelers are in the field on date X / during a date range" and
+"does this trip overlap another trip of the same traveler" without scanning the Trip table;
+the in-the-field action of the trip API is served from it. It is loaded from the database on first use and kept up to date by the post_save and
+post_delete signals in trip.signals. Since every process keeps its own copy, the index is
+reloaded once it is older than settings.TRIP_INTERVAL_INDEX_TTL seconds so that writes made
+by other processes are eventually picked up. Its answers may therefore be that old, so
+checks that must be exact, such as the overlap check of TripForm, query the database instead.
+"""
+import random
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+TripInterval = namedtuple("TripInterval", ["trip_id", "traveler_id", "start_date", "end_date"])
+LegInterval = namedtuple("LegInterval", ["leg_id", "trip_id", "traveler_id", "date_of_departure"])
+
+
+class _Node:
+    """
+    A node of IntervalTree. max_end is the largest end in the subtree rooted at the node.
+    """
+    __slots__ = ("start", "end", "key", "value", "priority", "left", "right", "max_end")
+
+    def __init__(self, start, end, key, value):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.value = value
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = end
+
+    def update(self):
+        """Recompute max_end from the children."""
+        self.max_end = self.end
+        for child in (self.left, self.right):
+            if child is not None and child.max_end > self.max_end:
+                self.max_end = child.max_end
+
+
+class IntervalTree:
+    """
+    An interval tree implemented as a treap ordered on (start, key) and augmented with the
+    maximum end of each subtree.
+    Inserts and removals take O(log n) and overlap queries O(log n + k) expected time.
+    Intervals are closed and identified by a unique key.
+    """
+    def __init__(self):
+        self.root = None
+        self.intervals = {}
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def __contains__(self, key):
+        return key in self.intervals
+
+    @staticmethod
+    def _rotate_right(node):
+        left = node.left
+        node.left = left.right
+        node.update()
+        left.right = node
+        left.update()
+        return left
+
+    @staticmethod
+    def _rotate_left(node):
+        right = node.right
+        node.right = right.left
+        node.update()
+        right.left = node
+        right.update()
+        return right
+
+    def _insert(self, node, new):
+        if node is None:
+            return new
+        if (new.start, new.key) < (node.start, node.key):
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                return self._rotate_right(node)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                return self._rotate_left(node)
+        node.update()
+        return node
+
+    def _remove(self, node, start, key):
+        if node is None:
+            return None
+        if (start, key) < (node.start, node.key):
+            node.left = self._remove(node.left, start, key)
+        elif (start, key) > (node.start, node.key):
+            node.right = self._remove(node.right, start, key)
+        else:
+            if node.left is None:
+                return node.right
+            if node.right is None:
+                return node.left
+            if node.left.priority > node.right.priority:
+                node = self._rotate_right(node)
+                node.right = self._remove(node.right, start, key)
+            else:
+                node = self._rotate_left(node)
+                node.left = self._remove(node.left, start, key)
+        node.update()
+        return node
+
+    def add(self, key, start, end, value):
+        """
+        Add an interval, replacing any interval already stored under the key.
+        """
+        self.remove(key)
+        self.intervals[key] = start
+        self.root = self._insert(self.root, _Node(start, end, key, value))
+
+    def remove(self, key):
+        """
+        Remove the interval stored under the key, if any.
+        """
+        if key in self.intervals:
+            self.root = self._remove(self.root, self.intervals.pop(key), key)
+
+    def overlapping(self, start, end):
+        """
+        Return the values of all intervals that overlap [start, end].
+        """
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end < start:
+                continue
+            stack.append(node.left)
+            if node.start <= end:
+                if node.end >= start:
+                    found.append(node.value)
+                stack.append(node.right)
+        return found
+
+
+class TripIntervalIndex:
+    """
+    Interval trees over the date ranges of trips and the departure dates of itinerary legs.
+    """
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.trips = None
+        self.legs = None
+        self.loaded_at = None
+
+    def get_ttl(self):
+        """Return the number of seconds after which the index is reloaded."""
+        if self.ttl is not None:
+            return self.ttl
+        return getattr(settings, "TRIP_INTERVAL_INDEX_TTL", 300)
+
+    def is_loaded(self):
+        """Check whether the index holds data that is still fresh."""
+        return (self.loaded_at is not None and
+                time.monotonic() - self.loaded_at < self.get_ttl())
+
+    def load(self):
+        """
+        Build the index from the database. This runs two queries.
+        """
+        # imported here since this module is imported by trip.signals while the models load
+        from trip.models import Trip, TripItinerary
+        trips = IntervalTree()
+        legs = IntervalTree()
+        for trip in Trip.objects.values_list("id", "traveler_id", "start_date", "end_date"):
+            trips.add(trip[0], trip[2], trip[3], TripInterval(*trip))
+        for leg in TripItinerary.objects.values_list(
+                "id", "trip_id", "trip__traveler_id", "date_of_departure"):
+            legs.add(leg[0], leg[3], leg[3], LegInterval(*leg))
+        with self.lock:
+            self.trips = trips
+            self.legs = legs
+            self.loaded_at = time.monotonic()
+
+    def clear(self):
+        """Drop the index so that it is reloaded on next use."""
+        with self.lock:
+            self.trips = None
+            self.legs = None
+            self.loaded_at = None
+
+    def ensure_loaded(self):
+        """Load the index if it is not loaded or has expired."""
+        with self.lock:
+            if not self.is_loaded():
+                self.load()
+
+    def update_trip(self, trip):
+        """Add or move a trip in the index."""
+        with self.lock:
+            if self.trips is not None:
+                self.trips.add(trip.id, trip.start_date, trip.end_date, TripInterval(
+                    trip.id, trip.traveler_id, trip.start_date, trip.end_date))
+
+    def remove_trip(self, trip_id):
+        """Remove a trip from the index."""
+        with self.lock:
+            if self.trips is not None:
+                self.trips.remove(trip_id)
+
+    def update_leg(self, leg, traveler_id):
+        """Add or move an itinerary leg in the index."""
+        with self.lock:
+            if self.legs is not None:
+                self.legs.add(leg.id, leg.date_of_departure, leg.date_of_departure, LegInterval(
+                    leg.id, leg.trip_id, traveler_id, leg.date_of_departure))
+
+    def remove_leg(self, leg_id):
+        """Remove an itinerary leg from the index."""
+        with self.lock:
+            if self.legs is not None:
+                self.legs.remove(leg_id)
+
+    def trips_between(self, start_date, end_date):
+        """
+        Return the TripIntervals of the trips that overlap the date range.
+        """
+        with self.lock:
+            self.ensure_loaded()
+            return self.trips.overlapping(start_date, end_date)
+
+    def trips_on(self, date):
+        """
+        Return the TripIntervals of the trips in progress on a date.
+        """
+        return self.trips_between(date, date)
+
+    def travelers_between(self, start_date, end_date):
+        """
+        Return the ids of the travelers on a trip at any time in the date range.
+        """
+        return {trip.traveler_id for trip in self.trips_between(start_date, end_date)}
+
+    def travelers_on(self, date):
+        """
+        Return the ids of the travelers on a trip on a date.
+        """
+        return self.travelers_between(date, date)
+
+    def legs_between(self, start_date, end_date):
+        """
+        Return the LegIntervals of the itinerary legs departing within the date range.
+        """
+        with self.lock:
+            self.ensure_loaded()
+            return self.legs.overlapping(start_date, end_date)
+
+    def overlapping_trips(self, traveler_id, start_date, end_date, exclude_trip_id=None):
+        """
+        Return the TripIntervals of the traveler's trips that overlap the date range,
+        leaving out the trip with id exclude_trip_id.
+        """
+        return [trip for trip in self.trips_between(start_date, end_date)
+                if trip.traveler_id == traveler_id and trip.trip_id != exclude_trip_id]
+
+
+trip_index = TripIntervalIndex()
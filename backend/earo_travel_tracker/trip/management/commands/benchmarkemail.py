@@ -0,0 +1,91 @@
+"""
+This script defines a command to benchmark sending email with and without the pooled SMTP
+backend.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.management.base import BaseCommand
+# earo-travel-tracker imports
+from utils.emailing import send_mass_html_mail, smtp_pool, PooledEmailBackend
+from utils.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    """
+    Definition of the benchmarkemail command.
+
+    Every send_mass_html_mail call gets a new backend instance, the way the views get one from
+    get_connection(). With django's SMTP backend each call therefore opens and closes its own
+    connection while PooledEmailBackend reuses pooled ones. Unless --host is given the emails
+    are sent to a local SMTP sink; --handshake-delay makes the sink wait before greeting to
+    stand in for the STARTTLS and AUTH round trips of the real relay.
+    """
+    help = 'Compare the email throughput of the SMTP backend and the pooled SMTP backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500,
+                            help='Number of emails sent with each backend.')
+        parser.add_argument('--per-call', type=int, default=2,
+                            help='Number of emails passed to each send_mass_html_mail call.')
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Number of threads sending concurrently.')
+        parser.add_argument('--handshake-delay', type=float, default=0.02,
+                            help='Seconds the local sink waits before greeting a new connection.')
+        parser.add_argument('--host', help='Send to this SMTP server instead of a local sink.')
+        parser.add_argument('--port', type=int, default=25,
+                            help='Port of the SMTP server given with --host.')
+
+    def send(self, backend_class, host, port, calls, per_call):
+        """
+        Send calls batches of per_call emails and return the number of emails sent.
+        """
+        datatuple = [(
+            "Benchmark", "Plain text body", "<p>HTML body</p>",
+            "tracker@example.com", ["approver@example.com"],
+        )] * per_call
+        sent = 0
+        for _ in range(calls):
+            connection = backend_class(host=host, port=port, username='', password='',
+                                       use_tls=False, use_ssl=False)
+            sent += send_mass_html_mail(datatuple, connection=connection)
+        return sent
+
+    def run(self, backend_class, host, port, options):
+        """
+        Send the emails from several threads and return (emails sent, seconds taken).
+        """
+        threads = options['threads']
+        calls = max(options['messages'] // options['per_call'], threads)
+        smtp_pool.clear()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = [
+                executor.submit(self.send, backend_class, host, port,
+                                calls // threads, options['per_call'])
+                for _ in range(threads)
+            ]
+            sent = sum(result.result() for result in results)
+        elapsed = time.perf_counter() - started
+        smtp_pool.clear()
+        return sent, elapsed
+
+    def report(self, name, sent, elapsed, connections=None):
+        line = f'{name:<22} {sent:>6} emails in {elapsed:7.3f}s  {sent / elapsed:9.1f} emails/s'
+        if connections is not None:
+            line += f'  {connections} connection(s)'
+        self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        backends = (('smtp.EmailBackend', EmailBackend), ('PooledEmailBackend', PooledEmailBackend))
+        if options['host']:
+            for name, backend_class in backends:
+                self.report(name, *self.run(backend_class, options['host'], options['port'],
+                                            options))
+            return
+
+        for name, backend_class in backends:
+            with SMTPSink(handshake_delay=options['handshake_delay']) as sink:
+                sent, elapsed = self.run(backend_class, sink.host, sink.port, options)
+                self.report(name, sent, elapsed, sink.connections)
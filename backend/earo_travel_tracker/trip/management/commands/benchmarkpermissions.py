@@ -0,0 +1,102 @@
+"""
+This script defines a command to benchmark trip permission checks answered by guardian rows
+against those answered by the trip owner backend.
+"""
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from guardian.backends import ObjectPermissionBackend
+from guardian.models import UserObjectPermission
+# earo-travel-tracker imports
+from traveler.models import TravelerProfile
+from trip.backends import TripOwnerBackend
+from trip.models import Trip
+from utils.permissions import get_permission
+
+
+class Command(BaseCommand):
+    """
+    Definition of the benchmarkpermissions command.
+
+    The command creates travelers with trips, the guardian rows granting the owners view and
+    change on them as before, and --padding unrelated rows to stand in for the rest of the
+    permission table. It then times checking the owner's view_trip permission on every trip,
+    first through guardian's backend and then through TripOwnerBackend. A new user instance
+    is used per trip, as each request gets one. Everything is rolled back at the end.
+    """
+    help = 'Compare the latency of trip permission checks through guardian and the owner backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=200,
+                            help='Number of trips checked.')
+        parser.add_argument('--padding', type=int, default=50000,
+                            help='Number of unrelated guardian rows in the permission table.')
+
+    def create_data(self, trip_count, padding):
+        """
+        Create the trips and guardian rows. Returns the trips.
+        """
+        user_model = get_user_model()
+        users = [user_model.objects.create_user(username=f'benchmark_permissions_{index}')
+                 for index in range(10)]
+        travelers = list(TravelerProfile.objects.filter(user_account__in=users))
+        start_date = timezone.now().date()
+        trips = [
+            Trip.objects.create(
+                trip_name=f'Benchmark trip {index}',
+                traveler=travelers[index % len(travelers)],
+                type_of_travel='Domestic',
+                category_of_travel='Business',
+                reason_for_travel='Benchmark',
+                start_date=start_date + timedelta(days=index),
+                end_date=start_date + timedelta(days=index),
+                is_mission_critical=False,
+            )
+            for index in range(trip_count)
+        ]
+        content_type = ContentType.objects.get_for_model(Trip)
+        permissions = [get_permission(Trip, 'view_trip'), get_permission(Trip, 'change_trip')]
+        rows = [
+            UserObjectPermission(permission=permission, content_type=content_type,
+                                 user_id=trip.traveler.user_account_id, object_pk=str(trip.pk))
+            for trip in trips
+            for permission in permissions
+        ]
+        # rows for objects that don't exist, standing in for everyone else's trips
+        rows += [
+            UserObjectPermission(permission=permissions[index % 2], content_type=content_type,
+                                 user=users[index % len(users)], object_pk=str(-1 - index))
+            for index in range(padding)
+        ]
+        UserObjectPermission.objects.bulk_create(rows)
+        return trips
+
+    def time_checks(self, backend, trips):
+        """
+        Check the owner's view_trip permission on each trip. Returns the seconds per check.
+        """
+        user_model = get_user_model()
+        owners = {user.id: user for user in user_model.objects.filter(
+            id__in={trip.traveler.user_account_id for trip in trips})}
+        started = time.perf_counter()
+        for trip in trips:
+            # a copy of the owner without any cached permissions, as a new request has
+            owner = user_model(**{field.attname: getattr(owners[trip.traveler.user_account_id],
+                                                         field.attname)
+                                  for field in user_model._meta.concrete_fields})
+            if not backend.has_perm(owner, 'trip.view_trip', Trip.objects.get(pk=trip.pk)):
+                raise AssertionError(f'{type(backend).__name__} denied the owner of {trip}')
+        return (time.perf_counter() - started) / len(trips)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            trips = self.create_data(options['trips'], options['padding'])
+            for backend in (ObjectPermissionBackend(), TripOwnerBackend()):
+                latency = self.time_checks(backend, trips)
+                self.stdout.write(f'{type(backend).__name__:<24} {latency * 1000:8.3f} ms/check')
+            transaction.set_rollback(True)
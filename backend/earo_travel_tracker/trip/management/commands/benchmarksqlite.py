@@ -0,0 +1,214 @@
+"""
+This script defines a command to benchmark concurrent trip writes on the SQLite profiles.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.test import override_settings
+from django.utils import timezone
+# earo-travel-tracker imports
+from traveler.models import Approver, TravelerProfile
+from trip.intervals import trip_index
+from trip.models import OutboxEmail, Trip, TripApproval, TripItinerary, TripPOET
+from utils.database import get_databases
+
+
+def run_in_thread(function, *args):
+    """
+    Call the function in a new thread, with its own database connection, and return the
+    result.
+    """
+    results = []
+
+    def target():
+        try:
+            results.append(function(*args))
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    return results[0] if results else None
+
+
+class Command(BaseCommand):
+    """
+    Definition of the benchmarksqlite command.
+
+    A database file is migrated and copied once per profile. For each profile, --threads
+    writer threads each create --trips trips with an itinerary leg and a POET row, request
+    their approval and approve them, in the same transactions the views use. Meanwhile
+    --readers reader threads list the trips awaiting approval. The command reports the
+    writes and reads per second, and how many transactions failed because the database was
+    locked. Emails are discarded and the configured database isn't touched.
+    """
+    help = 'Compare concurrent trip write throughput of the sqlite and sqlite-wal profiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Number of writer threads.')
+        parser.add_argument('--readers', type=int, default=2, help='Number of reader threads.')
+        parser.add_argument('--trips', type=int, default=50,
+                            help='Number of trips each writer creates and approves.')
+        parser.add_argument('--busy-timeout', type=int, default=5000,
+                            help='Milliseconds a connection of the sqlite-wal profile waits '
+                                 'for a lock. The sqlite profile waits 5 seconds.')
+
+    def handle(self, *args, **options):
+        default_database = connections.databases['default']
+        directory = tempfile.mkdtemp()
+        try:
+            with override_settings(
+                    EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend'):
+                template = os.path.join(directory, 'template.sqlite3')
+                self.use_database('sqlite', template, options['busy_timeout'])
+                run_in_thread(self.create_template)
+                self.stdout.write(f"{'profile':<12} {'trips/s':>9} {'reads/s':>9} "
+                                  f"{'locked':>7} {'seconds':>8}")
+                for profile in ('sqlite', 'sqlite-wal'):
+                    path = os.path.join(directory, f'{profile}.sqlite3')
+                    shutil.copyfile(template, path)
+                    self.use_database(profile, path, options['busy_timeout'])
+                    trip_index.clear()
+                    result = self.run_workload(options['threads'], options['readers'],
+                                               options['trips'])
+                    self.stdout.write(
+                        f"{profile:<12} {result['trips'] / result['seconds']:>9.1f} "
+                        f"{result['reads'] / result['seconds']:>9.1f} {result['locked']:>7} "
+                        f"{result['seconds']:>8.2f}")
+        finally:
+            connections.databases['default'] = default_database
+            trip_index.clear()
+            shutil.rmtree(directory)
+
+    @staticmethod
+    def use_database(profile, path, busy_timeout):
+        """
+        Point the default database of new threads at the file, configured as the profile.
+        """
+        connections.databases['default'] = get_databases(settings.BASE_DIR, environ={
+            'DATABASE_ENGINE': profile,
+            'DATABASE_NAME': path,
+            'DATABASE_BUSY_TIMEOUT': str(busy_timeout),
+        })['default']
+        connections.ensure_defaults('default')
+        connections.prepare_test_settings('default')
+
+    def create_template(self):
+        """
+        Migrate the database and create the approver and the travelers of the writers.
+        """
+        call_command('migrate', verbosity=0, interactive=False)
+        # the signals creating the profiles log errors if the groups are missing
+        Group.objects.get_or_create(name='travelers')
+        Group.objects.get_or_create(name='approvers')
+        user_model = get_user_model()
+        approver = user_model.objects.create_user(username='benchmark_approver')
+        Approver.objects.create(user=approver, security_level='1')
+        for index in range(32):
+            user_model.objects.create_user(username=f'benchmark_traveler_{index}',
+                                           email=f'traveler{index}@example.com')
+
+    def run_workload(self, threads, readers, trips):
+        """
+        Run the writer and reader threads against the current database. Returns the number
+        of trips approved and reads made, the number of failed transactions and the elapsed
+        seconds.
+        """
+        result = {'trips': 0, 'reads': 0, 'locked': 0}
+        lock = threading.Lock()
+        writing = threading.Event()
+
+        def count(key, value=1):
+            with lock:
+                result[key] += value
+
+        def write(index):
+            try:
+                approved, locked = self.write_trips(index, trips)
+                count('trips', approved)
+                count('locked', locked)
+            finally:
+                connection.close()
+
+        def read():
+            try:
+                while writing.is_set():
+                    try:
+                        len(TripApproval.objects.filter(
+                            is_valid=True, acted_upon=False).select_related('trip')[:50])
+                        count('reads')
+                    except OperationalError:
+                        count('locked')
+            finally:
+                connection.close()
+
+        writing.set()
+        reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+        writer_threads = [threading.Thread(target=write, args=(index,))
+                          for index in range(threads)]
+        started = time.perf_counter()
+        for thread in reader_threads + writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        result['seconds'] = time.perf_counter() - started
+        writing.clear()
+        for thread in reader_threads:
+            thread.join()
+        return result
+
+    @staticmethod
+    def write_trips(index, trips):
+        """
+        Create, request approval of and approve trips as traveler index. Returns the number of
+        trips approved and the number of transactions that failed because the database was
+        locked.
+        """
+        traveler = TravelerProfile.objects.select_related('user_account').get(
+            user_account__username=f'benchmark_traveler_{index % 32}')
+        approver = Approver.objects.get(user__username='benchmark_approver')
+        start_date = timezone.now().date() + timedelta(days=30)
+        approved = 0
+        locked = 0
+        for number in range(trips):
+            try:
+                with transaction.atomic():
+                    trip = Trip.objects.create(
+                        trip_name=f'Benchmark trip {index}.{number}', traveler=traveler,
+                        type_of_travel='Domestic', category_of_travel='Business',
+                        reason_for_travel='Benchmark', start_date=start_date,
+                        end_date=start_date + timedelta(days=3), is_mission_critical=False)
+                    TripItinerary.objects.create(
+                        trip=trip, date_of_departure=start_date, time_of_departure='08:00',
+                        city_of_departure='Nairobi', destination='Kisumu', mode_of_travel='Air')
+                    TripPOET.objects.create(trip=trip, project='123456', task='001')
+                with transaction.atomic():
+                    approval = trip.request_approval(1, approver)
+                    OutboxEmail.objects.queue([(
+                        'Trip Approval Requested', 'text', '<p>html</p>', None,
+                        [traveler.user_account.email])])
+                with transaction.atomic():
+                    approval.acted_upon = True
+                    approval.trip_is_approved = True
+                    approval.approval_date = timezone.now().date()
+                    approval.save()
+                    trip.approval_complete = True
+                    trip.save()
+                    OutboxEmail.objects.queue([(
+                        'Trip Approved', 'text', '<p>html</p>', None,
+                        [traveler.user_account.email])])
+                approved += 1
+            except OperationalError:
+                locked += 1
+        return approved, locked
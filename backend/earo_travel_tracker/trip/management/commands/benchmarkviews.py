@@ -0,0 +1,205 @@
+"""
+This script defines a command to benchmark the latency and query counts of the main views and
+API endpoints.
+"""
+import json
+import subprocess
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+# earo-travel-tracker imports
+from traveler.models import TravelerProfile
+from trip.models import Trip, TripApproval
+from utils.instrumentation import QueryRecorder, RequestStats
+
+# label, user the request is made as, url name, url kwargs from the fixtures
+ENDPOINTS = (
+    ('my_trips', 'traveler', 'u_list_my_trips', None),
+    ('trip_details', 'traveler', 'u_trip_details', lambda fixtures: {'trip_id': fixtures['trip']}),
+    ('trip_itinerary', 'traveler', 'u_bulk_trip_itinerary',
+     lambda fixtures: {'trip_id': fixtures['trip']}),
+    ('awaiting_approval', 'approver', 'u_list_awaiting_approval_trips', None),
+    ('upcoming_trips', 'approver', 'u_list_upcoming_trips', None),
+    ('ongoing_trips', 'approver', 'u_list_ongoing_trips', None),
+    ('approve_trip', 'approver', 'u_approve_trip',
+     lambda fixtures: {'approval_id': fixtures['approval']}),
+    ('travelers', 'admin', 'u_list_travelers', None),
+    ('travelers_data', 'admin', 'u_list_travelers_data', None),
+    ('departments', 'admin', 'u_list_departments', None),
+    ('approvers', 'admin', 'list_approvers', None),
+    ('countries', 'admin', 'list_countries', None),
+    ('api_trips', 'traveler', 'trip-list', None),
+    ('api_trip_full', 'traveler', 'trip-full', lambda fixtures: {'pk': fixtures['trip']}),
+    ('api_trip_itinerary', 'traveler', 'tripitinerary-list', None),
+    ('api_trip_approvals', 'approver', 'tripapproval-list', None),
+    ('api_in_the_field', 'approver', 'trip-in-the-field', None),
+    ('api_travelers', 'admin', 'travelerprofile-list', None),
+    ('api_departments', 'admin', 'departments-list', None),
+)
+
+
+class Command(BaseCommand):
+    """
+    Definition of the benchmarkviews command.
+
+    Each endpoint is requested with the test client as the user it is meant for: the
+    traveler with the most trips, the approver with the most pending approval requests or a
+    superuser. The data should come from the generatesampledata command. After --warmup
+    requests, --requests requests are timed and their queries counted. The p50 and p95 of the
+    latency and the query counts per endpoint are printed and written as JSON to --output. With
+    --compare, the changes from an earlier output are printed too. Endpoints whose url isn't
+    configured, such as the API while it is disabled, are skipped. An error raised by an
+    endpoint stops the benchmark, and the command fails after reporting the results when an
+    endpoint didn't respond with 200.
+    """
+    help = 'Report p50/p95 latency and query counts of the main views and API endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20,
+                            help='Number of timed requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Number of untimed requests per endpoint made first.')
+        parser.add_argument('--output', help='Path of the JSON file to write the results to.')
+        parser.add_argument('--compare', help='Path of an earlier JSON output to compare with.')
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help='Label of an endpoint to benchmark. Can be repeated.')
+
+    def get_fixtures(self):
+        """
+        Find the users the endpoints are requested as and the objects they request.
+        """
+        user_model = get_user_model()
+        traveler = TravelerProfile.objects.filter(user_account__isnull=False).annotate(
+            trip_count=Count('trip')).order_by('-trip_count', 'id').select_related(
+            'user_account').first()
+        pending = TripApproval.objects.filter(is_valid=True, acted_upon=False).values(
+            'approver').annotate(pending=Count('id')).order_by('-pending', 'approver').first()
+        if traveler is None or pending is None:
+            raise CommandError('There are no trips awaiting approval to benchmark. '
+                               'Generate some with the generatesampledata command.')
+        approval = TripApproval.objects.filter(
+            is_valid=True, acted_upon=False, approver=pending['approver']).select_related(
+            'approver__user').order_by('id').first()
+        admin = user_model.objects.filter(is_superuser=True, is_active=True).order_by('id').first()
+        if admin is None:
+            raise CommandError('A superuser is needed to benchmark the administration views.')
+        trip = Trip.objects.filter(traveler=traveler).order_by('-start_date', 'id').first()
+        return {
+            'traveler': traveler.user_account,
+            'approver': approval.approver.user,
+            'admin': admin,
+            'trip': trip.id,
+            'approval': approval.id,
+        }
+
+    @staticmethod
+    def get_commit():
+        """Return the git commit of the code being benchmarked, if known."""
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def benchmark(self, client, url, requests, warmup):
+        """
+        Request the url and return the status code and the summaries of the measurements.
+        """
+        for _ in range(warmup):
+            client.get(url)
+        latencies = []
+        query_counts = []
+        sql_times = []
+        for _ in range(requests):
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                started = time.perf_counter()
+                response = client.get(url)
+                latencies.append((time.perf_counter() - started) * 1000)
+            query_counts.append(recorder.count)
+            sql_times.append(recorder.time * 1000)
+        return {
+            'url': url,
+            'status': response.status_code,
+            'latency_ms': RequestStats.summarize(latencies),
+            'sql_time_ms': RequestStats.summarize(sql_times),
+            'queries': RequestStats.summarize(query_counts),
+        }
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1.')
+        endpoints = [endpoint for endpoint in ENDPOINTS
+                     if not options['endpoints'] or endpoint[0] in options['endpoints']]
+        fixtures = self.get_fixtures()
+        clients = {}
+        results = {}
+        # the test client's requests are made to testserver, and no request is measured by
+        # the request statistics middleware so that it adds no overhead
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                               REQUEST_STATS_SAMPLE_RATE=0):
+            for label, role, url_name, get_kwargs in endpoints:
+                try:
+                    url = reverse(url_name, kwargs=get_kwargs(fixtures) if get_kwargs else None)
+                except NoReverseMatch:
+                    self.stderr.write(f'Skipped {label}: {url_name} is not configured.')
+                    continue
+                if role not in clients:
+                    clients[role] = Client()
+                    clients[role].force_login(fixtures[role])
+                results[label] = self.benchmark(clients[role], url, options['requests'],
+                                                options['warmup'])
+
+        self.write_table(results)
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                self.write_comparison(results, json.load(baseline_file)['endpoints'])
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump({
+                    'commit': self.get_commit(),
+                    'date': timezone.now().isoformat(),
+                    'database': connection.vendor,
+                    'trips': Trip.objects.count(),
+                    'requests': options['requests'],
+                    'endpoints': results,
+                }, output_file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        failed = [f"{label} ({result['status']})" for label, result in results.items()
+                  if result['status'] != 200]
+        if failed:
+            raise CommandError(f"Endpoints responded with an error: {', '.join(failed)}.")
+
+    def write_table(self, results):
+        """Print the latency and query count percentiles of each endpoint."""
+        self.stdout.write(f"{'endpoint':<20} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} "
+                          f"{'p50 queries':>12} {'p95 queries':>12}")
+        for label, result in results.items():
+            self.stdout.write(
+                f"{label:<20} {result['status']:>6} {result['latency_ms']['p50']:>9.2f} "
+                f"{result['latency_ms']['p95']:>9.2f} {result['queries']['p50']:>12} "
+                f"{result['queries']['p95']:>12}")
+
+    def write_comparison(self, results, baseline):
+        """Print the change in p50 and p95 latency and in p95 queries from the baseline."""
+        self.stdout.write(f"\n{'endpoint':<20} {'p50 change':>11} {'p95 change':>11} "
+                          f"{'queries change':>15}")
+        for label, result in results.items():
+            if label not in baseline:
+                continue
+            changes = [
+                (result['latency_ms'][key] - baseline[label]['latency_ms'][key]) /
+                baseline[label]['latency_ms'][key] * 100
+                for key in ('p50', 'p95')
+            ]
+            queries = result['queries']['p95'] - baseline[label]['queries']['p95']
+            self.stdout.write(f"{label:<20} {changes[0]:>+10.1f}% {changes[1]:>+10.1f}% "
+                              f"{queries:>+15}")
@@ -0,0 +1,82 @@
+"""
+This script defines a command to print the query plans of the trip list views.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+# earo-travel-tracker imports
+from trip.models import Trip, TripApproval
+from trip.views import TripApprovalListView, TripListView
+
+
+class Command(BaseCommand):
+    """
+    Definition of the explainlistqueries command.
+
+    The queries are built the same way the list views build them so that the plans show
+    whether the database uses the indexes defined on Trip and TripApproval.
+    """
+    help = 'Print the EXPLAIN plans of the queries run by the trip list views.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username whose work queue and trips are explained. '
+                            'Defaults to the first approver.')
+        parser.add_argument('--date', help='Date (YYYY-MM-DD) to explain the date-window '
+                            'queries for. Defaults to today.')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run the queries and show actual timings (PostgreSQL only).')
+        parser.add_argument('--sql', action='store_true', help='Print the SQL of each query.')
+
+    def get_user(self, username):
+        """
+        Get the user to explain the user specific queries for.
+        """
+        user_model = get_user_model()
+        if username:
+            try:
+                return user_model.objects.get(username=username)
+            except user_model.DoesNotExist:
+                raise CommandError(f'User "{username}" does not exist.')
+        user = user_model.objects.filter(approver__isnull=False).order_by('id').first()
+        if user is None:
+            raise CommandError('No approver found. Use --user to choose a user.')
+        return user
+
+    def get_list_queries(self, user, date):
+        """
+        Return (title, queryset) pairs for the first page of each trip list view.
+        """
+        approvals = TripApproval.objects.with_trip_details().order_by(
+            *TripApprovalListView.keyset)
+        trips = Trip.objects.filter(traveler__user_account=user).order_by(*TripListView.keyset)
+        return [
+            ('Upcoming trips',
+                approvals.approvable_by(user).upcoming(date)[:TripApprovalListView.paginate_by]),
+            ('Ongoing trips',
+                approvals.approvable_by(user).ongoing(date)[:TripApprovalListView.paginate_by]),
+            ('Trips awaiting approval',
+                approvals.awaiting_approval(user)[:TripApprovalListView.paginate_by]),
+            ('My trips', trips[:TripListView.paginate_by]),
+        ]
+
+    def handle(self, *args, **options):
+        date = timezone.now().date()
+        if options['date']:
+            date = parse_date(options['date'])
+            if date is None:
+                raise CommandError('The date must be in the format YYYY-MM-DD.')
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--analyze is only supported on PostgreSQL.')
+            explain_options['analyze'] = True
+
+        user = self.get_user(options['user'])
+        for title, queryset in self.get_list_queries(user, date):
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            if options['sql']:
+                self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
@@ -0,0 +1,334 @@
+"""
+This script defines a command to generate realistic volumes of travelers, approvers and trips
+for load testing.
+"""
+import random
+from datetime import time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+# earo-travel-tracker imports
+from traveler.models import (
+    Approver, ApprovalDelegation, ApproverAssignment, CountrySecurityLevel, Departments,
+    TravelerProfile,
+)
+from trip.intervals import trip_index
+from trip.models import Trip, TripApproval, TripItinerary, TripPOET
+from utils.permissions import batch_permissions, grant_perms
+
+CITIES = (
+    'Nairobi', 'Mombasa', 'Kisumu', 'Nakuru', 'Eldoret', 'Garissa', 'Lodwar', 'Marsabit',
+    'Kampala', 'Kigali', 'Juba', 'Addis Ababa', 'Mogadishu', 'Dar es Salaam', 'Goma',
+)
+COUNTRIES = (
+    'Kenya', 'Uganda', 'Tanzania', 'Rwanda', 'Burundi', 'South Sudan', 'Ethiopia', 'Somalia',
+    'DR Congo', 'Sudan', 'Eritrea', 'Djibouti', 'Zambia', 'Malawi', 'Mozambique',
+)
+PASSWORD = 'sample-password'
+# permissions given to the groups when they are created here, so that their members can use
+# the views the benchmarkviews command requests as them
+GROUP_PERMISSIONS = {
+    'travelers': ('trip.add_trip', 'trip.add_tripitinerary', 'trip.add_trippoet',
+                  'traveler.view_countrysecuritylevel', 'traveler.view_departments'),
+    'approvers': ('traveler.add_approvaldelegation',),
+}
+# the trip pages link to the scope of work, so every trip has one; the file needn't exist
+SCOPE_OF_WORK = 'media/uploads/scope_of_work/sample.pdf'
+
+
+def bulk_insert(model, objects):
+    """
+    Insert the objects with bulk_create and return them as saved, with their primary keys.
+    Django only sets the primary keys of bulk created objects on PostgreSQL, so the new rows
+    are read back. The database shouldn't be written to by anything else meanwhile.
+    """
+    last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    model.objects.bulk_create(objects)
+    return list(model.objects.filter(id__gt=last_id).order_by('id'))
+
+
+class Command(BaseCommand):
+    """
+    Definition of the generatesampledata command.
+
+    Rows are inserted with bulk_create, so the model signals don't run. What they would do
+    is done in bulk instead: travelers get a profile and the change permission on it, users
+    are added to the travelers and approvers groups and the approver assignments are rebuilt.
+    The groups are created with the permissions of GROUP_PERMISSIONS if they don't exist, as
+    on a freshly migrated database.
+    Each trip gets itinerary legs, POET rows and an approval history: not yet requested,
+    awaiting approval at some level, approved at every level of the trip's security level or
+    declined, some of them after an earlier round of approval was invalidated.
+    The same --seed generates the same data. Every username starts with --prefix.
+    """
+    help = 'Generate travelers, approvers and trips with their approvals for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Number of travelers, approvers included.')
+        parser.add_argument('--approvers', type=int, default=50,
+                            help='Number of the travelers who are approvers.')
+        parser.add_argument('--departments', type=int, default=20)
+        parser.add_argument('--countries', type=int, default=15)
+        parser.add_argument('--trips-per-traveler', type=int, default=5)
+        parser.add_argument('--max-legs', type=int, default=4,
+                            help='Largest number of itinerary legs per trip.')
+        parser.add_argument('--delegations', type=int, default=5,
+                            help='Number of approvers who have delegated approval.')
+        parser.add_argument('--prefix', default='sample',
+                            help='Prefix of the generated usernames.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['approvers'] < 2 or options['approvers'] > options['users']:
+            raise CommandError('--approvers must be between 2 and --users.')
+        user_model = get_user_model()
+        if user_model.objects.filter(username__startswith=f"{options['prefix']}_").exists():
+            raise CommandError(f"Users prefixed {options['prefix']}_ already exist. "
+                               "Use another --prefix or a fresh database.")
+        self.random = random.Random(options['seed'])
+        self.today = timezone.now().date()
+
+        with transaction.atomic(), batch_permissions():
+            users = self.create_users(options['users'], options['prefix'])
+            approvers = self.create_approvers(users[:options['approvers']])
+            departments = self.create_departments(options['departments'], approvers)
+            countries = self.create_countries(options['countries'], approvers)
+            travelers = self.create_travelers(users, departments, countries, approvers)
+            self.create_delegations(min(options['delegations'], len(approvers) // 2), approvers)
+            ApproverAssignment.objects.rebuild()
+            trips = self.create_trips(travelers, countries, options['trips_per_traveler'])
+            self.create_trip_details(trips, options['max_legs'])
+            approvals = self.create_approvals(trips)
+        trip_index.clear()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(travelers)} travelers, {len(approvers)} approvers, '
+            f'{len(departments)} departments, {len(countries)} countries, {len(trips)} trips '
+            f'and {approvals} approvals. Users log in with the password {PASSWORD}.'))
+
+    def create_users(self, count, prefix):
+        """
+        Create the user accounts and a superuser, {prefix}_admin, who isn't a traveler.
+        Returns the users other than the superuser.
+        """
+        user_model = get_user_model()
+        password = make_password(PASSWORD)
+        users = bulk_insert(user_model, [
+            user_model(username=f'{prefix}_{index}', first_name='Traveler', last_name=str(index),
+                       email=f'{prefix}_{index}@example.com', password=password)
+            for index in range(count)
+        ] + [
+            user_model(username=f'{prefix}_admin', first_name='Admin', last_name='Sample',
+                       email=f'{prefix}_admin@example.com', password=password, is_staff=True,
+                       is_superuser=True)
+        ])[:-1]
+        self.add_to_group('travelers', users)
+        return users
+
+    def get_group(self, name):
+        """
+        Get a group, creating it with the permissions of GROUP_PERMISSIONS if it doesn't
+        exist. The permissions of existing groups are left as they are.
+        """
+        group, created = Group.objects.get_or_create(name=name)
+        if created:
+            permissions = Q()
+            for permission in GROUP_PERMISSIONS[name]:
+                app_label, codename = permission.split('.')
+                permissions |= Q(content_type__app_label=app_label, codename=codename)
+            group.permissions.set(Permission.objects.filter(permissions))
+            self.stdout.write(f'Created the {name} group.')
+        return group
+
+    def add_to_group(self, name, users):
+        """Add the users to a group."""
+        group = self.get_group(name)
+        membership = group.user_set.through
+        membership.objects.bulk_create([membership(group=group, user=user) for user in users])
+
+    def create_approvers(self, users):
+        """
+        Make the users approvers, with a third of them on the daily digest.
+        """
+        approvers = bulk_insert(Approver, [
+            Approver(user=user, security_level=str(index % 3 + 1),
+                     notification_mode='digest' if index % 3 == 0 else 'immediate')
+            for index, user in enumerate(users)
+        ])
+        self.add_to_group('approvers', users)
+        return approvers
+
+    def create_departments(self, count, approvers):
+        """Create departments with level 1 and level 2 approvers."""
+        return bulk_insert(Departments, [
+            Departments(department=f'Department {index}',
+                        description=f'Sample department {index}',
+                        security_level_1_approver=self.random.choice(approvers),
+                        security_level_2_approver=self.random.choice(approvers))
+            for index in range(count)
+        ])
+
+    def create_countries(self, count, approvers):
+        """Create countries of every security level with level 3 approvers."""
+        return bulk_insert(CountrySecurityLevel, [
+            CountrySecurityLevel(
+                country=COUNTRIES[index % len(COUNTRIES)] + (
+                    f' {index // len(COUNTRIES)}' if index >= len(COUNTRIES) else ''),
+                security_level=str(index % 3 + 1),
+                security_level_3_approver=self.random.choice(approvers))
+            for index in range(count)
+        ])
+
+    def create_travelers(self, users, departments, countries, approvers):
+        """
+        Create the profiles of the users and grant them the change permission on their
+        profile. One traveler in ten has their own level 1 approver and most have a line
+        manager.
+        """
+        travelers = bulk_insert(TravelerProfile, [
+            TravelerProfile(
+                user_account=user, type_of_traveler='Employee', nationality='Kenyan',
+                contact_telephone=f'+2547{index:08d}', contact_email=user.email,
+                department=self.random.choice(departments),
+                country_of_duty=self.random.choice(countries),
+                approver=self.random.choice(approvers) if index % 10 == 0 else None)
+            for index, user in enumerate(users)
+        ])
+        managed = []
+        for index, traveler in enumerate(travelers):
+            # travelers are managed by an earlier traveler, so there are no cycles
+            if index and index % 20:
+                traveler.is_managed_by = travelers[self.random.randrange(index)]
+                managed.append(traveler)
+        TravelerProfile.objects.bulk_update(managed, ['is_managed_by'])
+        for user, traveler in zip(users, travelers):
+            grant_perms(user, ('change_travelerprofile',), traveler)
+        return travelers
+
+    def create_delegations(self, count, approvers):
+        """
+        Have approvers from the first half delegate approval to approvers from the second
+        half, either now or in the past.
+        """
+        delegations = []
+        for approver, delegate in zip(approvers[:count], approvers[-count:] if count else []):
+            start_date = self.today - timedelta(days=self.random.randint(0, 60))
+            end_date = start_date + timedelta(days=self.random.randint(7, 90))
+            delegations.append(ApprovalDelegation(
+                approver=approver, delegate=delegate, start_date=start_date, end_date=end_date,
+                active=end_date >= self.today, reason_for_delegation='Sample leave',
+                reason_for_revocation=''))
+        users = {approver.id: approver.user for approver in approvers}
+        for delegation in bulk_insert(ApprovalDelegation, delegations):
+            grant_perms(users[delegation.approver_id], ('change_approvaldelegation',),
+                        delegation)
+
+    def create_trips(self, travelers, countries, trips_per_traveler):
+        """
+        Create trips spread over the year before and after today. The security level of a
+        trip is that of a random country.
+        """
+        trips = []
+        for traveler in travelers:
+            for index in range(trips_per_traveler):
+                start_date = self.today + timedelta(days=self.random.randint(-365, 365))
+                end_date = start_date + timedelta(days=self.random.randint(0, 20))
+                trips.append(Trip(
+                    trip_name=f'{self.random.choice(CITIES)} trip {index}',
+                    traveler=traveler,
+                    type_of_travel=self.random.choice(Trip.TRAVEL_TYPES)[0],
+                    category_of_travel=self.random.choice(Trip.TRAVEL_CATEGORIES)[0],
+                    reason_for_travel='Sample trip generated for load testing.',
+                    start_date=start_date,
+                    end_date=end_date,
+                    is_mission_critical=self.random.random() < 0.1,
+                    is_travel_completed=end_date < self.today,
+                    security_level=self.random.choice(countries).security_level,
+                    scope_of_work=SCOPE_OF_WORK,
+                ))
+        return bulk_insert(Trip, trips)
+
+    def create_trip_details(self, trips, max_legs):
+        """Create the itinerary legs and POET rows of the trips."""
+        legs = []
+        poets = []
+        for trip in trips:
+            city = self.random.choice(CITIES)
+            days = (trip.end_date - trip.start_date).days
+            for leg in range(self.random.randint(1, max_legs)):
+                destination = self.random.choice([other for other in CITIES if other != city])
+                legs.append(TripItinerary(
+                    trip=trip,
+                    date_of_departure=trip.start_date + timedelta(
+                        days=self.random.randint(0, days)),
+                    time_of_departure=time(self.random.randint(5, 20), 0),
+                    city_of_departure=city,
+                    destination=destination,
+                    mode_of_travel=self.random.choice(TripItinerary.TRAVEL_MODES)[0],
+                    leg_status='Complete' if trip.is_travel_completed else 'Incomplete',
+                ))
+                city = destination
+            for poet in range(self.random.randint(1, 2)):
+                poets.append(TripPOET(trip=trip, project=f'{self.random.randint(0, 999999):06d}',
+                                      task=f'{self.random.randint(0, 999):03d}'))
+        TripItinerary.objects.bulk_create(legs)
+        TripPOET.objects.bulk_create(poets)
+
+    def create_approvals(self, trips):
+        """
+        Create the approval history of the trips and set their approval state to match, as
+        Trip.update_approval_state() would. Requests go to the approvers of the traveler's
+        approver assignments. Returns the number of approvals created.
+        """
+        assigned = dict(((traveler_id, security_level), approver_id)
+                        for traveler_id, security_level, approver_id in
+                        ApproverAssignment.objects.values_list(
+                            'traveler_id', 'security_level', 'approver_id'))
+        approvals = []
+        for trip in trips:
+            outcome = self.random.choices(
+                ('not requested', 'awaiting', 'approved', 'declined'), (2, 3, 4, 1))[0]
+            if outcome == 'not requested':
+                continue
+            levels = range(1, int(trip.security_level) + 1)
+            if outcome != 'approved':
+                levels = range(1, self.random.randint(1, int(trip.security_level)) + 1)
+            if self.random.random() < 0.2:
+                # an earlier round declined at level 1 and invalidated when the trip changed
+                approvals.append(TripApproval(
+                    trip=trip, security_level='1',
+                    approver_id=assigned.get((trip.traveler_id, '1')), is_valid=False,
+                    acted_upon=True, approval_date=trip.start_date - timedelta(days=30),
+                    approval_comment='Please add the itinerary.'))
+            for security_level in map(str, levels):
+                approver_id = assigned.get((trip.traveler_id, security_level))
+                if approver_id is None:
+                    # nobody to request approval from, the trip stays at the previous level
+                    break
+                last = security_level == str(levels[-1])
+                declined = outcome == 'declined' and last
+                acted_upon = outcome in ('approved', 'declined') or not last
+                approvals.append(TripApproval(
+                    trip=trip, security_level=security_level, approver_id=approver_id,
+                    acted_upon=acted_upon, trip_is_approved=acted_upon and not declined,
+                    approval_date=trip.start_date - timedelta(days=7) if acted_upon else None,
+                    approval_comment='Declined for lack of budget.' if declined else None))
+                trip.approval_security_level = security_level
+                trip.approval_complete = outcome == 'approved' and last
+                if trip.approval_complete:
+                    trip.approval_stage = 'Approved'
+                elif acted_upon:
+                    trip.approval_stage = 'Not requested'
+                else:
+                    trip.approval_stage = f'Awaiting Level {security_level} Approval'
+        TripApproval.objects.bulk_create(approvals)
+        Trip.objects.bulk_update(
+            [trip for trip in trips if trip.approval_security_level is not None],
+            ['approval_security_level', 'approval_complete', 'approval_stage'])
+        return len(approvals)
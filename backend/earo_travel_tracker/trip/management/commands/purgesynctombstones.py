@@ -0,0 +1,27 @@
+"""
+This script defines a command to delete the tombstones of the delta sync API that are older
+than SYNC_TOMBSTONE_DAYS.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+# earo-travel-tracker imports
+from trip.models import SyncTombstone
+
+
+class Command(BaseCommand):
+    """
+    Definition of the purgesynctombstones command.
+
+    Clients syncing with a token older than SYNC_TOMBSTONE_DAYS get a full sync (trip.sync),
+    so the tombstones of deletions made before then aren't needed anymore. Run it once a day,
+    e.g. from cron.
+    """
+    help = 'Delete the tombstones of the delta sync API older than SYNC_TOMBSTONE_DAYS.'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+        deleted, _ = SyncTombstone.objects.filter(deleted_on__lt=cutoff).delete()
+        self.stdout.write(f"Deleted {deleted} tombstone(s).")
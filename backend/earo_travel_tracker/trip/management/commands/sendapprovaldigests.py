@@ -0,0 +1,63 @@
+"""
+This script defines a command to email approvers on the daily digest their pending approval
+requests.
+"""
+from itertools import groupby
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+# earo-travel-tracker imports
+from trip.models import OutboxEmail, TripApproval
+from utils.emailing import get_email_template
+
+
+class Command(BaseCommand):
+    """
+    Definition of the sendapprovaldigests command.
+
+    Every active approver whose notification_mode is digest gets one email listing all the
+    approval requests still pending with them. The requests are read with one query and the
+    emails are queued in the outbox (trip.models.OutboxEmail) with one insert, so that the
+    sendqueuedemails command delivers them over one connection and retries those that fail.
+    Run it once a day, e.g. from cron, before sendqueuedemails.
+    """
+    help = 'Email approvers on the daily digest the approval requests pending with them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--site-url', default=getattr(settings, 'EMAIL_SITE_URL', ''),
+                            help='Scheme and host prefixed to the links in the emails.')
+
+    @staticmethod
+    def get_pending_approvals():
+        """
+        Return the pending approval requests of the approvers on the digest, grouped by
+        approver.
+        """
+        return (
+            TripApproval.objects
+            .filter(acted_upon=False, is_valid=True, approver__is_active=True,
+                    approver__notification_mode='digest')
+            .select_related('approver__user', 'trip__traveler__user_account')
+            .order_by('approver_id', 'trip__start_date', 'id')
+        )
+
+    def handle(self, *args, **options):
+        subject = "Trips Awaiting Your Approval"
+        recipients = []
+        contexts = []
+        for approver, approvals in groupby(self.get_pending_approvals(),
+                                           key=lambda approval: approval.approver):
+            recipients.append(approver.user.email)
+            contexts.append({'recipient': approver.user.first_name, 'approvals': list(approvals)})
+        if not contexts:
+            self.stdout.write('No pending approval requests for approvers on the digest')
+            return
+
+        rendered = get_email_template('approval_digest').render_batch(
+            contexts, common_context={'site_url': options['site_url'], 'subject': subject})
+        datatuple = [
+            (subject, text, html, settings.EMAIL_HOST_USER, [recipient])
+            for recipient, (text, html) in zip(recipients, rendered)
+        ]
+        queued = OutboxEmail.objects.queue(datatuple)
+        self.stdout.write(f'Queued {len(queued)} digest email(s)')
@@ -0,0 +1,120 @@
+"""
+This script defines a command to send the emails queued in the OutboxEmail table.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+# earo-travel-tracker imports
+from trip.models import OutboxEmail
+
+
+class Command(BaseCommand):
+    """
+    Definition of the sendqueuedemails command.
+
+    Due emails are claimed in batches and sent over a single connection to the email backend.
+    An email that fails is retried with exponential backoff until it has been attempted
+    EMAIL_OUTBOX_MAX_ATTEMPTS times. With --loop the command keeps draining the outbox and can
+    be run as a long lived worker process; otherwise it drains it once and exits, which
+    suits cron.
+    """
+    help = 'Send the emails queued in the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Number of emails sent per connection.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox instead of exiting once it is empty.')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Seconds to wait between polls of an empty outbox with --loop.')
+
+    @staticmethod
+    def get_retry_delay(attempts):
+        """
+        Return how long to wait before the next attempt of an email that failed attempts
+        times.
+        """
+        base_delay = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60)
+        return timedelta(seconds=min(base_delay * 2 ** (attempts - 1), 24 * 60 * 60))
+
+    def schedule_retry(self, email, error):
+        """
+        Record a failed attempt to send an email and schedule the next one.
+        """
+        email.attempts += 1
+        email.last_error = str(error)
+        email.next_attempt_on = timezone.now() + self.get_retry_delay(email.attempts)
+        email.save(update_fields=['attempts', 'last_error', 'next_attempt_on'])
+        self.stderr.write(f'Failed to send email {email.id} (attempt {email.attempts}): {error}')
+
+    def claim_batch(self, batch_size, max_attempts):
+        """
+        Claim a batch of due emails for this worker and return them. The claim moves their
+        next attempt past EMAIL_OUTBOX_CLAIM_TIMEOUT, so other workers leave them alone, and
+        is made in a short transaction that holds no lock while the emails are sent. The
+        claim time, unique to the worker, tells which of the emails it won.
+        """
+        claim_timeout = getattr(settings, 'EMAIL_OUTBOX_CLAIM_TIMEOUT', 300)
+        claimed_until = timezone.now() + timedelta(seconds=claim_timeout)
+        with transaction.atomic():
+            emails = OutboxEmail.objects.due(max_attempts)
+            if db_connection.features.has_select_for_update_skip_locked:
+                emails = emails.select_for_update(skip_locked=True)
+            email_ids = list(emails.values_list('id', flat=True)[:batch_size])
+            if not email_ids:
+                return []
+            OutboxEmail.objects.due(max_attempts).filter(id__in=email_ids).update(
+                next_attempt_on=claimed_until)
+        return list(OutboxEmail.objects.filter(
+            id__in=email_ids, next_attempt_on=claimed_until).order_by('id'))
+
+    def send_batch(self, batch_size, max_attempts):
+        """
+        Send one batch of due emails over one connection, outside any transaction. The
+        result of each email is saved on its own, and an error sending one email only
+        schedules a retry of that email. Returns the number of emails attempted.
+        """
+        emails = self.claim_batch(batch_size, max_attempts)
+        if not emails:
+            return 0
+
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as error:
+            for email in emails:
+                self.schedule_retry(email, error)
+            return len(emails)
+
+        try:
+            for email in emails:
+                try:
+                    sent = connection.send_messages([email.get_message(connection)])
+                except Exception as error:
+                    self.schedule_retry(email, error)
+                    continue
+                if not sent:
+                    self.schedule_retry(email, 'The email backend did not send the email')
+                    continue
+                email.attempts += 1
+                email.sent_on = timezone.now()
+                email.save(update_fields=['attempts', 'sent_on'])
+        finally:
+            connection.close()
+        return len(emails)
+
+    def handle(self, *args, **options):
+        max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+        while True:
+            attempted = self.send_batch(options['batch_size'], max_attempts)
+            if attempted:
+                self.stdout.write(f'Attempted to send {attempted} email(s)')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
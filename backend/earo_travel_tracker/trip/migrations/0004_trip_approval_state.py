@@ -0,0 +1,56 @@
+# Generated by Django 2.2.24 on 2026-10-17 11:25
+
+from django.db import migrations, models
+
+
+def populate_approval_state(apps, schema_editor):
+    """
+    Compute the approval state of existing trips from their TripApproval instances.
+    """
+    Trip = apps.get_model('trip', 'Trip')
+    TripApproval = apps.get_model('trip', 'TripApproval')
+    for trip in Trip.objects.all().iterator():
+        latest_approval = TripApproval.objects.filter(trip=trip, is_valid=True).order_by(
+            '-approval_request_date', '-id').values_list('security_level', 'acted_upon').first()
+        approval_stage = 'Not requested'
+        approval_security_level = None
+        if latest_approval is not None:
+            approval_security_level, acted_upon = latest_approval
+            if not acted_upon:
+                approval_stage = f'Awaiting Level {approval_security_level} Approval'
+        if trip.approval_complete:
+            approval_stage = 'Approved'
+        Trip.objects.filter(id=trip.id).update(
+            approval_stage=approval_stage,
+            approval_security_level=approval_security_level,
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0003_auto_20210420_0836'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='approval_security_level',
+            field=models.CharField(blank=True, choices=[('1', 'Level 1'), ('2', 'Level 2'), ('3', 'Level 3')], editable=False, max_length=1, null=True, verbose_name='Security level of the latest approval request'),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='approval_stage',
+            field=models.CharField(choices=[('Not requested', 'Not requested'), ('Awaiting Level 1 Approval', 'Awaiting Level 1 Approval'), ('Awaiting Level 2 Approval', 'Awaiting Level 2 Approval'), ('Awaiting Level 3 Approval', 'Awaiting Level 3 Approval'), ('Approved', 'Approved')], db_index=True, default='Not requested', editable=False, max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='trip',
+            name='security_level',
+            field=models.CharField(choices=[('1', 'Level 1'), ('2', 'Level 2'), ('3', 'Level 3')], default=1, max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='tripapproval',
+            name='security_level',
+            field=models.CharField(choices=[('1', 'Level 1'), ('2', 'Level 2'), ('3', 'Level 3')], default=1, max_length=1),
+        ),
+        migrations.RunPython(populate_approval_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.24 on 2026-10-17 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0004_trip_approval_state'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['start_date', 'end_date'], name='trip_start_end_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tripapproval',
+            index=models.Index(fields=['approver', 'acted_upon', 'trip_is_approved'], name='tripapproval_queue_idx'),
+        ),
+    ]
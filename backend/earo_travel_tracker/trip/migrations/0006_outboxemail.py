@@ -0,0 +1,38 @@
+# Generated by Django 2.2.24 on 2026-10-17 11:33
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0005_trip_date_window_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('text_content', models.TextField()),
+                ('html_content', models.TextField()),
+                ('from_email', models.CharField(blank=True, max_length=254)),
+                ('recipients', models.TextField(help_text='Comma separated email addresses')),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('next_attempt_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('sent_on', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Outbox Email',
+                'verbose_name_plural': 'Outbox Emails',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outboxemail',
+            index=models.Index(fields=['sent_on', 'next_attempt_on'], name='outboxemail_due_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+from django.db import migrations
+
+# model name -> path from the model to the user owning the trip
+OWNED_MODELS = {
+    'trip': 'traveler__user_account_id',
+    'trippoet': 'trip__traveler__user_account_id',
+    'tripitinerary': 'trip__traveler__user_account_id',
+}
+BATCH_SIZE = 500
+
+
+def get_owner_permissions(apps, model_name):
+    """
+    Return the content type and the view and change permissions of a trip model, or None if
+    they haven't been created yet.
+    """
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Permission = apps.get_model('auth', 'Permission')
+    content_type = ContentType.objects.filter(app_label='trip', model=model_name).first()
+    if content_type is None:
+        return None
+    permissions = list(Permission.objects.filter(
+        content_type=content_type, codename__in=[f'view_{model_name}', f'change_{model_name}']))
+    return content_type, permissions
+
+
+def remove_owner_permissions(apps, schema_editor):
+    """
+    Delete the guardian rows granting trip owners the view and change permissions on their
+    trips, POETs and itineraries. trip.backends.TripOwnerBackend answers those.
+    """
+    UserObjectPermission = apps.get_model('guardian', 'UserObjectPermission')
+    for model_name, owner_path in OWNED_MODELS.items():
+        owner_permissions = get_owner_permissions(apps, model_name)
+        if owner_permissions is None:
+            continue
+        content_type, permissions = owner_permissions
+        owners = dict(apps.get_model('trip', model_name).objects.values_list('id', owner_path))
+        redundant = []
+        for row_id, user_id, object_pk in UserObjectPermission.objects.filter(
+                content_type=content_type, permission__in=permissions
+        ).values_list('id', 'user_id', 'object_pk').iterator():
+            if object_pk.isdigit() and owners.get(int(object_pk)) == user_id:
+                redundant.append(row_id)
+        for start in range(0, len(redundant), BATCH_SIZE):
+            UserObjectPermission.objects.filter(
+                id__in=redundant[start:start + BATCH_SIZE]).delete()
+
+
+def restore_owner_permissions(apps, schema_editor):
+    """
+    Grant trip owners the view and change permissions on their trips, POETs and itineraries
+    through guardian again.
+    """
+    UserObjectPermission = apps.get_model('guardian', 'UserObjectPermission')
+    for model_name, owner_path in OWNED_MODELS.items():
+        owner_permissions = get_owner_permissions(apps, model_name)
+        if owner_permissions is None:
+            continue
+        content_type, permissions = owner_permissions
+        rows = [
+            UserObjectPermission(permission=permission, content_type=content_type,
+                                 user_id=user_id, object_pk=str(object_id))
+            for object_id, user_id in apps.get_model('trip', model_name).objects.values_list(
+                'id', owner_path)
+            for permission in permissions
+        ]
+        UserObjectPermission.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0006_outboxemail'),
+        ('guardian', '0002_generic_permissions_index'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('auth', '0011_update_proxy_permissions'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_owner_permissions, restore_owner_permissions),
+    ]
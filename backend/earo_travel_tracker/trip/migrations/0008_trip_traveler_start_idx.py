@@ -0,0 +1,17 @@
+# Generated by Django 2.2.24 on 2026-10-17 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0007_remove_owner_object_permissions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['traveler', 'start_date', 'id'], name='trip_traveler_start_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.2.24 on 2026-10-17 15:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0008_trip_traveler_start_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(choices=[('trip', 'Trip'), ('tripitinerary', 'Trip Itinerary'), ('trippoet', 'Trip POET'), ('tripapproval', 'Trip Approval')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('trip_id', models.PositiveIntegerField()),
+                ('traveler_id', models.PositiveIntegerField(null=True)),
+                ('deleted_on', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Sync Tombstone',
+                'verbose_name_plural': 'Sync Tombstones',
+            },
+        ),
+        migrations.AddField(
+            model_name='tripapproval',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='tripitinerary',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='trippoet',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['created_on'], name='trip_created_on_idx'),
+        ),
+    ]
@@ -1,10 +1,62 @@
 """
 Data models for the trip app are defined in this file.
 """
-from django.db import models
+from django.core.mail import EmailMultiAlternatives
+from django.db import models, transaction
 from django.urls import reverse
+from django.utils import timezone
 # earo_travel_tracker imports
-from traveler.models import TravelerProfile, Approver, LEVELS_OF_SECURITY
+from traveler.models import (
+    TravelerProfile, Approver, ApproverAssignment, LEVELS_OF_SECURITY
+)
+
+
+class TripQuerySet(models.QuerySet):
+    """
+    Queryset for Trip instances.
+    """
+
+    def visible_to(self, user):
+        """
+        Trips the user may see: their own trips, the trips of the travelers they manage or
+        approve and the trips they were asked to approve. Users with the view_trip permission
+        on the model see all trips.
+        The conditions are subqueries, so the trips aren't repeated and need no DISTINCT.
+        """
+        if user.has_perm('trip.view_trip'):
+            return self.all()
+        travelers = ApproverAssignment.objects.filter(approver__user=user).values('traveler_id')
+        approvals = TripApproval.objects.filter(approver__user=user).values('trip_id')
+        return self.filter(
+            models.Q(traveler__user_account=user) |
+            models.Q(traveler__is_managed_by__user_account=user) |
+            models.Q(traveler__in=travelers) |
+            models.Q(id__in=approvals)
+        )
+
+    def with_details(self):
+        """
+        Prefetch the itinerary, POET, dependants and approval history of the trips, in
+        display order, so that serializing any number of trips takes four more queries.
+        """
+        return self.prefetch_related(*self.get_detail_lookups())
+
+    @staticmethod
+    def get_detail_lookups():
+        """
+        Return the lookups prefetched by with_details(), to prefetch the details of trips
+        already loaded with models.prefetch_related_objects().
+        """
+        return [
+            models.Prefetch('tripitinerary_set', queryset=TripItinerary.objects.order_by(
+                'date_of_departure', 'time_of_departure', 'id')),
+            models.Prefetch('trippoet_set', queryset=TripPOET.objects.order_by('id')),
+            models.Prefetch('triptravelerdependants_set',
+                            queryset=TripTravelerDependants.objects.select_related(
+                                'dependants_travelling__user_account').order_by('id')),
+            models.Prefetch('trip_approvals', queryset=TripApproval.objects.order_by(
+                'approval_request_date', 'id')),
+        ]
 
 
 class Trip(models.Model):
@@ -26,6 +78,14 @@ class Trip(models.Model):
         ('International', 'International'),
     )
 
+    APPROVAL_STAGES = (
+        ('Not requested', 'Not requested'),
+        ('Awaiting Level 1 Approval', 'Awaiting Level 1 Approval'),
+        ('Awaiting Level 2 Approval', 'Awaiting Level 2 Approval'),
+        ('Awaiting Level 3 Approval', 'Awaiting Level 3 Approval'),
+        ('Approved', 'Approved'),
+    )
+
     trip_name = models.CharField(max_length=200, blank=False, null=False, db_index=True,
                             help_text="""In at most 200 characters give your trip a descriptive
                             title""")
@@ -39,6 +99,8 @@ class Trip(models.Model):
     end_date = models.DateField(null=False, blank=False)
     is_mission_critical = models.BooleanField(null=False, blank=False)
     is_travel_completed = models.BooleanField(null=False, blank=False, default=False)
+    # created_on is updated whenever the trip, its approval state or its itinerary, POET or
+    # dependants change (see trip.signals), so it stamps the trip's last modification.
     created_on = models.DateTimeField(auto_now=True, null=False)
     scope_of_work = models.FileField(upload_to="media/uploads/scope_of_work/%Y/%m/%d/",
                             verbose_name="Scope of Work", null=True, blank=False)
@@ -47,7 +109,15 @@ class Trip(models.Model):
     # TODO make default on form = traveler.country_of_duty.security_level). maybe form.initial
     approval_complete = models.BooleanField(null=False, default=False,
                             verbose_name="Is approval Complete?")
+    # approval_stage and approval_security_level are maintained from the trip's TripApproval
+    # instances by update_approval_state() so that they can be read without a query.
+    approval_stage = models.CharField(max_length=30, null=False, choices=APPROVAL_STAGES,
+                            default='Not requested', db_index=True, editable=False)
+    approval_security_level = models.CharField(max_length=1, null=True, blank=True,
+                            choices=LEVELS_OF_SECURITY, editable=False,
+                            verbose_name="Security level of the latest approval request")
 
+    objects = TripQuerySet.as_manager()
 
     def get_absolute_url(self):
         """
@@ -92,18 +162,43 @@ class Trip(models.Model):
         Invalidate all approvals for a trip instance.
         This is especially useful when a user modifies any detail of a trip.
 
-        check if trip is approved, revert to False
-        check all exisiting associated TripApproval instances and invalidate them
+        The valid TripApproval instances are invalidated with a single update and the trip's
+        approval state is reset in the same transaction.
+        Returns the number of approvals invalidated.
 
         this should be used in a view where the object is a Trip instance.
         """
-        if self.approval_complete:
+        with transaction.atomic():
+            invalidated = TripApproval.objects.filter(trip__id=self.id, is_valid=True).update(
+                is_valid=False, updated_on=timezone.now())
             self.approval_complete = False
-            self.save()
-        approvals = TripApproval.objects.filter(trip=self).filter(is_valid=True)
-        for approval in approvals:
-            approval.is_valid = False
-            approval.save()
+            self.approval_stage = "Not requested"
+            self.approval_security_level = None
+            self.save(update_fields=["approval_complete", "approval_stage",
+                                     "approval_security_level", "created_on"])
+        return invalidated
+
+    def update_approval_state(self):
+        """
+        Recompute approval_stage and approval_security_level from the valid TripApproval
+        instances of the trip and save them.
+        This is called whenever a TripApproval is saved or the trip approval is invalidated
+        and should run in the same transaction as that change.
+        """
+        latest_approval = TripApproval.objects.filter(trip__id=self.id, is_valid=True).order_by(
+            "-approval_request_date", "-id").values_list("security_level", "acted_upon").first()
+        if latest_approval is None:
+            self.approval_security_level = None
+            self.approval_stage = "Not requested"
+        else:
+            self.approval_security_level, acted_upon = latest_approval
+            if not acted_upon:
+                self.approval_stage = f"Awaiting Level {self.approval_security_level} Approval"
+            else:
+                self.approval_stage = "Not requested"
+        if self.approval_complete:
+            self.approval_stage = "Approved"
+        self.save(update_fields=["approval_stage", "approval_security_level", "created_on"])
 
     def get_approval_status(self):
         """
@@ -115,38 +210,41 @@ class Trip(models.Model):
             Awaiting Level 2 Approval
             Awaiting Level 3 Approval
         """
-        # check if trip is already completely approved.
         if self.approval_complete:
             return "Approved"
-
-        # Check which stage the unapproved trip is in the approval process
-        queryset = TripApproval.objects.filter(trip__id=self.id).filter(acted_upon=False)
-        if queryset:
-            # get the last approval and check for which security level it belongs.
-            queryset = queryset.order_by("-approval_request_date")[0]
-            if queryset.security_level == str(1):
-                return "Awaiting Level 1 Approval"
-            if queryset.security_level == str(2):
-                return "Awaiting Level 2 Approval"
-            return "Awaiting Level 3 Approval"
-        return 'Not requested'
+        return self.approval_stage
 
     def get_next_security_level(self):
         """
         Check which is the next approval level and return it.
         """
         # TODO probably trip needs to be approved as well
-        approvals = TripApproval.objects.filter(trip__id=self.id, is_valid=True).order_by("-approval_request_date")
-        if approvals:
-            last_approval = approvals[0]
-            if last_approval.security_level == self.security_level:
-                return None
-            return int(last_approval.security_level) + 1
-        return 1
+        if self.approval_security_level is None:
+            return 1
+        if self.approval_security_level == str(self.security_level):
+            return None
+        return int(self.approval_security_level) + 1
+
+    def save(self, *args, **kwargs):
+        """
+        Keep approval_stage in step with approval_complete.
+        """
+        if self.approval_complete:
+            self.approval_stage = "Approved"
+        elif self.approval_stage == "Approved":
+            self.approval_stage = "Not requested"
+        return super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = "Trip"
         verbose_name_plural = "Trips"
+        indexes = [
+            models.Index(fields=['start_date', 'end_date'], name='trip_start_end_date_idx'),
+            # "My Trips" lists a traveler's trips ordered by start date
+            models.Index(fields=['traveler', 'start_date', 'id'], name='trip_traveler_start_idx'),
+            # the delta sync API (trip.sync) selects the trips changed since a token
+            models.Index(fields=['created_on'], name='trip_created_on_idx'),
+        ]
 
 class TripPOET(models.Model):
     """
@@ -156,6 +254,7 @@ class TripPOET(models.Model):
     trip = models.ForeignKey(Trip, on_delete=models.PROTECT, blank=False, null=False)
     project = models.CharField(max_length=6, null=False, blank=False, db_index=True)
     task = models.CharField(max_length=3, null=False, blank=False)
+    updated_on = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.trip.trip_name
@@ -182,6 +281,56 @@ class TripTravelerDependants(models.Model):
                                     null=False, blank=False)
 
 
+class TripApprovalQuerySet(models.QuerySet):
+    """
+    Queryset for TripApproval instances that knows how to load the related trip details
+    needed by the approval list views.
+    """
+
+    def with_trip_details(self):
+        """
+        Load the trip, traveler profile and traveler user account together with the approvals
+        in a single query so that rendering each row doesn't trigger further queries.
+        """
+        return self.select_related(
+            'trip',
+            'trip__traveler',
+            'trip__traveler__user_account',
+        )
+
+    def upcoming(self, date):
+        """
+        Approvals of trips beginning after the given date.
+        """
+        return self.filter(trip__start_date__gt=date)
+
+    def ongoing(self, date):
+        """
+        Approved approvals of trips in progress on the given date.
+        """
+        return self.filter(
+            trip__start_date__lte=date,
+            trip__end_date__gte=date,
+            trip_is_approved=True,
+        )
+
+    def approvable_by(self, user):
+        """
+        Approvals of trips whose traveler the user currently approves at the approval's
+        security level, directly or by delegation.
+        """
+        return self.filter(
+            trip__traveler__approver_assignments__approver__user=user,
+            trip__traveler__approver_assignments__security_level=models.F('security_level'),
+        )
+
+    def awaiting_approval(self, user):
+        """
+        Approval requests that the user is yet to act upon.
+        """
+        return self.filter(approver__user=user, acted_upon=False, trip_is_approved=False)
+
+
 class TripApproval(models.Model):
     """
     Approvals for the Trips are capture in data models implemented in this class.
@@ -206,10 +355,25 @@ class TripApproval(models.Model):
     approval_date = models.DateField(null=True, blank=True)
     approval_comment = models.CharField(max_length=1000, null=True, blank=True,
                                 verbose_name='Comment')
+    updated_on = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = TripApprovalQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        """
+        Save the approval and update the approval state held on the trip in one transaction.
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.trip.update_approval_state()
 
     class Meta:
         verbose_name = "Trip Approval"
         verbose_name_plural = "Trips Approvals"
+        indexes = [
+            models.Index(fields=['approver', 'acted_upon', 'trip_is_approved'],
+                         name='tripapproval_queue_idx'),
+        ]
 
 
 class TripItinerary(models.Model):
@@ -236,6 +400,7 @@ class TripItinerary(models.Model):
     leg_status = models.CharField(max_length=10, null=False, blank=False,
                                 choices=LEG_STATUSES, default='Incomplete')
     comment = models.CharField(max_length=1000, blank=True, null=True)
+    updated_on = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return ", ".join([
@@ -271,3 +436,147 @@ class TripItinerary(models.Model):
     class Meta:
         verbose_name = "Trip Itinerary"
         verbose_name_plural = "Trips Itineraries"
+
+
+class OutboxEmailManager(models.Manager):
+    """
+    Manager for OutboxEmail.
+    """
+
+    def queue(self, datatuple):
+        """
+        Queue emails to be sent by the sendqueuedemails command. Takes the same datatuple of
+        (subject, text_content, html_content, from_email, recipient_list) as
+        utils.emailing.send_mass_html_mail. Call it inside the transaction that makes the
+        change the emails are about so that they are only sent if the change is committed.
+        Returns the queued OutboxEmail instances.
+        """
+        return self.bulk_create([
+            self.model(
+                subject=subject,
+                text_content=text,
+                html_content=html,
+                from_email=from_email or '',
+                recipients=",".join(recipient),
+            )
+            for subject, text, html, from_email, recipient in datatuple
+        ])
+
+    def due(self, max_attempts):
+        """
+        Unsent emails whose next attempt is due and which have attempts left.
+        """
+        return self.filter(sent_on__isnull=True, next_attempt_on__lte=timezone.now(),
+                           attempts__lt=max_attempts).order_by('next_attempt_on', 'id')
+
+
+class OutboxEmail(models.Model):
+    """
+    Emails waiting to be sent. The emails are written in the same transaction as the change
+    they notify about and sent outside the request by the sendqueuedemails command.
+    """
+    subject = models.CharField(max_length=255)
+    text_content = models.TextField()
+    html_content = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.TextField(help_text="Comma separated email addresses")
+    created_on = models.DateTimeField(auto_now_add=True)
+    next_attempt_on = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    sent_on = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    objects = OutboxEmailManager()
+
+    def __str__(self):
+        return self.subject
+
+    def get_recipients(self):
+        """Return the recipients as a list."""
+        return [recipient for recipient in self.recipients.split(",") if recipient]
+
+    def get_message(self, connection=None):
+        """
+        Build the EmailMultiAlternatives message for this email.
+        """
+        message = EmailMultiAlternatives(self.subject, self.text_content,
+                                         self.from_email or None, self.get_recipients(),
+                                         connection=connection)
+        message.attach_alternative(self.html_content, 'text/html')
+        return message
+
+    class Meta:
+        verbose_name = "Outbox Email"
+        verbose_name_plural = "Outbox Emails"
+        indexes = [
+            models.Index(fields=['sent_on', 'next_attempt_on'], name='outboxemail_due_idx'),
+        ]
+
+
+class SyncTombstoneQuerySet(models.QuerySet):
+    """
+    Queryset for SyncTombstone instances.
+    """
+
+    def record(self, instance):
+        """
+        Record the deletion of a trip, itinerary leg, POET line or approval.
+        """
+        if isinstance(instance, Trip):
+            trip_id, traveler_id = instance.id, instance.traveler_id
+        else:
+            trip_id = instance.trip_id
+            if type(instance).trip.is_cached(instance):
+                traveler_id = instance.trip.traveler_id
+            else:
+                traveler_id = Trip.objects.filter(id=trip_id).values_list(
+                    'traveler_id', flat=True).first()
+        return self.create(model_name=instance._meta.model_name, object_id=instance.id,
+                           trip_id=trip_id, traveler_id=traveler_id)
+
+    def visible_to(self, user):
+        """
+        Tombstones of the rows the user could see, as far as can be told once they are gone:
+        those of the travelers the user is, manages or approves and those of the trips the
+        user can still see. Users with the view_trip permission on the model see all.
+        """
+        if user.has_perm('trip.view_trip'):
+            return self.all()
+        travelers = TravelerProfile.objects.filter(
+            models.Q(user_account=user) |
+            models.Q(is_managed_by__user_account=user) |
+            models.Q(approver_assignments__approver__user=user)
+        ).values('id')
+        return self.filter(
+            models.Q(traveler_id__in=travelers) |
+            models.Q(trip_id__in=Trip.objects.visible_to(user).values('id'))
+        )
+
+
+class SyncTombstone(models.Model):
+    """
+    Record of a deleted trip, itinerary leg, POET line or approval, kept so that clients
+    syncing with the delta sync API (trip.sync) learn of the deletion. trip_id and
+    traveler_id aren't foreign keys since the rows they point to may be gone too.
+    """
+    MODELS = (
+        ('trip', 'Trip'),
+        ('tripitinerary', 'Trip Itinerary'),
+        ('trippoet', 'Trip POET'),
+        ('tripapproval', 'Trip Approval'),
+    )
+
+    model_name = models.CharField(max_length=20, choices=MODELS)
+    object_id = models.PositiveIntegerField()
+    trip_id = models.PositiveIntegerField()
+    traveler_id = models.PositiveIntegerField(null=True)
+    deleted_on = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = SyncTombstoneQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.model_name} {self.object_id}"
+
+    class Meta:
+        verbose_name = "Sync Tombstone"
+        verbose_name_plural = "Sync Tombstones"
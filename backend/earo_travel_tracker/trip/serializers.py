@@ -5,28 +5,35 @@ This file contains the serializers for the trip app.
 from rest_framework import serializers
 # earo_travel_tracker imports
 from trip.models import (
-    Trip, TripTravelerDependants, TripItinerary, TripApproval
+    Trip, TripTravelerDependants, TripItinerary, TripApproval, TripPOET
 )
 
 
 class TripSerializer(serializers.ModelSerializer):
     """
     This class serializes the Trip model.
+    traveler_name is read from the traveler's user account, which the queryset should load.
     """
+    traveler_name = serializers.StringRelatedField(source='traveler')
+
     class Meta:
         model = Trip
-        fields = ['traveler', 'type_of_travel', 'categories_of_travel', 'mode_of_travel',
-                'reason_for_travel', 'is_mission_critical', 'is_travel_completed']
-
+        fields = ['id', 'trip_name', 'traveler', 'traveler_name', 'type_of_travel',
+                'category_of_travel', 'reason_for_travel', 'start_date', 'end_date',
+                'is_mission_critical', 'is_travel_completed', 'security_level',
+                'approval_complete', 'approval_stage', 'created_on']
 
 
 class TripTravelerDependantsSerializer(serializers.ModelSerializer):
     """
     This class serializes the TripTravelerDependants model.
+    dependant_name is read from the dependant's user account, which the queryset should load.
     """
+    dependant_name = serializers.StringRelatedField(source='dependants_travelling')
+
     class Meta:
         model = TripTravelerDependants
-        fields = ['trip', 'dependants_travelling']
+        fields = ['id', 'trip', 'dependants_travelling', 'dependant_name']
 
 
 class TripApprovalSerializer(serializers.ModelSerializer):
@@ -35,7 +42,9 @@ class TripApprovalSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = TripApproval
-        fields = ['trip', 'approver', 'trip_is_approved', 'approval_date', 'approval_comment']
+        fields = ['id', 'trip', 'approver', 'security_level', 'approval_request_date',
+                'is_valid', 'acted_upon', 'trip_is_approved', 'approval_date',
+                'approval_comment']
 
 
 class TripItinerarySerializer(serializers.ModelSerializer):
@@ -44,5 +53,52 @@ class TripItinerarySerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = TripItinerary
-        fields = ['trip', 'date_of_departure', 'time_of_departure', 'city_of_departure',
-                'left_transit', 'leg_status', 'comment']
+        fields = ['id', 'trip', 'date_of_departure', 'time_of_departure', 'city_of_departure',
+                'destination', 'mode_of_travel', 'leg_status', 'comment']
+
+
+class TripPOETSerializer(serializers.ModelSerializer):
+    """
+    This class serializes the TripPOET model.
+    """
+    class Meta:
+        model = TripPOET
+        fields = ['id', 'trip', 'project', 'task']
+
+
+class TripItineraryBulkSerializer(TripItinerarySerializer):
+    """
+    This class deserializes the itinerary legs of a trip saved in bulk. Legs with an id change
+    that leg of the trip, the others are added to it.
+    """
+    id = serializers.IntegerField(required=False)
+
+    class Meta(TripItinerarySerializer.Meta):
+        read_only_fields = ['trip']
+
+
+class TripPOETBulkSerializer(TripPOETSerializer):
+    """
+    This class deserializes the POET lines of a trip saved in bulk. Lines with an id change
+    that line of the trip, the others are added to it.
+    """
+    id = serializers.IntegerField(required=False)
+
+    class Meta(TripPOETSerializer.Meta):
+        read_only_fields = ['trip']
+
+
+class TripDetailSerializer(TripSerializer):
+    """
+    This class serializes a Trip together with its itinerary, POET, dependants and approval
+    history. The related rows should be prefetched with Trip.objects.with_details().
+    """
+    itinerary = TripItinerarySerializer(source='tripitinerary_set', many=True, read_only=True)
+    poet = TripPOETSerializer(source='trippoet_set', many=True, read_only=True)
+    dependants = TripTravelerDependantsSerializer(source='triptravelerdependants_set',
+                                                  many=True, read_only=True)
+    trip_approvals = TripApprovalSerializer(many=True, read_only=True)
+
+    class Meta(TripSerializer.Meta):
+        fields = TripSerializer.Meta.fields + ['itinerary', 'poet', 'dependants',
+                                               'trip_approvals']
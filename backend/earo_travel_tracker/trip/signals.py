@@ -1,50 +1,76 @@
 """
 Signals for the trip app.
-Many signals will be post-save to assign various permissions.
+Owners' permissions on their trips are answered by trip.backends.TripOwnerBackend, so no
+permissions are assigned here.
 """
 import logging
 # django imports
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-# third-party app imports
-from guardian.shortcuts import assign_perm
+from django.utils import timezone
 # earo_travel_tracker imports
-from trip.models import Trip, TripPOET, TripItinerary
+from trip.models import (
+    Trip, TripItinerary, TripPOET, TripTravelerDependants, TripApproval, SyncTombstone
+)
+from trip.intervals import trip_index
 
 logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=Trip)
-def assign_trip_perms(sender, **kwargs):
+def index_trip_dates(sender, **kwargs):
     """
-    Assign the owner of a trip the rights to a trip instance.
+    Add or move the trip in the trip interval index once the transaction commits.
     """
-    if kwargs['created']:
-        trip = kwargs['instance']
-        user = trip.traveler.user_account
-        assign_perm('change_trip', user, trip)
-        assign_perm('view_trip', user, trip)
-        logger.debug("Change permission for the %s instance assigned to trip owner", sender)
+    trip = kwargs['instance']
+    transaction.on_commit(lambda: trip_index.update_trip(trip))
 
-@receiver(post_save, sender=TripPOET)
-def assign_trip_poet_perms(sender, **kwargs):
+@receiver(post_delete, sender=Trip)
+def unindex_trip_dates(sender, **kwargs):
     """
-    Assign the owner of a trip the rights to a trip instance.
+    Remove the trip from the trip interval index once the transaction commits.
     """
-    if kwargs['created']:
-        trip_poet = kwargs['instance']
-        user = trip_poet.trip.traveler.user_account
-        assign_perm('change_trippoet', user, trip_poet)
-        assign_perm('view_trippoet', user, trip_poet)
-        logger.debug("Change permission for the %s instance assigned to trip owner", sender)
+    trip_id = kwargs['instance'].id
+    transaction.on_commit(lambda: trip_index.remove_trip(trip_id))
 
 @receiver(post_save, sender=TripItinerary)
-def assign_trip_itinerary_perms(sender, **kwargs):
+def index_trip_itinerary_dates(sender, **kwargs):
     """
-    Assign the owner of a trip the rights to a trip instance.
+    Add or move the itinerary leg in the trip interval index once the transaction commits.
+    The traveler is only looked up if the index is loaded in this process.
     """
-    if kwargs['created']:
-        trip_itinerary = kwargs['instance']
-        user = trip_itinerary.trip.traveler.user_account
-        assign_perm('change_tripitinerary', user, trip_itinerary)
-        assign_perm('view_tripitinerary', user, trip_itinerary)
-        logger.debug("Change permission for the %s instance assigned to trip owner", sender)
+    trip_itinerary = kwargs['instance']
+
+    def index_leg():
+        if trip_index.is_loaded():
+            trip_index.update_leg(trip_itinerary, trip_itinerary.trip.traveler_id)
+
+    transaction.on_commit(index_leg)
+
+@receiver(post_delete, sender=TripItinerary)
+def unindex_trip_itinerary_dates(sender, **kwargs):
+    """
+    Remove the itinerary leg from the trip interval index once the transaction commits.
+    """
+    leg_id = kwargs['instance'].id
+    transaction.on_commit(lambda: trip_index.remove_leg(leg_id))
+
+@receiver([post_save, post_delete], sender=TripItinerary)
+@receiver([post_save, post_delete], sender=TripPOET)
+@receiver([post_save, post_delete], sender=TripTravelerDependants)
+def touch_trip(sender, **kwargs):
+    """
+    Stamp the trip as modified when one of its legs, POET lines or dependants changes, so that
+    conditional requests for the trip see the change.
+    """
+    Trip.objects.filter(id=kwargs['instance'].trip_id).update(created_on=timezone.now())
+
+@receiver(post_delete, sender=Trip)
+@receiver(post_delete, sender=TripItinerary)
+@receiver(post_delete, sender=TripPOET)
+@receiver(post_delete, sender=TripApproval)
+def record_sync_tombstone(sender, **kwargs):
+    """
+    Record the deletion for the clients of the delta sync API (trip.sync).
+    """
+    SyncTombstone.objects.record(kwargs['instance'])
@@ -0,0 +1,85 @@
+"""
+Delta sync of trips for offline clients.
+
+A client first syncs without a token and gets all the trips it may see, with their itinerary
+legs, POET lines and approvals, and a token. Later syncs send the token back and only get the
+rows changed since, read from the change stamps (Trip.created_on and the updated_on of the
+other models), and the ids of the rows deleted since, read from the SyncTombstone records
+the signals write. The work done therefore grows with the changes, not with the history.
+A trip that becomes visible to a user, through a new approval request or a change of the
+approver assignments, is stamped as modified and sent again with all its rows, since the
+client may never have received them.
+
+Tokens are SYNC_TOKEN_OVERLAP seconds older than the sync, so that rows committed by
+transactions still running during the sync are sent again on the next one; clients should
+apply the changes by id. Tokens older than the SYNC_TOMBSTONE_DAYS the tombstones are kept
+are answered with a full sync.
+"""
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+# earo_travel_tracker imports
+from trip.models import Trip, TripItinerary, TripPOET, TripApproval, SyncTombstone
+
+
+def encode_token(timestamp):
+    """
+    Encode the time of a sync into an opaque token.
+    """
+    return base64.urlsafe_b64encode(timestamp.isoformat().encode()).decode()
+
+
+def decode_token(token):
+    """
+    Decode a token created by encode_token into the time of the sync.
+    Raises ValueError if the token is malformed.
+    """
+    try:
+        timestamp = datetime.fromisoformat(base64.urlsafe_b64decode(token.encode()).decode())
+    except (TypeError, UnicodeError, ValueError) as error:
+        raise ValueError("Invalid token") from error
+    if timezone.is_naive(timestamp):
+        raise ValueError("Invalid token")
+    return timestamp
+
+
+def get_changes(user, token=None):
+    """
+    Return the changes the user should sync since the token, or everything without one.
+    Returns a dict holding the querysets of the changed trips, itinerary legs, POET lines and
+    approvals, the ids of the deleted rows by model name, whether this is a full sync and the
+    token of the next sync.
+    Raises ValueError if the token is malformed.
+    """
+    now = timezone.now()
+    since = decode_token(token) if token else None
+    if since is not None and since < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS):
+        # the deletions since then may have been purged
+        since = None
+    trips = Trip.objects.visible_to(user)
+    changes = {
+        'full': since is None,
+        'token': encode_token(now - timedelta(seconds=settings.SYNC_TOKEN_OVERLAP)),
+        'trips': trips.select_related('traveler__user_account'),
+        'itinerary': TripItinerary.objects.filter(trip__in=trips),
+        'poet': TripPOET.objects.filter(trip__in=trips),
+        'approvals': TripApproval.objects.filter(trip__in=trips),
+        'deleted': {model_name: [] for model_name, _ in SyncTombstone.MODELS},
+    }
+    if since is None:
+        return changes
+
+    changed_trips = changes['trips'].filter(created_on__gt=since)
+    changes['trips'] = changed_trips.order_by('created_on', 'id')
+    for key in ('itinerary', 'poet', 'approvals'):
+        changes[key] = changes[key].filter(
+            Q(updated_on__gt=since) | Q(trip__in=changed_trips.values('id'))
+        ).order_by('updated_on', 'id')
+    tombstones = SyncTombstone.objects.visible_to(user).filter(deleted_on__gt=since).order_by(
+        'deleted_on', 'id').values_list('model_name', 'object_id')
+    for model_name, object_id in tombstones:
+        changes['deleted'][model_name].append(object_id)
+    return changes
@@ -0,0 +1,295 @@
+"""
+This script defines tests for the trip REST API.
+"""
+from datetime import timedelta
+
+from django import test
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from trip.models import Trip, TripItinerary, TripPOET, TripTravelerDependants
+from trip.tests.test_views import prepare_travelers_group
+from traveler.models import Approver, TravelerProfile
+from utils.pagination import encode_cursor
+
+user_model = get_user_model()
+
+
+class BaseTripAPITestCase(test.TestCase):
+    """
+    Implement common methods shared across the trip API test cases.
+    """
+    def setUp(self):
+        prepare_travelers_group()
+        self.user = user_model.objects.create_user(username="derick", password="mwenda")
+        self.client.force_login(self.user)
+
+    def create_trip(self, user, name, days_ahead=5, **kwargs):
+        """
+        Create a trip for the user starting the given number of days from today.
+        """
+        start_date = timezone.now().date() + timedelta(days=days_ahead)
+        return Trip.objects.create(
+            trip_name=name,
+            traveler=TravelerProfile.objects.get(user_account=user),
+            type_of_travel="Domestic",
+            category_of_travel="Business",
+            reason_for_travel="Field visit",
+            start_date=start_date,
+            end_date=start_date + timedelta(days=3),
+            is_mission_critical=False,
+            **kwargs
+        )
+
+
+class TestTripAPI(BaseTripAPITestCase):
+    """
+    Tests for the trip API viewsets.
+    """
+    def get_names(self, url, params=None):
+        """
+        Return the names of the trips listed by the url.
+        """
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [trip["trip_name"] for trip in response.json()["results"]]
+
+    def test_authentication_required(self):
+        """
+        Test that anonymous users can't use the API.
+        """
+        self.client.logout()
+        response = self.client.get(reverse("trip-list"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_read_only(self):
+        """
+        Test that trips can't be changed through the API.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        response = self.client.delete(reverse("trip-detail", args=[trip.id]))
+        self.assertEqual(response.status_code, 405)
+
+    def test_owner_and_approver_scope(self):
+        """
+        Test that users see their own trips and those they approve, but no others.
+        """
+        other = user_model.objects.create_user(username="other", password="other")
+        approved = user_model.objects.create_user(username="approved", password="approved")
+        approver = Approver.objects.create(user=self.user, security_level=1)
+        self.create_trip(self.user, "Own trip", days_ahead=1)
+        self.create_trip(other, "Other trip", days_ahead=2)
+        trip = self.create_trip(approved, "Approved trip", days_ahead=3)
+        trip.request_approval(1, approver)
+        self.assertEqual(self.get_names(reverse("trip-list")), ["Approved trip", "Own trip"])
+        other_trip = Trip.objects.get(trip_name="Other trip")
+        response = self.client.get(reverse("trip-detail", args=[other_trip.id]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("tripapproval-list"))
+        self.assertEqual([approval["trip"] for approval in response.json()["results"]],
+                         [trip.id])
+
+    def test_filters(self):
+        """
+        Test filtering the trips on dates, approval status and traveler.
+        """
+        self.create_trip(self.user, "Soon", days_ahead=1)
+        self.create_trip(self.user, "Later", days_ahead=20, is_travel_completed=True)
+        url = reverse("trip-list")
+        later = timezone.now().date() + timedelta(days=10)
+        self.assertEqual(self.get_names(url, {"start_date_from": later.isoformat()}),
+                         ["Later"])
+        self.assertEqual(self.get_names(url, {"end_date_to": later.isoformat()}), ["Soon"])
+        self.assertEqual(self.get_names(url, {"is_travel_completed": "false"}), ["Soon"])
+        self.assertEqual(self.get_names(url, {"approval_stage": "Approved"}), [])
+        profile = TravelerProfile.objects.get(user_account=self.user)
+        self.assertEqual(self.get_names(url, {"traveler": profile.id}), ["Later", "Soon"])
+        for params in ({"start_date_from": "tomorrow"}, {"approval_stage": "Pending"},
+                       {"is_travel_completed": "maybe"}, {"traveler": "me"}):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_itinerary_filtered_by_trip(self):
+        """
+        Test that the legs of one trip can be listed.
+        """
+        trips = [self.create_trip(self.user, name) for name in ("First", "Second")]
+        for trip in trips:
+            TripItinerary.objects.create(
+                trip=trip, date_of_departure=trip.start_date, time_of_departure="08:00",
+                city_of_departure="Nairobi", destination="Kisumu", mode_of_travel="Air")
+        response = self.client.get(reverse("tripitinerary-list"), {"trip": trips[1].id})
+        self.assertEqual([leg["trip"] for leg in response.json()["results"]], [trips[1].id])
+
+    def test_pagination(self):
+        """
+        Test that the pages are linked by cursors and cost the same number of queries
+        whatever their size.
+        """
+        for days in range(5):
+            self.create_trip(self.user, f"Trip in {days} days", days_ahead=days)
+        url = reverse("trip-list")
+        with CaptureQueriesContext(connection) as small_page:
+            response = self.client.get(url, {"page_size": 2})
+        self.assertEqual([trip["trip_name"] for trip in response.json()["results"]],
+                         ["Trip in 4 days", "Trip in 3 days"])
+        self.assertIsNone(response.json()["previous"])
+        response = self.client.get(response.json()["next"])
+        self.assertEqual([trip["trip_name"] for trip in response.json()["results"]],
+                         ["Trip in 2 days", "Trip in 1 days"])
+        response = self.client.get(response.json()["previous"])
+        self.assertEqual([trip["trip_name"] for trip in response.json()["results"]],
+                         ["Trip in 4 days", "Trip in 3 days"])
+        with CaptureQueriesContext(connection) as large_page:
+            response = self.client.get(url, {"page_size": 5})
+        self.assertEqual(len(response.json()["results"]), 5)
+        self.assertEqual(len(small_page.captured_queries), len(large_page.captured_queries))
+        self.assertEqual(self.client.get(url, {"cursor": "nonsense"}).status_code, 404)
+        for values in (["2021-99-99", "1"], ["2021-01-01", {"id": 1}]):
+            response = self.client.get(url, {"cursor": encode_cursor(values)})
+            self.assertEqual(response.status_code, 404)
+
+    def add_details(self, trip, legs):
+        """
+        Add itinerary legs, a POET line and a dependant to the trip.
+        """
+        for leg in range(legs):
+            TripItinerary.objects.create(
+                trip=trip, date_of_departure=trip.start_date + timedelta(days=leg),
+                time_of_departure="08:00", city_of_departure=f"City {leg}",
+                destination=f"City {leg + 1}", mode_of_travel="Road")
+        TripPOET.objects.create(trip=trip, project="123456", task="001")
+        dependant = user_model.objects.create_user(
+            username=f"dependant_{trip.id}", first_name="Amani", last_name="Mwenda")
+        TripTravelerDependants.objects.create(
+            trip=trip, dependants_travelling=TravelerProfile.objects.get(user_account=dependant))
+
+    def test_full_trip(self):
+        """
+        Test that a trip is returned with its details in a fixed number of queries.
+        """
+        approver = Approver.objects.create(user=self.user, security_level=1)
+        short_trip = self.create_trip(self.user, "Short trip")
+        self.add_details(short_trip, legs=1)
+        long_trip = self.create_trip(self.user, "Long trip")
+        self.add_details(long_trip, legs=4)
+        long_trip.request_approval(1, approver)
+        with CaptureQueriesContext(connection) as short_queries:
+            self.client.get(reverse("trip-full", args=[short_trip.id]))
+        with CaptureQueriesContext(connection) as long_queries:
+            response = self.client.get(reverse("trip-full", args=[long_trip.id]))
+        self.assertEqual(len(short_queries.captured_queries), len(long_queries.captured_queries))
+        trip = response.json()
+        self.assertEqual(trip["trip_name"], "Long trip")
+        self.assertEqual([leg["city_of_departure"] for leg in trip["itinerary"]],
+                         ["City 0", "City 1", "City 2", "City 3"])
+        self.assertEqual(trip["poet"][0]["project"], "123456")
+        self.assertEqual(trip["dependants"][0]["dependant_name"], "Amani Mwenda")
+        self.assertEqual([approval["security_level"] for approval in trip["trip_approvals"]],
+                         ["1"])
+        other = user_model.objects.create_user(username="other", password="other")
+        other_trip = self.create_trip(other, "Other trip")
+        response = self.client.get(reverse("trip-full", args=[other_trip.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestConditionalGet(BaseTripAPITestCase):
+    """
+    Tests for the conditional GET of trips.
+    """
+    def assert_not_modified(self, url):
+        """
+        Test that the url answers with 304 when its ETag or Last-Modified date is sent back,
+        and return the first response.
+        """
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag_response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(etag_response.status_code, 304)
+        self.assertEqual(etag_response.content, b"")
+        date_response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(date_response.status_code, 304)
+        return response
+
+    def test_api(self):
+        """
+        Test that the trip API answers with 304 until the trip or its legs change.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        for url in (reverse("trip-detail", args=[trip.id]),
+                    reverse("trip-full", args=[trip.id])):
+            etag = self.assert_not_modified(url)["ETag"]
+            TripItinerary.objects.create(
+                trip=trip, date_of_departure=trip.start_date, time_of_departure="08:00",
+                city_of_departure="Nairobi", destination="Kisumu", mode_of_travel="Air")
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+    def test_approval_changes_etag(self):
+        """
+        Test that a new approval request changes the trip's ETag.
+        """
+        approver = Approver.objects.create(user=self.user, security_level=1)
+        trip = self.create_trip(self.user, "Own trip")
+        url = reverse("trip-detail", args=[trip.id])
+        etag = self.client.get(url)["ETag"]
+        trip.request_approval(1, approver)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["approval_stage"], "Awaiting Level 1 Approval")
+
+    def test_renames_change_etag(self):
+        """
+        Test that renaming the traveler or a dependant changes the ETags of the trip, but
+        logging in doesn't.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        dependant = user_model.objects.create_user(username="dependant", first_name="Amani")
+        TripTravelerDependants.objects.create(
+            trip=trip, dependants_travelling=TravelerProfile.objects.get(user_account=dependant))
+        urls = (reverse("trip-detail", args=[trip.id]), reverse("trip-full", args=[trip.id]))
+        for user, name in ((self.user, "Baraka"), (dependant, "Neema")):
+            Trip.objects.update(created_on=timezone.now() - timedelta(days=1))
+            etags = [self.client.get(url)["ETag"] for url in urls]
+            update_last_login(None, user)
+            self.assertEqual(self.client.get(urls[0], HTTP_IF_NONE_MATCH=etags[0]).status_code,
+                             304)
+            user.first_name = name
+            user.save()
+            for url, etag in zip(urls, etags):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["dependants"][0]["dependant_name"], "Neema ")
+        self.assertEqual(response.json()["traveler_name"], "Baraka ")
+
+    def test_not_modified_skips_details(self):
+        """
+        Test that 304 responses don't load the trip's details.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        url = reverse("trip-full", args=[trip.id])
+        etag = self.client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as full_response:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as not_modified:
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(full_response.captured_queries) - 4,
+                         len(not_modified.captured_queries))
+
+    def test_details_page(self):
+        """
+        Test that the trip details page answers with 304 and that its ETag depends on the
+        user.
+        """
+        trip = self.create_trip(self.user, "Own trip",
+                                scope_of_work="media/uploads/scope_of_work/sample.pdf")
+        url = reverse("u_trip_details", kwargs={"trip_id": trip.id})
+        etag = self.assert_not_modified(url)["ETag"]
+        manager = user_model.objects.create_superuser(
+            username="manager", password="manager", email="manager@example.org")
+        self.client.force_login(manager)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
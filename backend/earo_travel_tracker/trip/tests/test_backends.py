@@ -0,0 +1,76 @@
+"""
+Tests for the trip owner permission backend.
+"""
+from datetime import date, timedelta
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from guardian.shortcuts import assign_perm
+
+from trip.models import Trip, TripItinerary
+from traveler.models import TravelerProfile
+
+user_model = get_user_model()
+
+
+class TestTripOwnerBackend(TestCase):
+    """
+    Test that owners' permissions are answered from the trip while guardian still answers
+    permissions granted to others.
+    """
+    def setUp(self):
+        self.owner = user_model.objects.create_user(username='owner', password='12345')
+        self.other = user_model.objects.create_user(username='other', password='12345')
+        start_date = date.today() + timedelta(days=1)
+        self.trip = Trip.objects.create(
+            trip_name="Test Trip Name",
+            traveler=TravelerProfile.objects.get(user_account=self.owner),
+            type_of_travel="Domestic",
+            category_of_travel="Business",
+            reason_for_travel="This is a test trip",
+            start_date=start_date,
+            end_date=start_date + timedelta(days=10),
+            is_mission_critical=False,
+        )
+        self.leg = TripItinerary.objects.create(
+            trip=self.trip, date_of_departure=start_date, time_of_departure="08:00",
+            city_of_departure="Nairobi", destination="Kisumu", mode_of_travel="Air")
+
+    def get_user(self, user):
+        """Return a fresh instance of the user, as a new request would."""
+        return user_model.objects.get(id=user.id)
+
+    def test_owner_permissions(self):
+        """
+        Test that the owner can view and change the trip and its legs but not delete them.
+        """
+        owner = self.get_user(self.owner)
+        self.assertTrue(owner.has_perm('trip.view_trip', self.trip))
+        self.assertTrue(owner.has_perm('change_trip', self.trip))
+        self.assertFalse(owner.has_perm('trip.delete_trip', self.trip))
+        leg = TripItinerary.objects.get(id=self.leg.id)
+        self.assertTrue(owner.has_perm('trip.change_tripitinerary', leg))
+        self.assertFalse(owner.has_perm('trip.view_trip'))
+
+    def test_other_users(self):
+        """
+        Test that other users only have the permissions guardian grants them.
+        """
+        other = self.get_user(self.other)
+        self.assertFalse(other.has_perm('trip.view_trip', self.trip))
+        assign_perm('trip.view_trip', self.other, self.trip)
+        other = self.get_user(self.other)
+        self.assertTrue(other.has_perm('trip.view_trip', self.trip))
+        self.assertFalse(other.has_perm('trip.change_trip', self.trip))
+
+    def test_owner_cached_per_user(self):
+        """
+        Test that the owner of a trip is looked up once per user instance.
+        """
+        owner = self.get_user(self.owner)
+        trip = Trip.objects.get(id=self.trip.id)
+        leg = TripItinerary.objects.get(id=self.leg.id)
+        with self.assertNumQueries(1):
+            self.assertTrue(owner.has_perm('trip.view_trip', trip))
+            self.assertTrue(owner.has_perm('trip.change_trip', trip))
+            self.assertTrue(owner.has_perm('trip.view_tripitinerary', leg))
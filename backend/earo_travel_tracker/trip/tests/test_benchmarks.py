@@ -0,0 +1,114 @@
+"""
+Tests for the sample data generator and the view benchmark commands.
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+import mock
+
+from django.test import TransactionTestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpResponseServerError
+from guardian.shortcuts import get_perms
+
+from traveler.models import Approver, ApproverAssignment, TravelerProfile
+from trip.intervals import trip_index
+from trip.models import Trip, TripApproval
+from trip.views import TripListView
+
+user_model = get_user_model()
+
+
+class TestBenchmarkCommands(TransactionTestCase):
+    """
+    Test generating sample data and benchmarking the views against it.
+    """
+    def setUp(self):
+        trip_index.clear()
+        call_command('generatesampledata', users=30, approvers=6, departments=3, countries=4,
+                     trips_per_traveler=3, delegations=2, stdout=StringIO(), stderr=StringIO())
+
+    def tearDown(self):
+        trip_index.clear()
+
+    def test_generated_data(self):
+        """
+        Test that the generated rows are related as the app would relate them.
+        """
+        self.assertEqual(TravelerProfile.objects.filter(
+            user_account__username__startswith='sample_').count(), 30)
+        self.assertEqual(Approver.objects.count(), 6)
+        self.assertEqual(Trip.objects.count(), 90)
+        self.assertFalse(Trip.objects.filter(tripitinerary__isnull=True).exists())
+        self.assertFalse(Trip.objects.filter(trippoet__isnull=True).exists())
+        self.assertTrue(user_model.objects.get(username='sample_admin').is_superuser)
+        travelers = Group.objects.get(name='travelers')
+        self.assertIn('add_trip', travelers.permissions.values_list('codename', flat=True))
+        self.assertTrue(travelers.user_set.filter(username='sample_3').exists())
+        self.assertTrue(Group.objects.get(name='approvers').user_set.filter(
+            approver__isnull=False).exists())
+        traveler = TravelerProfile.objects.get(user_account__username='sample_3')
+        self.assertEqual(get_perms(traveler.user_account, traveler), ['change_travelerprofile'])
+        self.assertEqual(ApproverAssignment.objects.filter(traveler=traveler).count(), 3)
+        self.assertTrue(TripApproval.objects.filter(acted_upon=False, is_valid=True).exists())
+
+    def test_approval_state(self):
+        """
+        Test that the approval state of the trips matches their approval history.
+        """
+        trips = list(Trip.objects.all())
+        states = [(trip.approval_stage, trip.approval_security_level) for trip in trips]
+        for trip in trips:
+            trip.update_approval_state()
+        self.assertEqual(states, [(trip.approval_stage, trip.approval_security_level)
+                                  for trip in trips])
+        self.assertGreater(len({stage for stage, _ in states}), 2)
+
+    def test_existing_prefix(self):
+        """
+        Test that generating data under a prefix already used fails while another prefix
+        adds to the data.
+        """
+        with self.assertRaises(CommandError):
+            call_command('generatesampledata', users=2, approvers=2, stdout=StringIO())
+        call_command('generatesampledata', users=2, approvers=2, prefix='other',
+                     stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Trip.objects.count(), 100)
+
+    def test_benchmark_output(self):
+        """
+        Test that the benchmark writes the latency and query counts of each endpoint.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark.json')
+            call_command('benchmarkviews', requests=2, warmup=0, output=output,
+                         endpoints=['my_trips', 'trip_itinerary', 'awaiting_approval',
+                                    'travelers'],
+                         stdout=StringIO(), stderr=StringIO())
+            with open(output) as output_file:
+                results = json.load(output_file)
+        self.assertEqual(set(results['endpoints']),
+                         {'my_trips', 'trip_itinerary', 'awaiting_approval', 'travelers'})
+        for result in results['endpoints'].values():
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries']['p50'], 0)
+            self.assertGreaterEqual(result['latency_ms']['p95'], result['latency_ms']['p50'])
+
+    def test_benchmark_failures(self):
+        """
+        Test that an endpoint raising an error stops the benchmark and that one responding
+        with an error fails it.
+        """
+        with mock.patch.object(TripListView, 'get', side_effect=ValueError('broken')):
+            with self.assertRaises(ValueError):
+                call_command('benchmarkviews', requests=1, warmup=0, endpoints=['my_trips'],
+                             stdout=StringIO(), stderr=StringIO())
+        with mock.patch.object(TripListView, 'get', return_value=HttpResponseServerError()):
+            with self.assertRaisesMessage(CommandError, 'my_trips (500)'):
+                call_command('benchmarkviews', requests=1, warmup=0,
+                             endpoints=['my_trips', 'travelers'], stdout=StringIO(),
+                             stderr=StringIO())
@@ -0,0 +1,200 @@
+"""
+This script defines tests for the bulk saving of itinerary legs and POET lines.
+"""
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from guardian.models import UserObjectPermission
+
+from trip.models import Trip, TripItinerary, TripPOET
+from trip.tests.test_api import BaseTripAPITestCase, user_model
+from traveler.models import Approver
+
+
+class TestBulkAPI(BaseTripAPITestCase):
+    """
+    Tests for the bulk itinerary and POET endpoints of the trip API.
+    """
+    def make_legs(self, trip, count, **kwargs):
+        """
+        Return the data of count legs, one per day from the trip's start date.
+        """
+        return [dict({
+            "date_of_departure": (trip.start_date + timedelta(days=day)).isoformat(),
+            "time_of_departure": "08:00",
+            "city_of_departure": f"City {day}",
+            "destination": f"City {day + 1}",
+            "mode_of_travel": "Road",
+        }, **kwargs) for day in range(count)]
+
+    def post(self, url, data):
+        """
+        Post the data as JSON to the url.
+        """
+        return self.client.post(url, data, content_type="application/json")
+
+    def test_create_itinerary(self):
+        """
+        Test that the legs are inserted together in a number of queries that doesn't grow
+        with the legs.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        other_trip = self.create_trip(self.user, "Other trip", days_ahead=20)
+        url = reverse("trip-itinerary", args=[trip.id])
+        with CaptureQueriesContext(connection) as one_leg:
+            self.post(reverse("trip-itinerary", args=[other_trip.id]),
+                      self.make_legs(other_trip, 1))
+        with CaptureQueriesContext(connection) as many_legs:
+            response = self.post(url, self.make_legs(trip, 4))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(one_leg.captured_queries), len(many_legs.captured_queries))
+        self.assertEqual([leg["city_of_departure"] for leg in response.json()],
+                         ["City 0", "City 1", "City 2", "City 3"])
+        self.assertEqual(TripItinerary.objects.filter(trip=trip).count(), 4)
+        self.assertGreater(Trip.objects.get(id=trip.id).created_on, trip.created_on)
+        self.assertFalse(UserObjectPermission.objects.filter(user=self.user).exclude(
+            content_type__model="travelerprofile").exists())
+
+    def test_update_itinerary(self):
+        """
+        Test that legs with an id are changed and the others added.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        self.post(reverse("trip-itinerary", args=[trip.id]), self.make_legs(trip, 2))
+        legs = list(TripItinerary.objects.filter(trip=trip).order_by("id"))
+        data = self.make_legs(trip, 2, id=legs[1].id, city_of_departure="Mombasa")[1:]
+        data += self.make_legs(trip, 1, time_of_departure="14:00")
+        response = self.post(reverse("trip-itinerary", args=[trip.id]), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(leg["city_of_departure"], leg["time_of_departure"])
+                          for leg in response.json()],
+                         [("City 0", "08:00:00"), ("City 0", "14:00:00"),
+                          ("Mombasa", "08:00:00")])
+        changed = TripItinerary.objects.get(id=legs[1].id)
+        self.assertGreater(changed.updated_on, legs[1].updated_on)
+
+    def test_invalid_itinerary(self):
+        """
+        Test that nothing is saved when a leg is outside the trip dates, departs with another
+        leg or isn't a leg of the trip.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        other_trip = self.create_trip(self.user, "Other trip", days_ahead=20)
+        other_leg = TripItinerary.objects.create(
+            trip=other_trip, date_of_departure=other_trip.start_date,
+            time_of_departure="08:00", city_of_departure="Nairobi", destination="Kisumu",
+            mode_of_travel="Air")
+        url = reverse("trip-itinerary", args=[trip.id])
+        response = self.post(url, self.make_legs(trip, 5))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()[4]), ["date_of_departure"])
+        self.assertEqual(response.json()[:4], [{}, {}, {}, {}])
+        response = self.post(url, self.make_legs(trip, 1) * 2)
+        self.assertEqual(list(response.json()[1]), ["time_of_departure"])
+        response = self.post(url, self.make_legs(trip, 1, id=other_leg.id))
+        self.assertEqual(list(response.json()[0]), ["id"])
+        response = self.post(url, {"city_of_departure": "Nairobi"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(TripItinerary.objects.filter(trip=trip).exists())
+
+    def test_only_owner_saves(self):
+        """
+        Test that approvers can't change the rows of the trips they see, nor users those of
+        trips they don't.
+        """
+        traveler = user_model.objects.create_user(username="traveler")
+        approver = Approver.objects.create(user=self.user, security_level=1)
+        trip = self.create_trip(traveler, "Approved trip")
+        trip.request_approval(1, approver)
+        other_trip = self.create_trip(user_model.objects.create_user(username="other"), "Other")
+        response = self.post(reverse("trip-itinerary", args=[trip.id]),
+                             self.make_legs(trip, 1))
+        self.assertEqual(response.status_code, 403)
+        response = self.post(reverse("trip-poet", args=[other_trip.id]),
+                             [{"project": "123456", "task": "001"}])
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(TripItinerary.objects.exists())
+
+    def test_poet(self):
+        """
+        Test that POET lines are saved in bulk and the same project and task isn't charged
+        twice.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        url = reverse("trip-poet", args=[trip.id])
+        response = self.post(url, [{"project": "123456", "task": "001"},
+                                   {"project": "123456", "task": "002"}])
+        self.assertEqual([line["task"] for line in response.json()], ["001", "002"])
+        response = self.post(url, [{"project": "123456", "task": "001"}])
+        self.assertEqual(list(response.json()[0]), ["task"])
+        line = TripPOET.objects.get(trip=trip, task="002")
+        response = self.post(url, [{"id": line.id, "project": "654321", "task": "002"}])
+        self.assertEqual([line["project"] for line in response.json()], ["123456", "654321"])
+
+
+class TestBulkViews(BaseTripAPITestCase):
+    """
+    Tests for the formset views editing the itinerary and POET lines of a trip.
+    """
+    def get_formset_data(self, prefix, rows, initial=0):
+        """
+        Return the post data of a formset with the rows.
+        """
+        data = {f"{prefix}-TOTAL_FORMS": len(rows), f"{prefix}-INITIAL_FORMS": initial,
+                f"{prefix}-MIN_NUM_FORMS": 0, f"{prefix}-MAX_NUM_FORMS": 1000}
+        for index, row in enumerate(rows):
+            for field, value in row.items():
+                data[f"{prefix}-{index}-{field}"] = value
+        return data
+
+    def get_leg(self, trip, days, time="08:00"):
+        """
+        Return the form data of a leg departing the given number of days into the trip.
+        """
+        return {"date_of_departure": (trip.start_date + timedelta(days=days)).isoformat(),
+                "time_of_departure": time, "city_of_departure": "Nairobi",
+                "destination": "Kisumu", "mode_of_travel": "Air", "comment": ""}
+
+    def test_itinerary_formset(self):
+        """
+        Test that the itinerary is saved from the formset and redirected to the trip.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        url = reverse("u_bulk_trip_itinerary", kwargs={"trip_id": trip.id})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        rows = [self.get_leg(trip, 0), self.get_leg(trip, 1), {}]
+        response = self.client.post(url, self.get_formset_data("tripitinerary_set", rows))
+        self.assertRedirects(response, trip.get_absolute_url(), fetch_redirect_response=False)
+        self.assertEqual(TripItinerary.objects.filter(trip=trip).count(), 2)
+
+    def test_invalid_itinerary_formset(self):
+        """
+        Test that no leg is saved when one is outside the trip dates.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        url = reverse("u_bulk_trip_itinerary", kwargs={"trip_id": trip.id})
+        rows = [self.get_leg(trip, 0), self.get_leg(trip, 10)]
+        response = self.client.post(url, self.get_formset_data("tripitinerary_set", rows))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["formset"].errors[0], {})
+        self.assertIn("date_of_departure", response.context["formset"].errors[1])
+        self.assertFalse(TripItinerary.objects.exists())
+
+    def test_poet_formset(self):
+        """
+        Test that saved POET lines are changed and new ones added, and that only the owner of
+        the trip may edit them.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        line = TripPOET.objects.create(trip=trip, project="123456", task="001")
+        url = reverse("u_bulk_trip_poet", kwargs={"trip_id": trip.id})
+        rows = [{"id": line.id, "trip": trip.id, "project": "123456", "task": "002"},
+                {"project": "654321", "task": "001"}]
+        response = self.client.post(url, self.get_formset_data("trippoet_set", rows, 1))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(sorted(TripPOET.objects.values_list("project", "task")),
+                         [("123456", "002"), ("654321", "001")])
+        self.client.force_login(user_model.objects.create_user(username="other"))
+        self.assertEqual(self.client.get(url).status_code, 403)
@@ -0,0 +1,237 @@
+"""
+Tests for the database configuration and the PostgreSQL connection pool.
+"""
+import sqlite3
+import tempfile
+import unittest
+from io import StringIO
+
+import mock
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase
+
+from utils.database import get_databases
+from utils.postgresql.pool import ConnectionPool
+from utils.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+
+try:
+    from utils.postgresql.base import DatabaseWrapper
+except Exception:  # psycopg2 isn't installed
+    DatabaseWrapper = None
+
+
+class TestDatabaseProfiles(SimpleTestCase):
+    """
+    Test building the DATABASES setting from the environment.
+    """
+    def test_sqlite_default(self):
+        """
+        Test that the bundled SQLite database is used without any configuration.
+        """
+        databases = get_databases('/app', environ={})
+        self.assertEqual(databases['default']['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(databases['default']['NAME'], '/app/db.sqlite3')
+
+    def test_sqlite_wal(self):
+        """
+        Test the opt-in SQLite profile in WAL mode.
+        """
+        database = get_databases('/app', environ={
+            'DATABASE_ENGINE': 'sqlite-wal', 'DATABASE_BUSY_TIMEOUT': '2000'})['default']
+        self.assertEqual(database['ENGINE'], 'utils.sqlite3')
+        self.assertEqual(database['NAME'], '/app/db.sqlite3')
+        self.assertEqual(database['PRAGMAS']['journal_mode'], 'WAL')
+        self.assertEqual(database['PRAGMAS']['busy_timeout'], 2000)
+        self.assertEqual(database['OPTIONS'], {'timeout': 2})
+        self.assertEqual(database['TRANSACTION_MODE'], 'IMMEDIATE')
+
+    def test_postgresql(self):
+        """
+        Test the PostgreSQL profile with persistent, health checked connections.
+        """
+        databases = get_databases('/app', environ={
+            'DATABASE_ENGINE': 'postgresql', 'DATABASE_NAME': 'travel', 'DATABASE_HOST': 'db',
+            'DATABASE_CONN_MAX_AGE': '120'}, password='secret')
+        database = databases['default']
+        self.assertEqual(database['ENGINE'], 'utils.postgresql')
+        self.assertEqual((database['NAME'], database['HOST']), ('travel', 'db'))
+        self.assertEqual(database['PASSWORD'], 'secret')
+        self.assertEqual(database['CONN_MAX_AGE'], 120)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertIsNone(database['POOL'])
+
+    def test_postgresql_pool(self):
+        """
+        Test that pooled connections aren't kept by the request threads.
+        """
+        database = get_databases('/app', environ={
+            'DATABASE_ENGINE': 'postgresql', 'DATABASE_POOL_SIZE': '8'})['default']
+        self.assertEqual(database['POOL'], {'MAX_IDLE': 8})
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+
+    def test_unknown_profile(self):
+        """
+        Test that an unknown engine is refused.
+        """
+        with self.assertRaises(ValueError):
+            get_databases('/app', environ={'DATABASE_ENGINE': 'oracle'})
+
+
+class TestConnectionPool(SimpleTestCase):
+    """
+    Test keeping idle connections in the pool.
+    """
+    def setUp(self):
+        self.pool = ConnectionPool()
+
+    def test_reuse(self):
+        """
+        Test that a released connection is rolled back and handed out again.
+        """
+        connection = mock.MagicMock()
+        self.pool.release('db', connection, max_idle=2)
+        connection.rollback.assert_called_once_with()
+        self.assertIs(self.pool.acquire('db', idle_timeout=60), connection)
+        self.assertIsNone(self.pool.acquire('db', idle_timeout=60))
+        self.assertIsNone(self.pool.acquire('other', idle_timeout=60))
+
+    def test_broken_connections_discarded(self):
+        """
+        Test that connections failing the rollback or the check are closed, not reused.
+        """
+        broken = mock.MagicMock()
+        broken.rollback.side_effect = Exception
+        self.pool.release('db', broken, max_idle=2)
+        broken.close.assert_called_once_with()
+        dropped = mock.MagicMock()
+        self.pool.release('db', dropped, max_idle=2)
+        dropped.cursor.side_effect = Exception
+        self.assertIsNone(self.pool.acquire('db', idle_timeout=60))
+        dropped.close.assert_called_once_with()
+
+    def test_limits(self):
+        """
+        Test that the pool is bounded and doesn't hand out connections idle for too long.
+        """
+        connections = [mock.MagicMock() for _ in range(3)]
+        for connection in connections:
+            self.pool.release('db', connection, max_idle=2)
+        connections[2].close.assert_called_once_with()
+        self.assertIsNone(self.pool.acquire('db', idle_timeout=-1))
+        for connection in connections[:2]:
+            connection.close.assert_called_once_with()
+
+
+@unittest.skipIf(DatabaseWrapper is None, "psycopg2 isn't installed")
+class TestPooledDatabaseWrapper(SimpleTestCase):
+    """
+    Test that the PostgreSQL backend takes connections from the pool and returns them there.
+    """
+    def get_wrapper(self, **settings):
+        settings_dict = {
+            'ENGINE': 'utils.postgresql', 'NAME': 'travel', 'USER': '', 'PASSWORD': '',
+            'HOST': '', 'PORT': '', 'OPTIONS': {}, 'ATOMIC_REQUESTS': False, 'AUTOCOMMIT': True,
+            'CONN_MAX_AGE': 0, 'TIME_ZONE': None, 'TEST': {}, **settings,
+        }
+        wrapper = DatabaseWrapper(settings_dict, alias='pool_test')
+        wrapper.pool = ConnectionPool()
+        return wrapper
+
+    def test_close_releases(self):
+        """
+        Test that closing a pooled connection keeps it open for the next connect.
+        """
+        wrapper = self.get_wrapper(POOL={'MAX_IDLE': 2})
+        connection = mock.MagicMock()
+        wrapper.connection = connection
+        wrapper.close()
+        connection.close.assert_not_called()
+        self.assertIsNone(wrapper.connection)
+        self.assertIs(wrapper.get_new_connection({}), connection)
+
+    def test_unpooled_close(self):
+        """
+        Test that connections are closed when pooling isn't configured.
+        """
+        wrapper = self.get_wrapper()
+        connection = mock.MagicMock()
+        wrapper.connection = connection
+        wrapper.close()
+        connection.close.assert_called_once_with()
+
+    def test_health_check(self):
+        """
+        Test that a persistent connection that stopped working is replaced on first use in
+        a request.
+        """
+        wrapper = self.get_wrapper(CONN_HEALTH_CHECKS=True, CONN_MAX_AGE=60)
+        connection = wrapper.connection = mock.MagicMock()
+        wrapper.autocommit = True
+        wrapper.close_if_unusable_or_obsolete()
+        self.assertIs(wrapper.connection, connection)
+        with mock.patch.object(wrapper, 'is_usable', return_value=False), \
+                mock.patch.object(wrapper, 'connect') as connect:
+            wrapper.ensure_connection()
+        connection.close.assert_called_once_with()
+        connect.assert_called_once_with()
+
+
+class TestSQLiteDatabaseWrapper(SimpleTestCase):
+    """
+    Test that the SQLite backend tunes its connections and takes the write lock early.
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = get_databases(directory.name, environ={
+            'DATABASE_ENGINE': 'sqlite-wal', 'DATABASE_BUSY_TIMEOUT': '0'})['default']
+        settings_dict.update({'ATOMIC_REQUESTS': False, 'AUTOCOMMIT': True, 'CONN_MAX_AGE': 0,
+                              'TIME_ZONE': None, 'USER': '', 'PASSWORD': '', 'HOST': '',
+                              'PORT': '', 'TEST': {}})
+        self.path = settings_dict['NAME']
+        self.wrapper = SQLiteDatabaseWrapper(settings_dict, alias='sqlite_test')
+        self.addCleanup(self.wrapper.close)
+
+    def test_pragmas(self):
+        """
+        Test that the pragmas are set on new connections.
+        """
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            # NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_immediate_transactions(self):
+        """
+        Test that an atomic block holds the write lock before it writes.
+        """
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE trip (name TEXT)')
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        # what atomic() does when it begins a transaction
+        self.wrapper._start_transaction_under_autocommit()
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute("INSERT INTO trip VALUES ('Kisumu')")
+        self.wrapper.rollback()
+        other.execute("INSERT INTO trip VALUES ('Kisumu')")
+        other.commit()
+
+
+class TestBenchmarkSQLite(TransactionTestCase):
+    """
+    Test the concurrent write benchmark of the SQLite profiles.
+    """
+    def test_benchmark(self):
+        """
+        Test that both profiles are benchmarked on their own database.
+        """
+        output = StringIO()
+        call_command('benchmarksqlite', threads=2, readers=1, trips=2, stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]], ['sqlite', 'sqlite-wal'])
+        # no transaction failed on a lock
+        for line in lines[1:]:
+            self.assertEqual(line.split()[3], '0')
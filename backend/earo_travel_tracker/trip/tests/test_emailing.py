@@ -0,0 +1,108 @@
+"""
+Tests for rendering and sending the trip emails.
+"""
+from django.test import SimpleTestCase
+
+from utils.emailing import (
+    send_mass_html_mail, SMTPConnectionPool, PooledEmailBackend, get_email_template,
+    render_email,
+)
+from utils.smtp_sink import SMTPSink
+
+
+class TestPooledEmailBackend(SimpleTestCase):
+    """
+    Test that PooledEmailBackend reuses connections and recovers from dropped ones.
+    """
+    def setUp(self):
+        self.sink = SMTPSink().__enter__()
+        self.pool = SMTPConnectionPool(max_idle=2, idle_timeout=60)
+
+    def tearDown(self):
+        self.pool.clear()
+        self.sink.__exit__()
+
+    def get_backend(self):
+        backend = PooledEmailBackend(host=self.sink.host, port=self.sink.port, username='',
+                                     password='', use_tls=False, use_ssl=False)
+        backend.pool = self.pool
+        return backend
+
+    def send(self, backend=None):
+        return send_mass_html_mail(
+            [("Subject", "Text", "<p>Text</p>", "tracker@example.com", ["a@example.com"])],
+            connection=backend or self.get_backend(),
+        )
+
+    def test_connection_reused(self):
+        """
+        Test that consecutive sends share one connection.
+        """
+        for _ in range(3):
+            self.assertEqual(self.send(), 1)
+        self.assertEqual(self.sink.messages, 3)
+        self.assertEqual(self.sink.connections, 1)
+
+    def test_pooled_connection_dropped(self):
+        """
+        Test that a pooled connection that has been dropped is replaced.
+        """
+        self.send()
+        key = self.get_backend().get_pool_key()
+        self.pool.idle[key][0][0].close()
+        self.assertEqual(self.send(), 1)
+        self.assertEqual(self.sink.connections, 2)
+
+    def test_connection_dropped_while_sending(self):
+        """
+        Test that an email is sent again over a new connection if the connection drops.
+        """
+        backend = self.get_backend()
+        backend.open()
+        backend.connection.close()
+        self.assertEqual(self.send(backend), 1)
+        self.assertEqual(self.sink.messages, 1)
+
+    def test_idle_timeout(self):
+        """
+        Test that connections idle for longer than the timeout are not reused.
+        """
+        self.pool.idle_timeout = 0
+        self.send()
+        self.send()
+        self.assertEqual(self.sink.connections, 2)
+
+
+class TestEmailTemplate(SimpleTestCase):
+    """
+    Test rendering the html and plain text parts of emails.
+    """
+    def test_render(self):
+        """
+        Test that the plain text part comes from the text template and isn't escaped.
+        """
+        text, html = render_email("no_approver", {"recipient": "Tom & Jerry", "security_level": 2})
+        self.assertTrue(text.startswith("Dear Tom & Jerry,"))
+        self.assertIn("security level 2.", text)
+        self.assertNotIn("<p", text)
+        self.assertIn("Dear Tom &amp; Jerry,", html)
+
+    def test_render_batch(self):
+        """
+        Test that a batch renders each recipient's context over the common context.
+        """
+        rendered = get_email_template("no_approver").render_batch(
+            [{"recipient": "Ann"}, {"recipient": "Bob", "security_level": 3}],
+            common_context={"security_level": 2},
+        )
+        self.assertEqual(len(rendered), 2)
+        self.assertIn("Dear Ann,", rendered[0][0])
+        self.assertIn("security level 2.", rendered[0][0])
+        self.assertIn("Dear Bob,", rendered[1][0])
+        self.assertIn("security level 3.", rendered[1][0])
+
+    def test_templates_compiled_once(self):
+        """
+        Test that the compiled templates are reused.
+        """
+        self.assertIs(get_email_template("no_approver"), get_email_template("no_approver"))
@@ -0,0 +1,80 @@
+"""
+Tests for the per-request query and timing statistics.
+"""
+import json
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from utils.instrumentation import get_fingerprint, request_stats
+
+user_model = get_user_model()
+
+
+@override_settings(REQUEST_STATS_SAMPLE_RATE=1)
+class TestRequestStats(TestCase):
+    """
+    Test that the middleware measures requests and staff can read the aggregates.
+    """
+    def setUp(self):
+        request_stats.clear()
+        self.user = user_model.objects.create_user(username='traveler', password='12345')
+        self.staff = user_model.objects.create_user(username='staff', password='12345',
+                                                    is_staff=True)
+
+    def tearDown(self):
+        request_stats.clear()
+
+    def test_fingerprint(self):
+        """
+        Test that queries differing only in parameters share a fingerprint.
+        """
+        self.assertEqual(
+            get_fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s) AND "b" = 3'),
+            get_fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s) AND "b" = 4'))
+        self.assertEqual(get_fingerprint("SELECT 'it''s'"), "SELECT ?")
+
+    def test_request_measured(self):
+        """
+        Test that a page's queries and template rendering are recorded under its URL name.
+        """
+        self.client.force_login(self.user)
+        self.client.get(reverse('u_list_my_trips'))
+        self.client.get(reverse('u_list_my_trips'))
+        stats = request_stats.get_aggregates()['u_list_my_trips']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreater(stats['queries']['max'], 0)
+        self.assertGreater(stats['render_time']['max'], 0)
+
+    @override_settings(REQUEST_STATS_MAX_QUERIES=0)
+    def test_threshold_logged(self):
+        """
+        Test that requests over the query threshold are logged.
+        """
+        self.client.force_login(self.user)
+        with self.assertLogs('utils.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('u_list_my_trips'))
+        self.assertIn('u_list_my_trips', logs.output[0])
+
+    @override_settings(REQUEST_STATS_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        """
+        Test that requests outside the sample aren't measured.
+        """
+        self.client.force_login(self.user)
+        self.client.get(reverse('u_list_my_trips'))
+        self.assertEqual(request_stats.get_aggregates(), {})
+
+    def test_staff_only(self):
+        """
+        Test that only staff can read the aggregates.
+        """
+        self.client.force_login(self.user)
+        self.client.get(reverse('u_list_my_trips'))
+        response = self.client.get(reverse('request_stats'))
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('request_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('u_list_my_trips', json.loads(response.content))
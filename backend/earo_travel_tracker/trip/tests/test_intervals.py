@@ -0,0 +1,198 @@
+"""
+Tests for the trip interval index.
+"""
+import random
+from datetime import date, timedelta
+
+from django.test import Client, SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.urls import reverse
+
+from trip.forms import TripForm
+from trip.intervals import IntervalTree, trip_index
+from trip.models import Trip, TripItinerary
+from traveler.models import TravelerProfile
+
+user_model = get_user_model()
+
+
+class TestIntervalTree(SimpleTestCase):
+    """
+    Test the interval tree against a brute force search.
+    """
+    def test_overlapping_matches_brute_force(self):
+        """
+        Test that overlap queries return the same intervals as scanning all of them,
+        after inserts, moves and removals.
+        """
+        rng = random.Random(7)
+        tree = IntervalTree()
+        intervals = {}
+        for key in range(300):
+            start = rng.randint(0, 1000)
+            intervals[key] = (start, start + rng.randint(0, 30))
+            tree.add(key, *intervals[key], key)
+        for key in rng.sample(list(intervals), 100):
+            tree.remove(key)
+            del intervals[key]
+        for key in rng.sample(list(intervals), 50):
+            start = rng.randint(0, 1000)
+            intervals[key] = (start, start + rng.randint(0, 30))
+            tree.add(key, *intervals[key], key)
+
+        self.assertEqual(len(tree), len(intervals))
+        for _ in range(200):
+            start = rng.randint(-10, 1040)
+            end = start + rng.randint(0, 20)
+            expected = {key for key, (low, high) in intervals.items()
+                        if low <= end and high >= start}
+            self.assertEqual(set(tree.overlapping(start, end)), expected)
+
+
+class TestTripIntervalIndex(TransactionTestCase):
+    """
+    Test that the trip index follows saved and deleted trips and is used by TripForm.
+    A TransactionTestCase is used since the index is updated when transactions commit.
+    """
+    def setUp(self):
+        trip_index.clear()
+        user = user_model.objects.create_user(username="traveler", password="traveler")
+        self.traveler = TravelerProfile.objects.get(user_account=user)
+        self.start_date = date.today() + timedelta(days=10)
+        self.trip = self.create_trip(self.start_date, self.start_date + timedelta(days=5))
+
+    def tearDown(self):
+        trip_index.clear()
+
+    def create_trip(self, start_date, end_date):
+        """Create a trip for the traveler."""
+        return Trip.objects.create(
+            trip_name="Field visit",
+            traveler=self.traveler,
+            type_of_travel="Domestic",
+            category_of_travel="Business",
+            reason_for_travel="Field visit",
+            start_date=start_date,
+            end_date=end_date,
+            is_mission_critical=False,
+        )
+
+    def test_point_and_range_queries(self):
+        """
+        Test the travelers in the field on a date and the trips within a range.
+        """
+        self.assertEqual(trip_index.travelers_on(self.start_date + timedelta(days=2)),
+                         {self.traveler.id})
+        self.assertEqual(trip_index.travelers_on(self.start_date - timedelta(days=1)), set())
+        later_trip = self.create_trip(self.start_date + timedelta(days=20),
+                                      self.start_date + timedelta(days=22))
+        self.assertEqual(
+            {trip.trip_id for trip in trip_index.trips_between(
+                self.start_date, self.start_date + timedelta(days=30))},
+            {self.trip.id, later_trip.id})
+
+    def test_index_follows_changes(self):
+        """
+        Test that moved and deleted trips and legs are updated in a loaded index without
+        reloading it.
+        """
+        trip_index.ensure_loaded()
+        leg = TripItinerary.objects.create(
+            trip=self.trip, date_of_departure=self.start_date, time_of_departure="08:00",
+            city_of_departure="Nairobi", destination="Kisumu", mode_of_travel="Air")
+        self.trip.start_date = self.start_date + timedelta(days=3)
+        self.trip.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(trip_index.travelers_on(self.start_date), set())
+            self.assertEqual([found.leg_id for found in trip_index.legs_between(
+                self.start_date, self.start_date)], [leg.id])
+        leg.delete()
+        self.trip.delete()
+        self.assertEqual(trip_index.legs_between(self.start_date, self.start_date), [])
+        self.assertEqual(trip_index.trips_on(self.start_date + timedelta(days=4)), [])
+
+    def test_form_rejects_overlapping_trip(self):
+        """
+        Test that TripForm rejects a trip overlapping another trip of the traveler
+        but accepts edits of the same trip.
+        """
+        data = {
+            "trip_name": "Another visit",
+            "type_of_travel": "Domestic",
+            "category_of_travel": "Business",
+            "reason_for_travel": "Field visit",
+            "start_date": self.start_date + timedelta(days=4),
+            "end_date": self.start_date + timedelta(days=8),
+            "is_mission_critical": False,
+            "security_level": "1",
+        }
+        form = TripForm(data, traveler=self.traveler)
+        self.assertFalse(form.is_valid())
+        self.assertIn("overlap", form.non_field_errors()[0])
+
+        data["start_date"] = self.start_date + timedelta(days=6)
+        self.assertNotIn("__all__", TripForm(data, traveler=self.traveler).errors)
+
+        data["start_date"], data["end_date"] = self.start_date, self.start_date
+        self.assertNotIn("__all__", TripForm(data, instance=self.trip).errors)
+
+    def test_form_rejects_trip_missing_from_index(self):
+        """
+        Test that TripForm rejects a trip overlapping one saved by another process, which
+        the loaded index of this process doesn't know of yet.
+        """
+        trip_index.ensure_loaded()
+        start_date = self.start_date + timedelta(days=20)
+        Trip.objects.bulk_create([Trip(
+            trip_name="Saved elsewhere", traveler=self.traveler, type_of_travel="Domestic",
+            category_of_travel="Business", reason_for_travel="Field visit",
+            start_date=start_date, end_date=start_date + timedelta(days=2),
+            is_mission_critical=False)])
+        self.assertEqual(trip_index.trips_on(start_date), [])
+        form = TripForm({
+            "trip_name": "Another visit",
+            "type_of_travel": "Domestic",
+            "category_of_travel": "Business",
+            "reason_for_travel": "Field visit",
+            "start_date": start_date + timedelta(days=1),
+            "end_date": start_date + timedelta(days=4),
+            "is_mission_critical": False,
+            "security_level": "1",
+        }, traveler=self.traveler)
+        self.assertFalse(form.is_valid())
+        self.assertIn("Saved elsewhere", form.non_field_errors()[0])
+
+    def test_in_the_field_api(self):
+        """
+        Test that the API lists the visible trips in progress on a date or within a range.
+        """
+        other = user_model.objects.create_user(username="other")
+        other_trip = self.create_trip(self.start_date, self.start_date)
+        other_trip.traveler = TravelerProfile.objects.get(user_account=other)
+        other_trip.save()
+        later_trip = self.create_trip(self.start_date + timedelta(days=20),
+                                      self.start_date + timedelta(days=22))
+        client = Client()
+        client.force_login(self.traveler.user_account)
+        url = reverse("trip-in-the-field")
+        response = client.get(url, {"date": self.start_date.isoformat()})
+        self.assertEqual([trip["id"] for trip in response.json()], [self.trip.id])
+        response = client.get(url, {"start_date": self.start_date.isoformat(),
+                                    "end_date": (self.start_date + timedelta(days=30)).isoformat()})
+        self.assertEqual([trip["id"] for trip in response.json()], [self.trip.id, later_trip.id])
+        self.assertEqual(client.get(url).json(), [])
+        self.assertEqual(client.get(url, {"date": "2021-99-99"}).status_code, 400)
+
+    def test_leg_save_skips_unloaded_index(self):
+        """
+        Test that saving a leg doesn't look up its trip when the index isn't loaded.
+        """
+        with CaptureQueriesContext(connection) as context:
+            TripItinerary.objects.create(
+                trip_id=self.trip.id, date_of_departure=self.start_date,
+                time_of_departure="08:00", city_of_departure="Nairobi", destination="Kisumu",
+                mode_of_travel="Air")
+        self.assertFalse([query for query in context.captured_queries
+                          if query["sql"].startswith("SELECT")])
@@ -2,14 +2,19 @@
 Tests for the trip app.
 """
 from datetime import timedelta, date
+from io import StringIO
+from smtplib import SMTPRecipientsRefused
 import mock
 
+from django.db import connection
 from django.test import TestCase
 from django.utils import timezone
+from django.core import mail
 from django.core.files import File
+from django.core.management import call_command
 
-from trip.models import Trip, TripPOET, TripApproval
-from traveler.models import TravelerProfile
+from trip.models import Trip, TripPOET, TripApproval, OutboxEmail
+from traveler.models import TravelerProfile, Approver
 from django.contrib.auth import get_user_model
 
 user_model = get_user_model()
@@ -61,3 +66,251 @@ class TestTrip(TestCase):
         """
         trip = self.trip
         self.assertTrue(trip.end_date >= trip.start_date)
+
+
+class TestTripApprovalState(TestCase):
+    """
+    Test that the approval state held on a Trip follows its TripApproval instances.
+    """
+    def setUp(self):
+        user = user_model.objects.create_user(username='traveler', password='12345')
+        approver_user = user_model.objects.create_user(username='approver', password='12345')
+        self.approver = Approver.objects.create(user=approver_user)
+        start_date = date.today()
+        self.trip = Trip.objects.create(
+            trip_name="Test Trip Name",
+            traveler=TravelerProfile.objects.get(user_account=user),
+            type_of_travel="Domestic",
+            category_of_travel="Business",
+            reason_for_travel="This is a test trip",
+            start_date=start_date,
+            end_date=start_date + timedelta(days=10),
+            is_mission_critical=True,
+            security_level='2',
+        )
+
+    def test_not_requested(self):
+        """
+        Test that a new trip has not been requested for approval.
+        """
+        self.assertEqual(self.trip.get_approval_status(), "Not requested")
+        self.assertEqual(self.trip.get_next_security_level(), 1)
+
+    def test_approval_requested(self):
+        """
+        Test that requesting approval moves the trip to awaiting approval without
+        further queries to read the status.
+        """
+        self.trip.request_approval(1, self.approver)
+        trip = Trip.objects.get(id=self.trip.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(trip.get_approval_status(), "Awaiting Level 1 Approval")
+            self.assertEqual(trip.get_next_security_level(), 2)
+        self.assertTrue(Trip.objects.filter(approval_stage="Awaiting Level 1 Approval").exists())
+
+    def test_last_level_approved(self):
+        """
+        Test that there is no next security level once the trip's security level is approved.
+        """
+        for security_level in ('1', '2'):
+            approval = self.trip.request_approval(security_level, self.approver)
+            approval.acted_upon = True
+            approval.trip_is_approved = True
+            approval.save()
+        self.assertIsNone(self.trip.get_next_security_level())
+        self.trip.approval_complete = True
+        self.trip.save()
+        self.assertEqual(Trip.objects.get(id=self.trip.id).approval_stage, "Approved")
+
+    def test_invalidate_approval_resets_state(self):
+        """
+        Test that invalidating the approvals resets the approval state.
+        """
+        self.trip.request_approval(1, self.approver)
+        self.trip.invalidate_approval()
+        trip = Trip.objects.get(id=self.trip.id)
+        self.assertEqual(trip.get_approval_status(), "Not requested")
+        self.assertEqual(trip.get_next_security_level(), 1)
+
+    def test_invalidate_approval_single_update(self):
+        """
+        Test that all valid approvals are invalidated in one update and counted.
+        """
+        self.trip.request_approval(1, self.approver)
+        self.trip.request_approval(2, self.approver)
+        with self.assertNumQueries(4):
+            # savepoint, approvals update, trip update, release savepoint
+            invalidated = self.trip.invalidate_approval()
+        self.assertEqual(invalidated, 2)
+        self.assertFalse(TripApproval.objects.filter(trip=self.trip, is_valid=True).exists())
+        self.assertEqual(self.trip.invalidate_approval(), 0)
+
+
+class TestOutboxEmail(TestCase):
+    """
+    Test queueing emails in the outbox and sending them with the sendqueuedemails command.
+    """
+    def setUp(self):
+        self.emails = OutboxEmail.objects.queue((
+            ("Subject 1", "Text 1", "<p>Text 1</p>", "tracker@example.com", ["a@example.com"]),
+            ("Subject 2", "Text 2", "<p>Text 2</p>", None, ["b@example.com", "c@example.com"]),
+        ))
+
+    def send_queued_emails(self):
+        call_command('sendqueuedemails', stdout=StringIO(), stderr=StringIO())
+
+    def test_queue(self):
+        """
+        Test that queueing stores the emails unsent without sending anything.
+        """
+        self.assertEqual(OutboxEmail.objects.filter(sent_on__isnull=True).count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutboxEmail.objects.get(subject="Subject 2")
+        self.assertEqual(email.get_recipients(), ["b@example.com", "c@example.com"])
+
+    def test_send(self):
+        """
+        Test that the command sends the due emails, with their html alternative, only once.
+        """
+        self.send_queued_emails()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].alternatives, [("<p>Text 1</p>", "text/html")])
+        self.assertEqual(mail.outbox[1].to, ["b@example.com", "c@example.com"])
+        self.assertFalse(OutboxEmail.objects.filter(sent_on__isnull=True).exists())
+        self.send_queued_emails()
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_retry_with_backoff(self):
+        """
+        Test that a failed email is retried later and given up after the maximum attempts.
+        """
+        error = SMTPRecipientsRefused({"a@example.com": (550, b"No such user")})
+        with self.settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2), \
+                mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                           side_effect=error):
+            self.send_queued_emails()
+            email = OutboxEmail.objects.get(subject="Subject 1")
+            self.assertEqual(email.attempts, 1)
+            self.assertIsNone(email.sent_on)
+            self.assertIn("No such user", email.last_error)
+            self.assertGreater(email.next_attempt_on, timezone.now())
+
+            # the retry is not due yet
+            self.send_queued_emails()
+            self.assertEqual(OutboxEmail.objects.get(subject="Subject 1").attempts, 1)
+
+            OutboxEmail.objects.update(next_attempt_on=timezone.now())
+            self.send_queued_emails()
+            OutboxEmail.objects.update(next_attempt_on=timezone.now())
+            self.send_queued_emails()
+        self.assertEqual(OutboxEmail.objects.get(subject="Subject 1").attempts, 2)
+        self.assertEqual(len(mail.outbox), 0)
+
+
+    def test_error_retries_one_email(self):
+        """
+        Test that any error building or sending one email schedules a retry of that email
+        only, while the others are sent.
+        """
+        get_message = OutboxEmail.get_message
+
+        def failing_get_message(email, connection=None):
+            if email.subject == "Subject 1":
+                raise ValueError("Invalid address")
+            return get_message(email, connection)
+
+        with mock.patch.object(OutboxEmail, 'get_message', failing_get_message):
+            self.send_queued_emails()
+        self.assertEqual([message.subject for message in mail.outbox], ["Subject 2"])
+        email = OutboxEmail.objects.get(subject="Subject 1")
+        self.assertEqual((email.attempts, email.sent_on), (1, None))
+        self.assertIn("Invalid address", email.last_error)
+
+    def test_claimed_while_sending(self):
+        """
+        Test that the emails being sent are claimed, so that other workers don't send them,
+        and that the command holds no transaction open while sending.
+        """
+        savepoints = len(connection.savepoint_ids)
+
+        def send_messages(messages):
+            self.assertFalse(OutboxEmail.objects.due(5).exists())
+            self.assertEqual(len(connection.savepoint_ids), savepoints)
+            return len(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=send_messages):
+            self.send_queued_emails()
+        self.assertFalse(OutboxEmail.objects.filter(sent_on__isnull=True).exists())
+
+
+class TestApprovalDigest(TestCase):
+    """
+    Test emailing approvers on the daily digest their pending approval requests.
+    """
+    def setUp(self):
+        self.digest_approver = Approver.objects.create(
+            user=user_model.objects.create_user(username='digest', password='12345',
+                                                email='digest@example.com', first_name='Dee'),
+            notification_mode='digest',
+        )
+        self.immediate_approver = Approver.objects.create(
+            user=user_model.objects.create_user(username='immediate', password='12345',
+                                                email='immediate@example.com'),
+        )
+        traveler = TravelerProfile.objects.get(
+            user_account=user_model.objects.create_user(username='traveler', password='12345'))
+        self.trips = []
+        for index, is_mission_critical in enumerate((False, True, False)):
+            start_date = date.today() + timedelta(days=index + 1)
+            self.trips.append(Trip.objects.create(
+                trip_name=f"Trip {index}",
+                traveler=traveler,
+                type_of_travel="Domestic",
+                category_of_travel="Business",
+                reason_for_travel="This is a test trip",
+                start_date=start_date,
+                end_date=start_date,
+                is_mission_critical=is_mission_critical,
+            ))
+        self.trips[0].request_approval(1, self.digest_approver)
+        self.trips[1].request_approval(1, self.digest_approver)
+        self.trips[2].request_approval(1, self.immediate_approver)
+        mail.outbox = []
+
+    def test_wants_immediate_email(self):
+        """
+        Test that approvers on the digest are only emailed immediately for mission critical
+        trips.
+        """
+        self.assertFalse(self.digest_approver.wants_immediate_email(self.trips[0]))
+        self.assertTrue(self.digest_approver.wants_immediate_email(self.trips[1]))
+        self.assertTrue(self.immediate_approver.wants_immediate_email(self.trips[0]))
+
+    def test_digest(self):
+        """
+        Test that each approver on the digest gets one email listing their pending requests,
+        queued in the outbox.
+        """
+        with self.assertNumQueries(2):
+            call_command('sendapprovaldigests', site_url='https://travel.example.com',
+                         stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.get().get_recipients(), ['digest@example.com'])
+        call_command('sendqueuedemails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        email = mail.outbox[0]
+        self.assertEqual(email.to, ['digest@example.com'])
+        self.assertIn("Dear Dee,", email.body)
+        self.assertIn("Trip 0\n", email.body)
+        self.assertIn("Trip 1 (mission critical)", email.body)
+        self.assertNotIn("Trip 2", email.body)
+        self.assertIn("https://travel.example.com/", email.alternatives[0][0])
+
+    def test_no_digest_for_acted_upon_requests(self):
+        """
+        Test that approvers with nothing pending get no digest.
+        """
+        TripApproval.objects.update(acted_upon=True)
+        call_command('sendapprovaldigests', stdout=StringIO())
+        self.assertFalse(OutboxEmail.objects.exists())
@@ -0,0 +1,93 @@
+"""
+Tests for the filters of the trip list views and the explainlistqueries command.
+"""
+from datetime import timedelta
+from io import StringIO
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils import timezone
+
+from trip.models import Trip, TripApproval
+from traveler.models import Approver, TravelerProfile
+
+user_model = get_user_model()
+
+
+class TestListQueries(TestCase):
+    """
+    Test the TripApprovalQuerySet filters and the plans printed for the list views.
+    """
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.approver = Approver.objects.create(
+            user=user_model.objects.create_user(username="approver"), security_level=1)
+        user = user_model.objects.create_user(username="traveler")
+        self.traveler = TravelerProfile.objects.get(user_account=user)
+        self.traveler.approver = self.approver
+        self.traveler.save()
+        # trips before, during and after today, each approved, declined or pending
+        for number, (start_days, end_days) in enumerate(
+                [(-10, -5), (-3, 0), (0, 2), (-1, 4), (1, 3), (5, 9)]):
+            trip = Trip.objects.create(
+                trip_name=f"Trip {number}", traveler=self.traveler, type_of_travel="Domestic",
+                category_of_travel="Business", reason_for_travel="Field visit",
+                start_date=self.today + timedelta(days=start_days),
+                end_date=self.today + timedelta(days=end_days), is_mission_critical=False)
+            approval = trip.request_approval(1, self.approver)
+            if number % 3:
+                TripApproval.objects.filter(id=approval.id).update(
+                    acted_upon=True, trip_is_approved=number % 3 == 1)
+
+    def assertSameRows(self, queryset, expected):
+        """Check that the queryset selects the same rows as the expected one, which has some."""
+        self.assertTrue(expected.exists())
+        self.assertEqual(sorted(queryset.values_list("id", flat=True)),
+                         sorted(expected.values_list("id", flat=True)))
+
+    def test_filters_match_inline_filters(self):
+        """
+        Test that the queryset filters select the rows the list views used to filter inline.
+        """
+        approvals = TripApproval.objects.all()
+        for date in (self.today, self.today + timedelta(days=2)):
+            self.assertSameRows(approvals.upcoming(date),
+                                approvals.filter(trip__start_date__gt=date))
+            self.assertSameRows(approvals.ongoing(date), approvals.filter(
+                trip__start_date__lte=date, trip__end_date__gte=date, trip_is_approved=True))
+        self.assertSameRows(
+            approvals.awaiting_approval(self.approver.user),
+            approvals.filter(trip_is_approved=False).filter(acted_upon=False).filter(
+                approver__user=self.approver.user))
+
+    def test_explain_each_list(self):
+        """
+        Test that a plan is printed for each list view.
+        """
+        out = StringIO()
+        call_command("explainlistqueries", user="approver", sql=True, stdout=out)
+        sections = out.getvalue().strip().split("\n\n")
+        self.assertEqual(
+            [section.splitlines()[0] for section in sections],
+            ["Upcoming trips", "Ongoing trips", "Trips awaiting approval", "My trips"])
+        for section in sections:
+            lines = section.splitlines()
+            self.assertIn("SELECT", lines[1])
+            self.assertGreater(len(lines), 2, f"No plan printed for {lines[0]}.")
+
+    def test_explain_options(self):
+        """
+        Test that the default user is the first approver and invalid options are refused.
+        """
+        out = StringIO()
+        call_command("explainlistqueries", date=self.today.isoformat(), stdout=out)
+        self.assertIn("Trips awaiting approval", out.getvalue())
+        invalid_options = [{"user": "nobody"}, {"date": "tomorrow"}]
+        if connection.vendor != "postgresql":
+            invalid_options.append({"analyze": True})
+        for options in invalid_options:
+            with self.assertRaises(CommandError):
+                call_command("explainlistqueries", stdout=StringIO(), **options)
@@ -0,0 +1,101 @@
+"""
+Tests for the permissions granted around the trip signals.
+"""
+from datetime import date, timedelta
+
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import get_perms
+
+from trip.intervals import trip_index
+from trip.models import Trip, TripItinerary
+from traveler.models import TravelerProfile
+from utils.permissions import batch_permissions, grant_perms
+
+user_model = get_user_model()
+
+
+class TestBatchedPermissions(TransactionTestCase):
+    """
+    Test that object permissions granted on trips are inserted in batches on commit.
+    """
+    def setUp(self):
+        trip_index.clear()
+        self.user = user_model.objects.create_user(username='traveler', password='12345')
+        self.manager = user_model.objects.create_user(username='manager', password='12345')
+        self.traveler = TravelerProfile.objects.get(user_account=self.user)
+        # leave only the grants made on trips
+        UserObjectPermission.objects.all().delete()
+
+    def tearDown(self):
+        trip_index.clear()
+
+    def create_trip(self):
+        start_date = date.today() + timedelta(days=1)
+        return Trip.objects.create(
+            trip_name="Test Trip Name",
+            traveler=self.traveler,
+            type_of_travel="Domestic",
+            category_of_travel="Business",
+            reason_for_travel="This is a test trip",
+            start_date=start_date,
+            end_date=start_date + timedelta(days=10),
+            is_mission_critical=False,
+        )
+
+    def create_legs(self, trip, count):
+        return [
+            TripItinerary.objects.create(
+                trip=trip, date_of_departure=trip.start_date, time_of_departure="08:00",
+                city_of_departure="Nairobi", destination=f"Stop {index}", mode_of_travel="Air")
+            for index in range(count)
+        ]
+
+    def test_no_rows_for_owners(self):
+        """
+        Test that saving trips and legs doesn't add guardian rows for their owner.
+        """
+        self.create_legs(self.create_trip(), 2)
+        self.assertFalse(UserObjectPermission.objects.exists())
+
+    def test_batched_on_commit(self):
+        """
+        Test that grants made in a batch are inserted with one query on commit.
+        """
+        with CaptureQueriesContext(connection) as context:
+            with transaction.atomic(), batch_permissions():
+                trip = self.create_trip()
+                legs = self.create_legs(trip, 10)
+                grant_perms(self.manager, ('view_trip',), trip)
+                grant_perms(self.manager, ('view_tripitinerary',), *legs)
+                self.assertFalse(UserObjectPermission.objects.exists())
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT') and 'userobjectpermission' in query['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(UserObjectPermission.objects.count(), 11)
+        for leg in legs:
+            self.assertEqual(get_perms(self.manager, leg), ['view_tripitinerary'])
+
+    def test_rolled_back(self):
+        """
+        Test that nothing is granted if the transaction is rolled back.
+        """
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic(), batch_permissions():
+                grant_perms(self.manager, ('view_trip',), self.create_trip())
+                raise RuntimeError
+        self.assertFalse(UserObjectPermission.objects.exists())
+        grant_perms(self.manager, ('view_trip', 'change_trip'), self.create_trip())
+        self.assertEqual(UserObjectPermission.objects.count(), 2)
+
+    def test_existing_grants_skipped(self):
+        """
+        Test granting permissions the user already has on some of the objects.
+        """
+        legs = self.create_legs(self.create_trip(), 3)
+        grant_perms(self.manager, ('view_tripitinerary',), *legs[:2])
+        grant_perms(self.manager, ('view_tripitinerary',), *legs)
+        self.assertEqual(UserObjectPermission.objects.count(), 3)
@@ -0,0 +1,192 @@
+"""
+This script defines tests for the delta sync API.
+"""
+from datetime import timedelta
+from io import StringIO
+
+import mock
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from trip.models import SyncTombstone, Trip, TripApproval, TripItinerary, TripPOET
+from trip.sync import decode_token, encode_token
+from trip.tests.test_api import BaseTripAPITestCase, user_model
+from traveler.models import Approver, TravelerProfile
+
+
+class TestTripSync(BaseTripAPITestCase):
+    """
+    Tests for the delta sync of trips.
+    """
+    def add_leg(self, trip, city="Nairobi"):
+        """
+        Add an itinerary leg to the trip.
+        """
+        return TripItinerary.objects.create(
+            trip=trip, date_of_departure=trip.start_date, time_of_departure="08:00",
+            city_of_departure=city, destination="Kisumu", mode_of_travel="Air")
+
+    def sync(self, token=None):
+        """
+        Sync with the token and return the response data.
+        """
+        response = self.client.get(reverse("trip_sync"), {"since": token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def sync_later(self, token):
+        """
+        Sync with the token two minutes from now, beyond the overlap of the tokens.
+        """
+        later = timezone.now() + timedelta(minutes=2)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            return self.sync(token)
+
+    def test_full_sync(self):
+        """
+        Test that the first sync returns everything the user may see.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        self.add_leg(trip)
+        TripPOET.objects.create(trip=trip, project="123456", task="001")
+        self.create_trip(user_model.objects.create_user(username="other"), "Other trip")
+        data = self.sync()
+        self.assertTrue(data["full"])
+        self.assertEqual([trip["trip_name"] for trip in data["trips"]], ["Own trip"])
+        self.assertEqual(len(data["itinerary"]), 1)
+        self.assertEqual(len(data["poet"]), 1)
+        self.assertEqual(data["approvals"], [])
+
+    def test_changes_since_token(self):
+        """
+        Test that a sync only returns the rows changed and deleted since the token.
+        """
+        approver = Approver.objects.create(user=self.user, security_level=1)
+        trip = self.create_trip(self.user, "Own trip")
+        unchanged = self.create_trip(self.user, "Unchanged trip")
+        self.add_leg(unchanged)
+        leg = self.add_leg(trip)
+        token = encode_token(timezone.now())
+        leg_id = leg.id
+        leg.delete()
+        self.add_leg(trip, city="Mombasa")
+        trip.request_approval(1, approver)
+        data = self.sync(token)
+        self.assertFalse(data["full"])
+        self.assertEqual([trip["trip_name"] for trip in data["trips"]], ["Own trip"])
+        self.assertEqual([leg["city_of_departure"] for leg in data["itinerary"]], ["Mombasa"])
+        self.assertEqual(len(data["approvals"]), 1)
+        self.assertEqual(data["deleted"]["tripitinerary"], [leg_id])
+        # changes within the overlap of the next token are sent again
+        self.assertEqual(len(self.sync(data["token"])["trips"]), 2)
+        data = self.sync(self.sync_later(data["token"])["token"])
+        self.assertEqual((data["trips"], data["itinerary"], data["approvals"]), ([], [], []))
+        self.assertEqual(data["deleted"]["tripitinerary"], [])
+
+    def test_trip_becoming_visible(self):
+        """
+        Test that a trip whose rows were saved before it became visible to an approver is
+        sent with all its rows, whether an approval is requested or the approver is assigned.
+        """
+        approver = Approver.objects.create(user=self.user, security_level=1)
+        requested = self.create_trip(user_model.objects.create_user(username="first"), "First")
+        traveler = user_model.objects.create_user(username="second")
+        assigned = self.create_trip(traveler, "Second", days_ahead=10)
+        for trip in (requested, assigned):
+            self.add_leg(trip)
+            TripPOET.objects.create(trip=trip, project="123456", task="001")
+        # the rows were saved long before the last sync of the approver
+        yesterday = timezone.now() - timedelta(days=1)
+        Trip.objects.update(created_on=yesterday)
+        TripItinerary.objects.update(updated_on=yesterday)
+        TripPOET.objects.update(updated_on=yesterday)
+        token = encode_token(timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.sync(token)["trips"], [])
+        requested.request_approval(1, approver)
+        profile = TravelerProfile.objects.get(user_account=traveler)
+        profile.approver = approver
+        profile.save()
+        data = self.sync(token)
+        self.assertEqual([trip["trip_name"] for trip in data["trips"]], ["First", "Second"])
+        self.assertEqual(sorted(leg["trip"] for leg in data["itinerary"]),
+                         [requested.id, assigned.id])
+        self.assertEqual(sorted(line["trip"] for line in data["poet"]),
+                         [requested.id, assigned.id])
+
+    def test_invalidated_approvals(self):
+        """
+        Test that approvals invalidated in bulk are synced.
+        """
+        approver = Approver.objects.create(user=self.user, security_level=1)
+        trip = self.create_trip(self.user, "Own trip")
+        approval = trip.request_approval(1, approver)
+        token = encode_token(timezone.now())
+        trip.invalidate_approval()
+        data = self.sync(token)
+        self.assertEqual([(row["id"], row["is_valid"]) for row in data["approvals"]],
+                         [(approval.id, False)])
+
+    def test_tombstones_scope(self):
+        """
+        Test that users only learn of the deletions of rows they could see.
+        """
+        other = user_model.objects.create_user(username="other")
+        own_trip = self.create_trip(self.user, "Own trip")
+        other_trip = self.create_trip(other, "Other trip")
+        token = encode_token(timezone.now())
+        own_trip_id = own_trip.id
+        own_trip.delete()
+        other_trip.delete()
+        data = self.sync(token)
+        self.assertEqual(data["deleted"]["trip"], [own_trip_id])
+        self.assertEqual(SyncTombstone.objects.count(), 2)
+
+    def test_old_and_invalid_tokens(self):
+        """
+        Test that tokens older than the tombstones get a full sync and invalid ones a 400.
+        """
+        self.create_trip(self.user, "Own trip")
+        data = self.sync(encode_token(timezone.now() - timedelta(days=365)))
+        self.assertTrue(data["full"])
+        self.assertEqual(len(data["trips"]), 1)
+        response = self.client.get(reverse("trip_sync"), {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(ValueError):
+            decode_token(encode_token(timezone.now().replace(tzinfo=None)))
+
+    def test_query_count_is_constant(self):
+        """
+        Test that the number of queries of a sync doesn't grow with the changes.
+        """
+        approver = Approver.objects.create(user=self.user, security_level=1)
+        token = encode_token(timezone.now())
+        trip = self.create_trip(self.user, "Own trip")
+        self.add_leg(trip)
+        with CaptureQueriesContext(connection) as few_changes:
+            self.sync(token)
+        for number in range(3):
+            trip = self.create_trip(self.user, f"Trip {number}")
+            self.add_leg(trip)
+            TripPOET.objects.create(trip=trip, project="123456", task="001")
+            trip.request_approval(1, approver)
+        self.add_leg(trip).delete()
+        with CaptureQueriesContext(connection) as many_changes:
+            self.sync(token)
+        self.assertEqual(len(few_changes.captured_queries), len(many_changes.captured_queries))
+
+    def test_purge(self):
+        """
+        Test that old tombstones are purged.
+        """
+        trip = self.create_trip(self.user, "Own trip")
+        trip.delete()
+        SyncTombstone.objects.update(deleted_on=timezone.now() - timedelta(days=365))
+        self.create_trip(self.user, "Another trip").delete()
+        output = StringIO()
+        call_command("purgesynctombstones", stdout=output)
+        self.assertIn("Deleted 1 tombstone(s).", output.getvalue())
+        self.assertEqual(SyncTombstone.objects.count(), 1)
+        self.assertFalse(TripApproval.objects.exists())
@@ -1,17 +1,26 @@
 """
 This script defines tests for the views implementation
 """
+from datetime import timedelta
+import mock
+
 from django import test
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
-from django.urls import resolve
+from django.core import mail
+from django.db import connection, DatabaseError
+from django.urls import resolve, reverse
+from django.utils import timezone
 
 from guardian.shortcuts import assign_perm
 
-from trip.models import Trip, TripItinerary, TripPOET
-from traveler.models import Departments, CountrySecurityLevel
+from trip.models import Trip, TripItinerary, TripPOET, TripApproval, OutboxEmail
+from traveler.models import Approver, Departments, CountrySecurityLevel, TravelerProfile
+from trip.views import TripApprovalListView
+from utils.pagination import encode_cursor
 
 user_model = get_user_model()
 
@@ -93,6 +102,32 @@ class TestTripCRUDView(BaseViewTestCase):
         response = self.client.get("/trip/new-trip", follow=True)
         self.assertEqual(response.status_code, 200)
 
+    def test_update_rolled_back_with_approvals(self):
+        """
+        Test that the trip isn't changed when its approvals can't be invalidated.
+        """
+        profile = TravelerProfile.objects.get(user_account=self.user)
+        start_date = timezone.now().date() + timedelta(days=5)
+        trip = Trip.objects.create(
+            trip_name="Field visit", traveler=profile, type_of_travel="Domestic",
+            category_of_travel="Business", reason_for_travel="Field visit",
+            start_date=start_date, end_date=start_date + timedelta(days=3),
+            is_mission_critical=False, scope_of_work="media/uploads/scope.pdf")
+        data = {
+            "trip_name": "Changed visit", "type_of_travel": "Domestic",
+            "category_of_travel": "Business", "reason_for_travel": "Field visit",
+            "start_date": trip.start_date.isoformat(), "end_date": trip.end_date.isoformat(),
+            "is_mission_critical": "False", "security_level": "1",
+        }
+        url = reverse("u_update_trip", kwargs={"trip_id": trip.id})
+        with mock.patch.object(Trip, "invalidate_approval", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.post(url, data)
+        self.assertEqual(Trip.objects.get(id=trip.id).trip_name, "Field visit")
+        response = self.client.post(url, data)
+        self.assertRedirects(response, trip.get_absolute_url(), fetch_redirect_response=False)
+        self.assertEqual(Trip.objects.get(id=trip.id).trip_name, "Changed visit")
+
     # def test_post_create(self):
     #     """
     #     test post method on the TripCreateView returns Http 201
@@ -119,3 +154,227 @@ class TestTripCRUDView(BaseViewTestCase):
     #     self.assertEqual(response.status_code, 201)
         # TODO assert context variables are as expected
         # self.assert(response.context[""]
+
+
+class TestTripApprovalListView(BaseViewTestCase):
+    """
+    Tests for the approver work queues served by TripApprovalListView.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.approver = Approver.objects.create(user=self.user, security_level=1)
+        self.trip_count = 0
+
+    def create_pending_approvals(self, count, days_ahead=5):
+        """
+        Create trips for new travelers, each with an approval request pending with
+        the logged on user. The trips begin the given number of days from today.
+        """
+        start_date = timezone.now().date() + timedelta(days=days_ahead)
+        for _ in range(count):
+            self.trip_count += 1
+            traveler = user_model.objects.create_user(
+                username=f"traveler_{self.trip_count}", password="traveler"
+            )
+            profile = TravelerProfile.objects.get(user_account=traveler)
+            profile.approver = self.approver
+            profile.save()
+            trip = Trip.objects.create(
+                trip_name=f"Trip {self.trip_count}",
+                traveler=profile,
+                type_of_travel="Domestic",
+                category_of_travel="Business",
+                reason_for_travel="Field visit",
+                start_date=start_date,
+                end_date=start_date + timedelta(days=3),
+                is_mission_critical=False,
+            )
+            trip.request_approval(1, self.approver)
+
+    def create_ongoing_trips(self, count):
+        """
+        Create trips in progress today, each approved by the logged on user.
+        """
+        self.create_pending_approvals(count, days_ahead=-1)
+        TripApproval.objects.filter(trip__start_date__lt=timezone.now().date()).update(
+            acted_upon=True, trip_is_approved=True)
+
+    def count_queries(self, url):
+        """
+        Return the number of queries run to render the url.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_awaiting_approval_lists_pending_requests(self):
+        """
+        Test that the approver sees the trips awaiting their approval.
+        """
+        self.create_pending_approvals(2)
+        response = self.client.get(reverse("u_list_awaiting_approval_trips"))
+        self.assertEqual(len(response.context["trips"]), 2)
+        self.assertContains(response, "Trip 1")
+
+    def test_upcoming_lists_approved_travelers_only(self):
+        """
+        Test that the upcoming trips are limited to travelers the user approves.
+        """
+        self.create_pending_approvals(2)
+        profile = TravelerProfile.objects.get(user_account__username="traveler_2")
+        profile.approver = None
+        profile.save()
+        response = self.client.get(reverse("u_list_upcoming_trips"))
+        self.assertEqual([approval.trip.trip_name for approval in response.context["trips"]],
+                         ["Trip 1"])
+
+    def test_query_count_is_constant(self):
+        """
+        Test that the number of queries doesn't grow with the number of listed approvals.
+        """
+        fixtures = {
+            "u_list_awaiting_approval_trips": self.create_pending_approvals,
+            "u_list_upcoming_trips": self.create_pending_approvals,
+            "u_list_ongoing_trips": self.create_ongoing_trips,
+        }
+        for url_name, create_trips in fixtures.items():
+            url = reverse(url_name)
+            create_trips(1)
+            few_rows = self.count_queries(url)
+            create_trips(5)
+            many_rows = self.count_queries(url)
+            self.assertEqual(few_rows, many_rows, f"{url_name} queries grow with rows.")
+        response = self.client.get(reverse("u_list_ongoing_trips"))
+        self.assertEqual(len(response.context["trips"]), 6)
+
+    def test_reassigned_approver_loses_access(self):
+        """
+        Test that an approver can view and approve the trips of the travelers they approve
+        only while they are assigned to them.
+        """
+        self.create_pending_approvals(1)
+        approval = TripApproval.objects.get()
+        Trip.objects.update(scope_of_work="media/uploads/scope.pdf")
+        details_url = reverse("u_trip_details", kwargs={"trip_id": approval.trip_id})
+        approve_url = reverse("u_approve_trip", kwargs={"approval_id": approval.id})
+        self.assertEqual(self.client.get(details_url).status_code, 200)
+        self.assertEqual(self.client.get(approve_url).status_code, 200)
+        profile = approval.trip.traveler
+        profile.approver = Approver.objects.create(
+            user=user_model.objects.create_user(username="other_approver"), security_level=1)
+        profile.save()
+        self.assertEqual(self.client.get(details_url).status_code, 403)
+        self.assertEqual(self.client.get(approve_url).status_code, 403)
+
+    def test_decline_queues_email(self):
+        """
+        Test that acting on an approval request queues the email to the requester instead of
+        sending it within the request.
+        """
+        self.create_pending_approvals(1)
+        approval = TripApproval.objects.get()
+        user_model.objects.filter(username="traveler_1").update(email="traveler_1@example.com")
+        mail.outbox = []
+        response = self.client.post(
+            reverse("u_approve_trip", kwargs={"approval_id": approval.id}),
+            {"trip_is_approved": "0", "approval_comment": "Not now"},
+        )
+        self.assertRedirects(response, reverse("u_list_awaiting_approval_trips"))
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.subject, "Trip Declined")
+        self.assertEqual(email.get_recipients(), ["traveler_1@example.com"])
+
+    def test_keyset_pagination(self):
+        """
+        Test that the pages follow each other without gaps or repeats in both directions.
+        """
+        self.create_pending_approvals(5)
+        url = reverse("u_list_awaiting_approval_trips")
+        with mock.patch.object(TripApprovalListView, "paginate_by", 2):
+            pages = [self.client.get(url).context["page_obj"]]
+            while pages[-1].has_next():
+                pages.append(self.client.get(url, {"cursor": pages[-1].next_cursor})
+                             .context["page_obj"])
+            previous_page = self.client.get(url, {"cursor": pages[-1].previous_cursor})
+            invalid_cursor = self.client.get(url, {"cursor": "not-a-cursor"})
+            invalid_values = [self.client.get(url, {"cursor": encode_cursor(values)})
+                              for values in (["2021-99-99", "1"], ["2021-01-01", "one"])]
+
+        trip_names = [approval.trip.trip_name for page in pages for approval in page]
+        self.assertEqual(trip_names, [f"Trip {number}" for number in range(1, 6)])
+        self.assertFalse(pages[0].has_previous())
+        self.assertEqual(list(previous_page.context["page_obj"]), list(pages[-2]))
+        self.assertEqual(invalid_cursor.status_code, 404)
+        self.assertEqual([response.status_code for response in invalid_values], [404, 404])
+
+
+class TestTripListView(BaseViewTestCase):
+    """
+    Tests for the listing of the logged on user's trips.
+    """
+
+    def create_trips(self, user, days_ahead):
+        """
+        Create a trip for the user starting the given number of days from today for each
+        element of days_ahead.
+        """
+        traveler = TravelerProfile.objects.get(user_account=user)
+        start_date = timezone.now().date()
+        for days in days_ahead:
+            Trip.objects.create(
+                trip_name=f"Trip in {days} days",
+                traveler=traveler,
+                type_of_travel="Domestic",
+                category_of_travel="Business",
+                reason_for_travel="Field visit",
+                start_date=start_date + timedelta(days=days),
+                end_date=start_date + timedelta(days=days + 2),
+                is_mission_critical=False,
+            )
+
+    def test_lists_own_trips(self):
+        """
+        Test that the user's trips are listed most recent first.
+        """
+        self.create_trips(self.user, (1, 10))
+        self.create_trips(user_model.objects.create_user(username="other", password="other"),
+                          (5,))
+        response = self.client.get(reverse("u_list_my_trips"))
+        self.assertEqual([trip.trip_name for trip in response.context["trips"]],
+                         ["Trip in 10 days", "Trip in 1 days"])
+
+    def test_sort(self):
+        """
+        Test that the trips can be sorted and that the page links keep the order.
+        """
+        self.create_trips(self.user, (3, 1, 2))
+        response = self.client.get(reverse("u_list_my_trips"), {"sort": "start_date"})
+        self.assertEqual([trip.trip_name for trip in response.context["trips"]],
+                         ["Trip in 1 days", "Trip in 2 days", "Trip in 3 days"])
+        with mock.patch("trip.views.TripListView.paginate_by", 2):
+            response = self.client.get(reverse("u_list_my_trips"), {"sort": "-trip_name"})
+            self.assertEqual([trip.trip_name for trip in response.context["trips"]],
+                             ["Trip in 3 days", "Trip in 2 days"])
+            self.assertContains(response, "?sort=-trip_name&amp;cursor=")
+            response = self.client.get(reverse("u_list_my_trips"), {
+                "sort": "-trip_name", "cursor": response.context["page_obj"].next_cursor})
+        self.assertEqual([trip.trip_name for trip in response.context["trips"]],
+                         ["Trip in 1 days"])
+
+    def test_single_query_without_guardian(self):
+        """
+        Test that the trips are read with one query that loads only the listed columns and
+        doesn't touch guardian's permission table.
+        """
+        self.create_trips(self.user, (1, 2))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("u_list_my_trips"))
+        trip_queries = [query["sql"] for query in context.captured_queries
+                        if 'FROM "trip_trip"' in query["sql"]]
+        self.assertEqual(len(trip_queries), 1)
+        self.assertNotIn("scope_of_work", trip_queries[0])
+        self.assertFalse(any("guardian" in query["sql"] for query in context.captured_queries))
+        self.assertEqual(len(response.context["trips"]), 2)
@@ -10,7 +10,7 @@ from .views import (
     TripCreateView, TripDetailView, TripUpdateView, TripDeleteView,
     TripListView, TripPOETCreateView, TripPOETUpdateView ,TripItineraryListView,
     TripItineraryCreateView, TripItineraryUpdateView, TripItineraryDeleteView, ApproveTripView,
-    TripApprovalListView,
+    TripApprovalListView, TripSyncView, TripPOETBulkView, TripItineraryBulkView,
     )
 
 router = routers.SimpleRouter()
@@ -18,7 +18,9 @@ router.register(r'trips', TripViewSet)
 router.register(r'trip-traveler-dependants', TripTravelerDependantsViewSet)
 router.register(r'trip-approval', TripApprovalViewSet)
 router.register(r'trip-itinerary', TripItineraryViewSet)
-api_url_patterns = router.urls
+api_url_patterns = router.urls + [
+    path('sync/', TripSyncView.as_view(), name='trip_sync'),
+]
 
 
 urlpatterns = [
@@ -38,9 +40,12 @@ urlpatterns = [
     path('trip-poet/add/trip=<trip_id>', TripPOETCreateView.as_view(), name='add_poet'),
     path('trip-poet/update/<trip_id>/poet=<poet_id>', TripPOETUpdateView.as_view(),
         name='update_poet'),
+    path('trip-poet/bulk/trip=<trip_id>', TripPOETBulkView.as_view(), name='u_bulk_trip_poet'),
     # trip itinerary
     path('trip-itinerary/new-leg/trip=<trip_id>', TripItineraryCreateView.as_view(),
         name='u_create_trip_itinerary'),
+    path('trip-itinerary/bulk/trip=<trip_id>', TripItineraryBulkView.as_view(),
+        name='u_bulk_trip_itinerary'),
     path('trip-itinerary/trip=<trip_id>', TripItineraryListView.as_view(),
         name='u_list_trip_itinerary'),
     path('trip-itinerary/trip-leg=<leg_id>', TripItineraryUpdateView.as_view(),
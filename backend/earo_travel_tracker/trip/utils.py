@@ -1,6 +1,7 @@
 """
 This file defines utility classes (mostly mixins) used in this app by various views.
 """
+from traveler.models import ApproverAssignment
 
 
 class TripUtilsMixin:
@@ -8,15 +9,14 @@ class TripUtilsMixin:
     This mixin class checks that a user owns the trip they are trying to request approval for.
     """
 
-    def user_is_approver(self, traveler, security_level=1):
+    def user_is_approver(self, traveler, security_level=None):
         """
-        Confirm that the logged on user is the approver for the request.
-        TODO can be in the User model
+        Confirm that the logged on user currently approves the traveler's trips at the
+        security level, or at any level if none is given, directly or by delegation.
+        This is answered from the approver assignments with one query.
         """
-        user = self.request.user
-        set_approver = traveler.get_approver(security_level=security_level)
-        if set_approver is None:
-            print("no approver") # debug code
-            return False
-        print("set approver ", set_approver.user) # debug code
-        return bool(user == set_approver.user)
+        assignments = ApproverAssignment.objects.filter(
+            traveler=traveler, approver__user=self.request.user)
+        if security_level is not None:
+            assignments = assignments.filter(security_level=str(security_level))
+        return assignments.exists()
@@ -2,68 +2,265 @@
 All views for the trip app are implemented here.
 """
 import logging
-from smtplib import SMTPRecipientsRefused
+from functools import partial
 
-from django.views.generic import CreateView, UpdateView, DetailView, DeleteView, ListView
+from django.db.models import prefetch_related_objects
+from django.views.generic import (
+    CreateView, UpdateView, DetailView, DeleteView, ListView, FormView
+    )
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.db import transaction
 from django.http import HttpResponseRedirect
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.contrib import messages
 from django.shortcuts import get_object_or_404
 # Third party imports
 from rest_framework import viewsets
-from guardian.mixins import PermissionRequiredMixin, PermissionListMixin, LoginRequiredMixin
-from guardian.shortcuts import get_perms
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from guardian.mixins import PermissionRequiredMixin, LoginRequiredMixin
 # Earo_travel_tracker imports
 from traveler.models import TravelerProfile
-from utils.emailing import send_mass_html_mail
+from utils.conditional import conditional_response, make_etag
+from utils.emailing import render_email
+from utils.pagination import KeysetPaginationMixin
 from .models import (
-    Trip, TripTravelerDependants, TripApproval, TripItinerary, TripPOET
+    Trip, TripTravelerDependants, TripApproval, TripItinerary, TripPOET, OutboxEmail
     )
 from .serializers import (
     TripSerializer, TripItinerarySerializer, TripApprovalSerializer,
-    TripTravelerDependantsSerializer
+    TripTravelerDependantsSerializer, TripDetailSerializer, TripPOETSerializer,
+    TripItineraryBulkSerializer, TripPOETBulkSerializer
+    )
+from .bulk import validate_itinerary, validate_poet, save_itinerary, save_poet
+from .filters import TripFilterBackend
+from .intervals import trip_index
+from .sync import get_changes
+from .forms import (
+    TripForm, ApprovalRequestForm, TripApprovalForm, TripItineraryForm, TripItineraryFormSet,
+    TripPOETFormSet
     )
-from .forms import TripForm, ApprovalRequestForm, TripApprovalForm, TripItineraryForm
 from .utils import TripUtilsMixin
 
 logger = logging.getLogger("trip")
 
+
+def get_trip_validators(trip, *keys):
+    """
+    Return the ETag and Last-Modified date of a representation of the trip, identified by
+    keys. They change whenever the trip's created_on stamp or approval state do.
+    """
+    return (make_etag(*keys, trip.id, trip.created_on.isoformat(), trip.approval_stage,
+                      trip.approval_complete),
+            trip.created_on)
+
+
 # API endpoint views
-class TripViewSet(viewsets.ModelViewSet):
+# The API is read-only apart from the bulk saving of a trip's itinerary and POET lines: trips
+# and approvals are changed through the views below, which invalidate approvals and send the
+# notification emails.
+class TripAPIMixin:
     """
-    This class implements views for the Trips.
+    Limit the rows of an API viewset to the trips the user may see (Trip.objects.visible_to)
+    and filter them on the query parameters of TripFilterBackend.
+    trip_lookup is the path from the model of the viewset to Trip.
+    """
+    trip_lookup = 'trip__'
+    filter_backends = [TripFilterBackend]
+
+    def get_visible_trips(self):
+        """Return the trips the logged on user may see."""
+        return Trip.objects.visible_to(self.request.user)
+
+
+class TripViewSet(TripAPIMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    This class implements views for the Trips, most recent first.
     """
     serializer_class = TripSerializer
     queryset = Trip.objects.all()
+    trip_lookup = ''
+    keyset = ('-start_date', '-id')
 
+    def get_queryset(self):
+        return self.get_visible_trips().select_related('traveler__user_account')
 
-class TripTravelerDependantsViewSet(viewsets.ModelViewSet):
-    """
-    This class implements views for the Trips.
+    def get_serializer_class(self):
+        if self.action == 'full':
+            return TripDetailSerializer
+        return super().get_serializer_class()
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Return the trip, or 304 Not Modified if the client's copy is current.
+        """
+        trip = self.get_object()
+        return conditional_response(request, get_trip_validators(trip, 'trip'),
+                                    lambda: Response(self.get_serializer(trip).data))
+
+    @action(detail=True)
+    def full(self, request, pk=None):
+        """
+        Return the trip with its itinerary, POET, dependants and approval history, so that
+        clients need a single request to show a trip. The details are only loaded if the
+        client's copy isn't current.
+        """
+        trip = self.get_object()
+
+        def get_response():
+            prefetch_related_objects([trip], *Trip.objects.get_detail_lookups())
+            return Response(self.get_serializer(trip).data)
+
+        return conditional_response(request, get_trip_validators(trip, 'full'), get_response)
+
+    def save_rows_in_bulk(self, model, input_serializer, output_serializer, validate, save):
+        """
+        Save the itinerary legs or POET lines of the trip posted as a list, with the validate
+        and save functions of trip.bulk. Rows with an id change that row of the trip, the
+        others are added to it. Only the traveler owning the trip may save them.
+        Returns all the rows of the trip once saved.
+        """
+        trip = self.get_object()
+        if not trip.is_owned_by(self.request.user):
+            raise PermissionDenied()
+        serializer = input_serializer(data=self.request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        others = {row.id: row for row in model.objects.filter(trip=trip)}
+        items = serializer.validated_data
+        rows = []
+        errors = {}
+        for index, item in enumerate(items):
+            row_id = item.pop('id', None)
+            if row_id is None:
+                row = model(trip=trip)
+            elif row_id in others:
+                row = others.pop(row_id)
+            else:
+                errors[index] = {'id': ["This row doesn't belong to the trip."]}
+                continue
+            for field, value in item.items():
+                setattr(row, field, value)
+            rows.append(row)
+        if not errors:
+            errors = validate(trip, rows, others.values())
+        if errors:
+            raise ValidationError([errors.get(index, {}) for index in range(len(items))])
+        return Response(output_serializer(save(trip, rows), many=True).data)
+
+    @action(detail=False, url_path='in-the-field')
+    def in_the_field(self, request):
+        """
+        Return the trips in progress on the "date" query parameter, or at any time from
+        "start_date" to "end_date", today by default: who is in the field. The trips are looked
+        up in the trip interval index (trip.intervals) and read back from the database, so
+        trips moved or deleted since the index was loaded are left out, while trips saved by
+        other processes may be missing until the index is reloaded.
+        """
+        dates = {}
+        for key in ('start_date', 'end_date'):
+            value = request.query_params.get(key) or request.query_params.get('date')
+            try:
+                dates[key] = parse_date(value) if value else timezone.now().date()
+            except ValueError:
+                dates[key] = None
+            if dates[key] is None:
+                raise ValidationError({key: 'Enter a date as YYYY-MM-DD.'})
+        trip_ids = {trip.trip_id for trip in trip_index.trips_between(
+            dates['start_date'], dates['end_date'])}
+        trips = self.get_queryset().filter(
+            id__in=trip_ids, start_date__lte=dates['end_date'],
+            end_date__gte=dates['start_date']).order_by('start_date', 'id')
+        return Response(self.get_serializer(trips, many=True).data)
+
+    @action(detail=True, methods=['post'])
+    def itinerary(self, request, pk=None):
+        """
+        Add or change legs of the trip's itinerary in bulk. The legs are checked against the
+        trip dates and the other legs, and saved in one transaction. Returns the itinerary.
+        """
+        return self.save_rows_in_bulk(TripItinerary, TripItineraryBulkSerializer,
+                                      TripItinerarySerializer, validate_itinerary,
+                                      save_itinerary)
+
+    @action(detail=True, methods=['post'])
+    def poet(self, request, pk=None):
+        """
+        Add or change POET lines of the trip in bulk, in one transaction. Returns the trip's
+        POET lines.
+        """
+        return self.save_rows_in_bulk(TripPOET, TripPOETBulkSerializer, TripPOETSerializer,
+                                      validate_poet, save_poet)
+
+
+class TripTravelerDependantsViewSet(TripAPIMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    This class implements views for the dependants travelling on the Trips.
     """
     serializer_class = TripTravelerDependantsSerializer
     queryset = TripTravelerDependants.objects.all()
+    keyset = ('-trip_id', 'id')
+
+    def get_queryset(self):
+        return TripTravelerDependants.objects.filter(
+            trip__in=self.get_visible_trips()).select_related(
+            'dependants_travelling__user_account')
 
 
-class TripApprovalViewSet(viewsets.ModelViewSet):
+class TripApprovalViewSet(TripAPIMixin, viewsets.ReadOnlyModelViewSet):
     """
-    This class implements views for the Trips.
+    This class implements views for the Trip approvals, most recent request first.
     """
     serializer_class = TripApprovalSerializer
     queryset = TripApproval.objects.all()
+    keyset = ('-approval_request_date', '-id')
 
+    def get_queryset(self):
+        return TripApproval.objects.filter(trip__in=self.get_visible_trips())
 
-class TripItineraryViewSet(viewsets.ModelViewSet):
+
+class TripItineraryViewSet(TripAPIMixin, viewsets.ReadOnlyModelViewSet):
     """
-    This class implements views for the Trips.
+    This class implements views for the Trip itinerary legs, latest departure first.
     """
     serializer_class = TripItinerarySerializer
     queryset = TripItinerary.objects.all()
+    keyset = ('-date_of_departure', '-time_of_departure', '-id')
+
+    def get_queryset(self):
+        return TripItinerary.objects.filter(trip__in=self.get_visible_trips())
+
+
+class TripSyncView(APIView):
+    """
+    Delta sync of the trips the user may see, with their itinerary, POET and approvals.
+    Send the token of the previous sync as the "since" query parameter to only get the rows
+    changed and the ids of the rows deleted since; see trip.sync.
+    """
+    serializers = (
+        ('trips', TripSerializer),
+        ('itinerary', TripItinerarySerializer),
+        ('poet', TripPOETSerializer),
+        ('approvals', TripApprovalSerializer),
+    )
+
+    def get(self, request):
+        """
+        Return the changes since the token and the token of the next sync.
+        """
+        try:
+            changes = get_changes(request.user, request.query_params.get('since'))
+        except ValueError:
+            raise ValidationError({'since': 'Invalid token.'})
+        data = {'token': changes['token'], 'full': changes['full']}
+        for key, serializer_class in self.serializers:
+            data[key] = serializer_class(changes[key], many=True).data
+        data['deleted'] = changes['deleted']
+        return Response(data)
 
 
 # Non-API views
@@ -88,9 +285,17 @@ class TripCreateView(LoginRequiredMixin, PermissionRequiredMixin,CreateView):
         'page_title': 'New Trip'
     }
 
+    def get_form_kwargs(self):
+        """
+        Pass the traveler to the form so that it can check for overlapping trips.
+        """
+        kwargs = super().get_form_kwargs()
+        kwargs['traveler'] = TravelerProfile.objects.get(user_account=self.request.user)
+        return kwargs
+
     def form_valid(self, form):
         self.object = form.save(commit=False)
-        self.object.traveler = TravelerProfile.objects.get(user_account=self.request.user)
+        self.object.traveler = form.traveler
         self.object.save()
         return HttpResponseRedirect(self.get_success_url())
 
@@ -125,8 +330,19 @@ class TripUpdateView(LoginRequiredMixin, PermissionRequiredMixin, TripUtilsMixin
                 )
         return super().get(request, *args, **kwargs)
 
-    # def form_valid(self, form):
-        # TODO invalidate the approval.
+    def form_valid(self, form):
+        """
+        Save the trip and invalidate any approvals it has since the details being approved
+        have changed. Both are done in one transaction so the changed trip is never saved with
+        its old approvals in force.
+        """
+        with transaction.atomic():
+            response = super().form_valid(form)
+            invalidated = self.object.invalidate_approval() if form.has_changed() else 0
+        if invalidated:
+            messages.info(self.request, f"{invalidated} existing approval(s) of this trip "
+                "have been invalidated. Please submit the trip for approval again.")
+        return response
 
 
 class TripDetailView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, DetailView):
@@ -151,17 +367,26 @@ class TripDetailView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, De
         """
         Check that the user has permission for the instance or is an approver.
         """
-        trip = self.get_object()
+        trip = self.object = self.get_object()
         traveler = trip.traveler
         user = self.request.user
         logger.debug("--------Checking whether %s should see this view", user)
-        return ('view_trip' in get_perms(user, trip) or
-                self.user_is_approver(traveler, security_level=1) or
-                self.user_is_approver(traveler, security_level=2) or
-                self.user_is_approver(traveler, security_level=3) or
+        return (user.has_perm('trip.view_trip', trip) or
+                self.user_is_approver(traveler) or
                 traveler.is_managed_by == self.request.user
                 )
 
+    def get(self, request, *args, **kwargs):
+        """
+        Answer with 304 Not Modified if the user's copy of the page is current, without
+        loading the itinerary and POET or rendering the page. The page depends on who views
+        it, so its ETag does too.
+        """
+        trip = self.object or self.get_object()
+        return conditional_response(request,
+                                    get_trip_validators(trip, 'trip_details', request.user.id),
+                                    partial(super().get, request, *args, **kwargs))
+
     def get_context_data(self, **kwargs):
         """
         Add itinerary to context.
@@ -203,7 +428,9 @@ class TripDetailView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, De
 
     def send_success_emails(self, trip, approval_request, approver):
         """
-        Send email to the requester and approver once an approval request is made.
+        Queue emails to the requester and approver once an approval request is made.
+        The emails are sent by the sendqueuedemails command. An approver on the daily digest
+        is only emailed here if the trip is mission critical.
         Args:
             trip is an instance of Trips model for which approval is being requested.
             request is the HTTP request in which the request was made.
@@ -212,49 +439,40 @@ class TripDetailView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, De
             approver is an instance of settings.USER_MODEL
         """
         subject_line = f"Trip Approval Requested: {trip.trip_name} beginning on {trip.start_date}"
-        approver_context = {
-            'trip': trip,
-            'recipient': approver.user.first_name,
-            'host': self.request.get_host(),
-            'scheme': self.request.scheme,
-            'approval_request': approval_request,
-        }
-
         requester_context = {
             'recipient': trip.traveler.user_account.first_name,
             'trip': trip
         }
-
-        approver_html_message = render_to_string('emails/approval_request_approver.html',
-                                                approver_context)
-        approver_plain_message = strip_tags(approver_html_message)
-        requester_html_message = render_to_string('emails/approval_request_requester.html',
-                                                requester_context)
-        requester_plain_message = strip_tags(requester_html_message)
-
-        approver_mail = (
-            subject_line,
-            approver_plain_message,
-            approver_html_message,
-            settings.EMAIL_HOST_USER,
-            [approver.user.email,],
-        )
-        requester_mail = (
+        requester_plain_message, requester_html_message = render_email(
+            'approval_request_requester', requester_context)
+        email_messages = [(
             subject_line,
             requester_plain_message,
             requester_html_message,
             settings.EMAIL_HOST_USER,
             [trip.traveler.user_account.email,],
-            )
+        )]
+
+        # approvers on the daily digest get the request in the sendapprovaldigests email
+        if approver.wants_immediate_email(trip):
+            approver_context = {
+                'trip': trip,
+                'recipient': approver.user.first_name,
+                'host': self.request.get_host(),
+                'scheme': self.request.scheme,
+                'approval_request': approval_request,
+            }
+            approver_plain_message, approver_html_message = render_email(
+                'approval_request_approver', approver_context)
+            email_messages.append((
+                subject_line,
+                approver_plain_message,
+                approver_html_message,
+                settings.EMAIL_HOST_USER,
+                [approver.user.email,],
+            ))
 
-        try:
-            send_mass_html_mail((approver_mail, requester_mail))
-        except SMTPRecipientsRefused as error:
-            messages.error(self.request, "We were unable to send emails to one or more recipients. \
-                Your approver may not have received the email but they can view the request by \
-                checking their pending approval requests on the system. Please contact IT for \
-                troubleshooting.")
-            print(f"The following error was encountered when sending the emails: {error}")
+        OutboxEmail.objects.queue(email_messages)
 
     def form_valid(self, request, *args, **kwargs):
         """
@@ -277,10 +495,10 @@ class TripDetailView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, De
                 f" {security_level}. This is not allowed")
             return self.get(request, *args, **kwargs)
 
-        approval_request = trip.request_approval(security_level, approver)
-
-        # send email to requester and approver
-        self.send_success_emails(trip, approval_request, approver)
+        with transaction.atomic():
+            approval_request = trip.request_approval(security_level, approver)
+            # queue emails to requester and approver
+            self.send_success_emails(trip, approval_request, approver)
         messages.success(request, """Your request for approval has been sent.""")
         return HttpResponseRedirect(self.get_success_url())
 
@@ -307,27 +525,47 @@ class TripDetailView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, De
         return HttpResponseRedirect(self.get_success_url())
 
 
-class TripListView(LoginRequiredMixin, PermissionListMixin, ListView):
+class TripListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
     This class implements the listing view for the Trip model.
+    It lists the trips of the logged on user, most recent first unless another order is
+    picked with the "sort" query parameter.
     """
     model = Trip
+    keyset = ("-start_date", "-id")
+    sort_keysets = {
+        "start_date": ("start_date", "id"),
+        "-start_date": ("-start_date", "-id"),
+        "trip_name": ("trip_name", "id"),
+        "-trip_name": ("-trip_name", "-id"),
+    }
     context_object_name = "trips"
     return_403 = True
-    permission_required = "trip.view_trip"
     template_name = "trip/view_trips.html"
     extra_context = {
         "page_title": "My Trips"
     }
 
-    def get_queryset(self, *args, **kwargs):
+    def get_sort(self):
+        """Return the sort order picked in the request, defaulting to most recent first."""
+        sort = self.request.GET.get("sort")
+        return sort if sort in self.sort_keysets else "-start_date"
+
+    def get_keyset(self):
+        return self.sort_keysets[self.get_sort()]
+
+    def get_queryset(self):
         """
-        Limit the trips to those belonging to the logged on user.
+        Limit the trips to those belonging to the logged on user, loading only the columns
+        the list shows.
         """
-        queryset = super().get_queryset(*args, **kwargs)
-        queryset.filter(traveler__user_account=self.request.user)
-        logger.error("Obtaining trips for %s", self.request.user)
-        return queryset
+        return Trip.objects.filter(traveler__user_account=self.request.user).only(
+            "id", "trip_name", "start_date", "end_date", "reason_for_travel", "approval_stage")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["sort"] = self.get_sort()
+        return context
 
 
 class TripDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
@@ -354,6 +592,45 @@ class TripDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
         return super().get(request, *args, **kwargs)
 
 
+class TripBulkEditMixin(UserPassesTestMixin):
+    """
+    Edit the itinerary legs or POET lines of a trip with a formset saved in bulk
+    (BaseTripBulkFormSet). The trip is read from the url on every request, so posts don't
+    depend on the session. Only the traveler owning the trip may edit them.
+    """
+    return_403 = True
+    template_name = 'trip/bulk_edit_trip_rows.html'
+    trip = None
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        add the associated trip to the view.
+        """
+        self.trip = get_object_or_404(Trip, id=kwargs.get('trip_id'))
+        return super().dispatch(request, *args, **kwargs)
+
+    def test_func(self):
+        """
+        verify that the user editing the rows owns the associated trip.
+        """
+        return self.trip.is_owned_by(self.request.user)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['instance'] = self.trip
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['formset'] = context['form']
+        context['trip'] = self.trip
+        return context
+
+    def form_valid(self, form):
+        form.save()
+        return HttpResponseRedirect(self.trip.get_absolute_url())
+
+
 # Trip POET details
 class TripPOETCreateView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, CreateView):
     """
@@ -416,6 +693,17 @@ class TripPOETDeleteView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView
     permission_required = "trip.delete_trippoet"
 
 
+class TripPOETBulkView(LoginRequiredMixin, TripBulkEditMixin, FormView):
+    """
+    This class implements the view to add and edit all the POET lines of a trip at once.
+    """
+    form_class = TripPOETFormSet
+    extra_context = {
+        'page_title': 'Trip POET Details',
+        'section_title': 'POET Details'
+    }
+
+
 # Trip Itinerary
 class TripItineraryCreateView(LoginRequiredMixin, TripUtilsMixin, CreateView):
     """
@@ -500,6 +788,18 @@ class TripItineraryDeleteView(LoginRequiredMixin, PermissionRequiredMixin, Delet
     }
 
 
+class TripItineraryBulkView(LoginRequiredMixin, TripBulkEditMixin, FormView):
+    """
+    This class implements the view to add and edit all the legs of a trip's itinerary at once.
+    The legs are checked against the trip dates before any is saved.
+    """
+    form_class = TripItineraryFormSet
+    extra_context = {
+        'page_title': 'Trip Itinerary',
+        'section_title': 'Itinerary'
+    }
+
+
 # Trip approvals
 class ApproveTripView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, UpdateView):
     """
@@ -530,10 +830,12 @@ class ApproveTripView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, U
             not trip.is_owned_by(self.request.user)
         )
 
+    @transaction.atomic
     def form_valid(self, form):
         """
-        If the form is valid, update the Approval model and send email to requester.
-        If trip was approved send an approval email, otherwise send a disapproval email.
+        If the form is valid, update the Approval model and queue email to requester.
+        If trip was approved queue an approval email, otherwise queue a disapproval email.
+        The approval and its emails are saved in one transaction.
         """
         approval = form.save(commit=False)
         approval.approval_date = timezone.now().date()
@@ -545,6 +847,7 @@ class ApproveTripView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, U
         email_messages = []
         context = {
             'approval_object': approval,
+            'recipient': approval.trip.traveler.user_account.first_name,
         }
 
         if approval.trip_is_approved:
@@ -555,9 +858,7 @@ class ApproveTripView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, U
 
             # draft success email to requester
             subject = "Trip Approved"
-            context["recipient"] = approval.trip.traveler.user_account.first_name
-            html_message = render_to_string('emails/approval_confirmation_approved.html', context)
-            plain_message = strip_tags(html_message)
+            plain_message, html_message = render_email('approval_confirmation_approved', context)
             approval_mail = (
                 subject,
                 plain_message,
@@ -605,8 +906,7 @@ class ApproveTripView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, U
                         trip = approval_request.trip
                         subject = f"Trip Approval Requested: {trip.trip_name} beginning on {trip.start_date}"
                         context["trip"] = trip
-                        html_message = render_to_string('emails/approval_request_requester.html', context)
-                        plain_message = strip_tags(html_message)
+                        plain_message, html_message = render_email('approval_request_requester', context)
                         approval_request_mail = (
                             subject,
                             plain_message,
@@ -615,30 +915,29 @@ class ApproveTripView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, U
                             [requester_email,],
                             )
                         email_messages.append(approval_request_mail)
-                        # draft email to next approver
-                        context['recipient'] = approver.user.first_name
-                        context['host'] = self.request.get_host()
-                        context['scheme'] = self.request.scheme
-                        context['approval_request'] = approval_request
-                        subject = f"Trip Approval Requested: {trip.trip_name} beginning on {trip.start_date}"
-                        html_message = render_to_string('emails/approval_request_approver.html', context)
-                        plain_message = strip_tags(html_message)
-                        approver_request_mail = (
-                            subject,
-                            plain_message,
-                            html_message,
-                            settings.EMAIL_HOST_USER,
-                            [approver.user.email,],
-                            )
-                        email_messages.append(approver_request_mail)
+                        # draft email to next approver unless they are on the daily digest
+                        if approver.wants_immediate_email(trip):
+                            context['recipient'] = approver.user.first_name
+                            context['host'] = self.request.get_host()
+                            context['scheme'] = self.request.scheme
+                            context['approval_request'] = approval_request
+                            plain_message, html_message = render_email(
+                                'approval_request_approver', context)
+                            approver_request_mail = (
+                                subject,
+                                plain_message,
+                                html_message,
+                                settings.EMAIL_HOST_USER,
+                                [approver.user.email,],
+                                )
+                            email_messages.append(approver_request_mail)
 
                 else:
                     # handle no approver
                     subject = "No Approver Set"
                     context['recipient'] = approval.trip.traveler.user_account.first_name
                     context['security_level'] = next_security_level
-                    html_message = render_to_string('emails/no_approver.html', context)
-                    plain_message = strip_tags(html_message)
+                    plain_message, html_message = render_email('no_approver', context)
                     no_approver_mail = (
                         subject,
                         plain_message,
@@ -656,8 +955,7 @@ class ApproveTripView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, U
 
             # prepare email to requester
             subject = "Trip Declined"
-            html_message = render_to_string('emails/approval_confirmation_declined.html', context)
-            plain_message = strip_tags(html_message)
+            plain_message, html_message = render_email('approval_confirmation_declined', context)
             approval_mail = (
                 subject,
                 plain_message,
@@ -667,16 +965,13 @@ class ApproveTripView(LoginRequiredMixin, UserPassesTestMixin, TripUtilsMixin, U
                 )
             email_messages.append(approval_mail)
 
-        # send emails
-        try:
-            send_mass_html_mail(tuple(email_messages))
-        except SMTPRecipientsRefused as error:
-            pass # TODO handle error better
+        # queue emails to be sent by the sendqueuedemails command
+        OutboxEmail.objects.queue(email_messages)
 
         return HttpResponseRedirect(self.get_success_url())
 
 
-class TripApprovalListView(LoginRequiredMixin, ListView):
+class TripApprovalListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
     This class displays trips whose details have been filled and submitted for approval.
     Depending on the url called, there are dfferent keywords to filter the queryset to return the
@@ -688,6 +983,7 @@ class TripApprovalListView(LoginRequiredMixin, ListView):
     return_403 = True
     template_name = 'trip/list_trips.html'
     page_title = None
+    keyset = ("trip__start_date", "id")
 
     def get(self, request, *args, **kwargs):
         """
@@ -695,24 +991,16 @@ class TripApprovalListView(LoginRequiredMixin, ListView):
         """
         filter_by = kwargs['filter_by']
         user = request.user
-        # queryset = self.model.objects.filter(
-        #     Q(trip__traveler__approver__user=user) |
-        #     Q(trip__traveler__department__trip_approver__user=user)
-        #     )
-        queryset = self.model.objects.all()
+        queryset = self.model.objects.with_trip_details()
         if filter_by:
             if filter_by == "upcoming":
-                queryset = queryset.filter(trip__start_date__gt = timezone.now().date())
+                queryset = queryset.approvable_by(user).upcoming(timezone.now().date())
                 self.page_title = "Upcoming Trips"
             elif filter_by == "ongoing":
-                queryset = queryset.filter(
-                                trip__start_date__lte = timezone.now().date(),
-                                trip__end_date__gte = timezone.now().date(),
-                                trip_is_approved = True
-                                )
+                queryset = queryset.approvable_by(user).ongoing(timezone.now().date())
                 self.page_title = "Ongoing Trips"
             elif filter_by== 'awaiting_approval':
-                queryset = queryset.filter(trip_is_approved=False).filter(acted_upon=False).filter(approver__user=user)
+                queryset = queryset.awaiting_approval(user)
                 self.page_title = "Trips Awaiting Approval"
         self.queryset = queryset
         return super().get(request, *args, **kwargs)
@@ -0,0 +1,46 @@
+"""
+Conditional GET for views whose content is stamped by a few cheap columns.
+
+A view reads an ETag and a Last-Modified date from indexed columns of the object it shows,
+such as Trip.created_on and the trip's approval state. When the client's If-None-Match or
+If-Modified-Since header shows its copy is current, 304 Not Modified is returned without
+loading the rest of the object or rendering it.
+"""
+import hashlib
+from calendar import timegm
+
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*values):
+    """
+    Return a quoted ETag hashing the values. The values must identify the representation,
+    so views include the user when the content depends on who is asking.
+    """
+    digest = hashlib.md5("|".join(str(value) for value in values).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def conditional_response(request, validators, get_response):
+    """
+    Answer a GET request conditionally.
+
+    validators is an (etag, last_modified) tuple, or None when they aren't known, for
+    example because the object doesn't exist; the request is then answered as usual.
+    Returns 304 Not Modified if the client's copy matches, else get_response() with the
+    ETag and Last-Modified headers set. Requests with messages waiting to be shown are
+    always answered in full, since a cached page wouldn't show them.
+    """
+    if validators is None or len(get_messages(request)):
+        return get_response()
+    etag, last_modified = validators
+    timestamp = timegm(last_modified.utctimetuple())
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = get_response()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(timestamp)
+    return response
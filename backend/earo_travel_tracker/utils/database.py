@@ -0,0 +1,79 @@
+"""
+Database configuration read from the environment.
+
+DATABASE_ENGINE selects the profile:
+    sqlite      the bundled SQLite database, db.sqlite3 (the default)
+    sqlite-wal  the bundled SQLite database in WAL mode, through the utils.sqlite3 backend
+    postgresql  a PostgreSQL server, through the utils.postgresql backend
+
+The SQLite profiles read the path of the database file from DATABASE_NAME. The WAL profile
+lets readers and a writer work at the same time and has writers wait up to
+DATABASE_BUSY_TIMEOUT milliseconds (5000 by default) for each other instead of failing with
+"database is locked". It suits single node deployments with a few concurrent users.
+
+The PostgreSQL profile reads DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST
+and DATABASE_PORT. Connections persist across requests for DATABASE_CONN_MAX_AGE seconds
+(60 by default) and are checked before they are reused. Setting DATABASE_POOL_SIZE keeps up
+to that many idle connections in an in-process pool instead; connections then go back to the
+pool at the end of each request.
+"""
+import os
+
+PROFILES = ('sqlite', 'sqlite-wal', 'postgresql')
+
+
+def get_databases(base_dir, environ=None, password=''):
+    """
+    Return the DATABASES setting for the profile selected in the environment, which defaults
+    to os.environ. password is used when DATABASE_PASSWORD isn't set.
+    """
+    environ = os.environ if environ is None else environ
+    profile = environ.get('DATABASE_ENGINE', 'sqlite')
+    if profile not in PROFILES:
+        raise ValueError(f"DATABASE_ENGINE must be one of {', '.join(PROFILES)}, not {profile}")
+
+    if profile == 'sqlite':
+        return {
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': environ.get('DATABASE_NAME', os.path.join(base_dir, 'db.sqlite3')),
+            }
+        }
+
+    if profile == 'sqlite-wal':
+        busy_timeout = int(environ.get('DATABASE_BUSY_TIMEOUT', 5000))
+        return {
+            'default': {
+                'ENGINE': 'utils.sqlite3',
+                'NAME': environ.get('DATABASE_NAME', os.path.join(base_dir, 'db.sqlite3')),
+                'OPTIONS': {'timeout': busy_timeout / 1000},
+                'PRAGMAS': {
+                    'journal_mode': 'WAL',
+                    # in WAL mode a commit survives a crash of the application but not of the OS
+                    'synchronous': 'NORMAL',
+                    'busy_timeout': busy_timeout,
+                    'mmap_size': 256 * 1024 * 1024,
+                    # negative sizes are in KiB
+                    'cache_size': -32 * 1024,
+                    'temp_store': 'MEMORY',
+                },
+                # take the write lock when a transaction begins, see utils.sqlite3
+                'TRANSACTION_MODE': 'IMMEDIATE',
+            }
+        }
+
+    pool_size = int(environ.get('DATABASE_POOL_SIZE', 0))
+    return {
+        'default': {
+            'ENGINE': 'utils.postgresql',
+            'NAME': environ.get('DATABASE_NAME', 'earo_travel_tracker'),
+            'USER': environ.get('DATABASE_USER', ''),
+            'PASSWORD': environ.get('DATABASE_PASSWORD', password),
+            'HOST': environ.get('DATABASE_HOST', ''),
+            'PORT': environ.get('DATABASE_PORT', ''),
+            # pooled connections are returned to the pool at the end of each request
+            'CONN_MAX_AGE': 0 if pool_size else int(environ.get('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'POOL': {'MAX_IDLE': pool_size} if pool_size else None,
+        }
+    }
@@ -1,7 +1,17 @@
 """
 Define custom methods for email needs to covered by django default implementation.
 """
+import atexit
+import smtplib
+import threading
+import time
+
+from django.conf import settings
 from django.core.mail import get_connection, EmailMultiAlternatives
+from django.core.mail.backends import smtp
+from django.core.mail.message import sanitize_address
+from django.template import Context
+from django.template.loader import get_template
 
 def send_mass_html_mail(datatuple, fail_silently=False, user=None, password=None,
                         connection=None):
@@ -24,3 +34,196 @@ def send_mass_html_mail(datatuple, fail_silently=False, user=None, password=None
         message.attach_alternative(html, 'text/html')
         messages.append(message)
     return connection.send_messages(messages)
+
+
+class EmailTemplate:
+    """
+    The compiled templates emails/<name>.html and emails/<name>.txt that make up the html and
+    plain text parts of an email. The plain text template is rendered without autoescaping.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.html = get_template(f"emails/{name}.html").template
+        self.text = get_template(f"emails/{name}.txt").template
+
+    def render(self, context):
+        """
+        Render the email for a context dict. Returns a (text_content, html_content) tuple.
+        """
+        return self.render_batch([context])[0]
+
+    def render_batch(self, contexts, common_context=None):
+        """
+        Render the email for each context dict in contexts, typically one per recipient.
+        Values shared by all of them can be given once in common_context.
+        Returns a list of (text_content, html_content) tuples.
+        """
+        html_context = Context(common_context or {})
+        text_context = Context(common_context or {}, autoescape=False)
+        rendered = []
+        for context in contexts:
+            with html_context.push(context), text_context.push(context):
+                rendered.append((self.text.render(text_context), self.html.render(html_context)))
+        return rendered
+
+
+_email_templates = {}
+
+
+def get_email_template(name):
+    """
+    Return the EmailTemplate called name. Templates are compiled once per process, so
+    changes to the email templates need a restart to show.
+    """
+    try:
+        return _email_templates[name]
+    except KeyError:
+        return _email_templates.setdefault(name, EmailTemplate(name))
+
+
+def render_email(name, context):
+    """
+    Render the email called name for a context dict.
+    Returns a (text_content, html_content) tuple.
+    """
+    return get_email_template(name).render(context)
+
+
+class SMTPConnectionPool:
+    """
+    Process wide pool of open, authenticated SMTP connections.
+
+    Connections are kept per (host, port, username, use_tls, use_ssl) so that backends
+    configured for different servers never share one. At most max_idle connections are kept
+    per server, and connections idle for longer than idle_timeout seconds are closed instead
+    of being reused since mail servers drop idle clients.
+    """
+    def __init__(self, max_idle=None, idle_timeout=None):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    def get_max_idle(self):
+        """Return the number of idle connections kept per server."""
+        if self.max_idle is not None:
+            return self.max_idle
+        return getattr(settings, "EMAIL_POOL_MAX_IDLE", 4)
+
+    def get_idle_timeout(self):
+        """Return the number of seconds after which an idle connection is closed."""
+        if self.idle_timeout is not None:
+            return self.idle_timeout
+        return getattr(settings, "EMAIL_POOL_IDLE_TIMEOUT", 60)
+
+    @staticmethod
+    def discard(connection):
+        """Close a connection without raising if the server has already dropped it."""
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def acquire(self, key):
+        """
+        Take a live connection to the server identified by key out of the pool.
+        Returns None if there is none.
+        """
+        while True:
+            with self.lock:
+                connections = self.idle.get(key)
+                if not connections:
+                    return None
+                connection, released_at = connections.pop()
+            if time.monotonic() - released_at > self.get_idle_timeout():
+                self.discard(connection)
+                continue
+            try:
+                # a cheap round trip to find connections the server has closed
+                if connection.noop()[0] == 250:
+                    return connection
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.discard(connection)
+
+    def release(self, key, connection):
+        """
+        Return a connection to the pool, closing it if the pool for the server is full.
+        """
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.get_max_idle():
+                connections.append((connection, time.monotonic()))
+                return
+        self.discard(connection)
+
+    def clear(self):
+        """Close all idle connections."""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                self.discard(connection)
+
+
+smtp_pool = SMTPConnectionPool()
+atexit.register(smtp_pool.clear)
+
+
+class PooledEmailBackend(smtp.EmailBackend):
+    """
+    SMTP email backend that takes its connection from smtp_pool and returns it there on
+    close() instead of quitting, so that the TCP, STARTTLS and AUTH handshake is done once
+    per pooled connection rather than once per send. A connection the server drops while
+    sending is replaced and the message sent again once.
+
+    Each backend instance holds at most one connection at a time, so one instance per
+    thread (which is what get_connection() gives) is safe to use concurrently.
+    """
+    pool = smtp_pool
+
+    def get_pool_key(self):
+        """Return the key of the server this backend connects to."""
+        return (self.host, self.port, self.username, self.use_tls, self.use_ssl)
+
+    def open(self):
+        if self.connection:
+            return False
+        connection = self.pool.acquire(self.get_pool_key())
+        if connection is not None:
+            self.connection = connection
+            return True
+        return super().open()
+
+    def close(self):
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        self.pool.release(self.get_pool_key(), connection)
+
+    def reconnect(self):
+        """Replace a connection that the server has dropped with a new one."""
+        self.pool.discard(self.connection)
+        self.connection = None
+        super().open()
+
+    def _send(self, email_message):
+        if not email_message.recipients() or self.connection is None:
+            return False
+        encoding = email_message.encoding or settings.DEFAULT_CHARSET
+        from_email = sanitize_address(email_message.from_email, encoding)
+        recipients = [sanitize_address(addr, encoding) for addr in email_message.recipients()]
+        message = email_message.message().as_bytes(linesep='\r\n')
+        try:
+            try:
+                self.connection.sendmail(from_email, recipients, message)
+            except smtplib.SMTPServerDisconnected:
+                self.reconnect()
+                if self.connection is None:
+                    return False
+                self.connection.sendmail(from_email, recipients, message)
+        except smtplib.SMTPException:
+            if not self.fail_silently:
+                raise
+            return False
+        return True
@@ -0,0 +1,199 @@
+"""
+Per-request query and timing statistics.
+
+RequestStatsMiddleware measures a sample of the requests: the number of SQL queries, the time
+spent in them, the queries repeated with the same SQL (usually a query run in a loop) and the
+time spent rendering templates. The measurements are logged when they exceed the configured
+thresholds and kept per URL name in a rolling window, which staff can read as JSON from
+request_stats_view.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def get_fingerprint(sql):
+    """
+    Reduce a query to its shape so that the same query run with different parameters,
+    literals or IN list lengths gives the same fingerprint.
+    """
+    return _LITERALS.sub("?", _IN_LIST.sub("IN (...)", sql))
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting and timing the queries of a request.
+    """
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[get_fingerprint(sql)] += 1
+
+    def get_duplicates(self):
+        """Return the fingerprints run more than once with the number of times they ran."""
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+
+class RequestStats:
+    """
+    Rolling window of the measurements of the latest requests to each URL name.
+    """
+    def __init__(self, window=None):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.duplicates = defaultdict(Counter)
+
+    def get_window(self):
+        """Return the number of requests kept per URL name."""
+        if self.window is not None:
+            return self.window
+        return getattr(settings, "REQUEST_STATS_WINDOW", 500)
+
+    def record(self, url_name, sample, duplicates):
+        """
+        Add the measurements of a request. sample is a dict of the measured values.
+        """
+        with self.lock:
+            if url_name not in self.samples:
+                self.samples[url_name] = deque(maxlen=self.get_window())
+            self.samples[url_name].append(sample)
+            self.duplicates[url_name].update(duplicates)
+
+    def clear(self):
+        """Forget all measurements."""
+        with self.lock:
+            self.samples.clear()
+            self.duplicates.clear()
+
+    @staticmethod
+    def summarize(values):
+        """Return the mean, median, 95th percentile and maximum of a list of numbers."""
+        values = sorted(values)
+        return {
+            "mean": sum(values) / len(values),
+            "p50": values[len(values) // 2],
+            "p95": values[min(int(len(values) * 0.95), len(values) - 1)],
+            "max": values[-1],
+        }
+
+    def get_aggregates(self):
+        """
+        Return the aggregates of the measurements per URL name.
+        """
+        with self.lock:
+            samples = {url_name: list(values) for url_name, values in self.samples.items()}
+            duplicates = {url_name: counter.most_common(5)
+                          for url_name, counter in self.duplicates.items()}
+        aggregates = {}
+        for url_name, values in samples.items():
+            aggregates[url_name] = {
+                "requests": len(values),
+                **{key: self.summarize([value[key] for value in values]) for key in values[0]},
+                "duplicate_queries": [
+                    {"sql": sql, "count": count} for sql, count in duplicates[url_name]
+                ],
+            }
+        return aggregates
+
+
+request_stats = RequestStats()
+
+
+class RequestStatsMiddleware:
+    """
+    Measure REQUEST_STATS_SAMPLE_RATE of the requests. Requests that run more than
+    REQUEST_STATS_MAX_QUERIES queries, spend more than REQUEST_STATS_MAX_SQL_TIME seconds in
+    SQL or repeat a query more than REQUEST_STATS_MAX_DUPLICATES times are logged at WARNING.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def should_sample():
+        """Decide whether to measure the request."""
+        return random.random() < getattr(settings, "REQUEST_STATS_SAMPLE_RATE", 0)
+
+    def __call__(self, request):
+        if not self.should_sample():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        request.render_time = 0.0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total_time = time.perf_counter() - started
+
+        match = request.resolver_match
+        url_name = match.view_name if match is not None else None
+        duplicates = recorder.get_duplicates()
+        request_stats.record(url_name, {
+            "queries": recorder.count,
+            "sql_time": recorder.time,
+            "render_time": request.render_time,
+            "total_time": total_time,
+            "duplicate_queries": sum(duplicates.values()) - len(duplicates),
+        }, duplicates)
+        self.check_thresholds(request, url_name, recorder, duplicates)
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Time the rendering of template responses, which happens after the view returns.
+        """
+        if hasattr(request, "render_time"):
+            started = time.perf_counter()
+
+            def record_render_time(rendered_response):
+                request.render_time += time.perf_counter() - started
+
+            response.add_post_render_callback(record_render_time)
+        return response
+
+    @staticmethod
+    def check_thresholds(request, url_name, recorder, duplicates):
+        """Log the request if it exceeds a threshold."""
+        max_queries = getattr(settings, "REQUEST_STATS_MAX_QUERIES", 50)
+        max_sql_time = getattr(settings, "REQUEST_STATS_MAX_SQL_TIME", 0.5)
+        max_duplicates = getattr(settings, "REQUEST_STATS_MAX_DUPLICATES", 5)
+        if recorder.count > max_queries or recorder.time > max_sql_time:
+            logger.warning("%s (%s) ran %d queries taking %.3fs", request.path, url_name,
+                           recorder.count, recorder.time)
+        for sql, count in duplicates.items():
+            if count > max_duplicates:
+                logger.warning("%s (%s) ran the same query %d times: %s", request.path,
+                               url_name, count, sql)
+
+
+@staff_member_required
+def request_stats_view(request):
+    """
+    Return the rolling aggregates of the measured requests per URL name as JSON.
+    """
+    return JsonResponse(request_stats.get_aggregates())
@@ -0,0 +1,248 @@
+"""
+Keyset (cursor) pagination for list views and REST framework lists.
+
+Unlike django's Paginator, which uses OFFSET and counts the whole table, a keyset page is
+selected by filtering on the ordering columns of the last row of the previous page. Every
+page therefore costs the same indexed lookup regardless of how deep into the list it is.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+# Third party imports
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(values, direction="next"):
+    """
+    Encode the keyset values of a row and the paging direction into an opaque cursor.
+    """
+    payload = json.dumps({"d": direction, "v": [str(value) for value in values]})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor created by encode_cursor into a (values, direction) tuple.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        values, direction = payload["v"], payload["d"]
+    except (TypeError, KeyError, UnicodeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+    if direction not in ("next", "previous") or not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values, direction
+
+
+def get_keyset_values(keyset, obj):
+    """Return the values of the keyset fields for a row."""
+    values = []
+    for field in keyset:
+        value = obj
+        for attribute in field.lstrip("-").split("__"):
+            value = getattr(value, attribute)
+        values.append(value)
+    return values
+
+
+def get_keyset_field(model, name):
+    """Return the model field a keyset field name refers to, following relations."""
+    *relations, name = name.split("__")
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def clean_keyset_values(model, keyset, values):
+    """
+    Convert the values decoded from a cursor to the python values of the keyset fields.
+    Raises ValueError if a value isn't valid for its field.
+    """
+    cleaned = []
+    for field, value in zip(keyset, values):
+        try:
+            cleaned.append(get_keyset_field(model, field.lstrip("-")).to_python(value))
+        except (TypeError, ValidationError) as error:
+            raise ValueError("Invalid cursor") from error
+    return cleaned
+
+
+def get_keyset_filter(keyset, values, direction):
+    """
+    Build the filter selecting the rows after (or before) the row with the given values.
+    """
+    keyset_filter = Q()
+    for index, field in enumerate(keyset):
+        descending = field.startswith("-")
+        name = field.lstrip("-")
+        lookup = "lt" if descending == (direction == "next") else "gt"
+        condition = Q(**{f"{name}__{lookup}": values[index]})
+        for previous_field, value in zip(keyset[:index], values):
+            condition &= Q(**{previous_field.lstrip("-"): value})
+        keyset_filter |= condition
+    return keyset_filter
+
+
+def paginate_by_keyset(queryset, keyset, cursor, page_size):
+    """
+    Select the page of the queryset following the cursor, or the first page without one,
+    ordered on the keyset. Returns a KeysetPage.
+    Raises ValueError if the cursor is malformed or its values don't match the keyset.
+    """
+    direction = "next"
+    if cursor:
+        values, direction = decode_cursor(cursor)
+        if len(values) != len(keyset):
+            raise ValueError("Invalid cursor")
+        values = clean_keyset_values(queryset.model, keyset, values)
+        queryset = queryset.filter(get_keyset_filter(keyset, values, direction))
+
+    ordering = list(keyset)
+    if direction == "previous":
+        ordering = [field[1:] if field.startswith("-") else f"-{field}" for field in keyset]
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == "previous":
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or direction == "previous":
+            next_cursor = encode_cursor(get_keyset_values(keyset, rows[-1]), "next")
+        if cursor and (has_more or direction == "next"):
+            previous_cursor = encode_cursor(get_keyset_values(keyset, rows[0]), "previous")
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+class KeysetPage:
+    """
+    A page of results selected by paginate_by_keyset. It mirrors the parts of
+    django.core.paginator.Page used by the templates.
+    """
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        """Check whether there is a page after this one."""
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        """Check whether there is a page before this one."""
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        """Check whether the results span more than this page."""
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginationMixin:
+    """
+    Paginate a ListView by keyset instead of by page number.
+
+    keyset lists the fields the queryset is ordered on. They must together be unique, so the
+    last one should normally be "id". A leading "-" orders the field descending.
+    The page is selected by the "cursor" query parameter.
+    """
+    paginate_by = 50
+    keyset = ("id",)
+    cursor_kwarg = "cursor"
+
+    def get_keyset(self):
+        """Return the fields the pages are ordered and selected on."""
+        return self.keyset
+
+    def get_pagination_query(self):
+        """
+        Return the query string parameters of the request other than the cursor, ending with
+        "&" if there are any, so that the page links keep them.
+        """
+        query = self.request.GET.copy()
+        query.pop(self.cursor_kwarg, None)
+        return f"{query.urlencode()}&" if query else ""
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["pagination_query"] = self.get_pagination_query()
+        return context
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Select a page of the queryset using the cursor passed in the request.
+        Returns a (paginator, page, object_list, is_paginated) tuple as ListView expects.
+        """
+        try:
+            page = paginate_by_keyset(queryset, self.get_keyset(),
+                                      self.request.GET.get(self.cursor_kwarg), page_size)
+        except ValueError:
+            raise Http404("Invalid page.")
+        return (None, page, page.object_list, page.has_other_pages())
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Paginate a REST framework list by keyset.
+
+    The view's keyset attribute lists the fields the list is ordered on, as for
+    KeysetPaginationMixin. The page is selected by the "cursor" query parameter and its size
+    by "page_size", up to max_page_size. Responses hold the links to the next and previous
+    pages and the results, but no count, since counting would scan the whole list.
+    """
+    page_size = 50
+    max_page_size = 200
+    keyset = ("id",)
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def __init__(self):
+        self.request = None
+        self.page = None
+
+    def get_page_size(self, request):
+        """Return the page size asked for in the request, within bounds."""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        keyset = getattr(view, "keyset", self.keyset)
+        try:
+            self.page = paginate_by_keyset(queryset, keyset,
+                                           request.query_params.get(self.cursor_query_param),
+                                           self.get_page_size(request))
+        except ValueError:
+            raise NotFound("Invalid cursor.")
+        return self.page.object_list
+
+    def get_link(self, cursor):
+        """Return the url of the page selected by the cursor, or None without a cursor."""
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param,
+                                   cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_link(self.page.next_cursor)),
+            ("previous", self.get_link(self.page.previous_cursor)),
+            ("results", data),
+        ]))
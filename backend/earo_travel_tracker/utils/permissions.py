@@ -0,0 +1,96 @@
+"""
+Batched assignment of django-guardian object permissions.
+
+guardian's assign_perm looks up the Permission and inserts a UserObjectPermission row on every
+call. grant_perms() caches the Permission lookups and defers the inserts until the current
+transaction commits, and all grants made inside batch_permissions() are inserted together with
+one bulk_create.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from guardian.models import UserObjectPermission
+
+_permissions = {}
+_local = threading.local()
+
+
+def get_permission(model, codename):
+    """
+    Return the Permission with the codename on the model, reading it from the database only
+    the first time.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    key = (content_type.id, codename)
+    if key not in _permissions:
+        _permissions[key] = Permission.objects.get(content_type=content_type, codename=codename)
+    return _permissions[key]
+
+
+@receiver(post_migrate)
+def clear_permission_cache(**kwargs):
+    """Forget the cached permissions since migrations may recreate them."""
+    _permissions.clear()
+
+
+class PermissionBatch:
+    """
+    Object permission grants waiting to be inserted.
+    """
+    def __init__(self):
+        self.grants = []
+
+    def add(self, user, codenames, objects):
+        """Add grants of each codename to the user on each of the objects."""
+        for obj in objects:
+            content_type = ContentType.objects.get_for_model(obj)
+            for codename in codenames:
+                self.grants.append(UserObjectPermission(
+                    permission=get_permission(type(obj), codename),
+                    content_type=content_type,
+                    user=user,
+                    object_pk=str(obj.pk),
+                ))
+
+    def flush(self):
+        """Insert the pending grants, skipping those the user already has."""
+        grants, self.grants = self.grants, []
+        if grants:
+            UserObjectPermission.objects.bulk_create(grants, ignore_conflicts=True)
+
+
+def grant_perms(user, codenames, *objects):
+    """
+    Grant the user each permission codename on the objects once the current transaction
+    commits. Outside a transaction the permissions are granted right away.
+    """
+    batch = getattr(_local, 'batch', None)
+    if batch is not None:
+        batch.add(user, codenames, objects)
+        return
+    batch = PermissionBatch()
+    batch.add(user, codenames, objects)
+    transaction.on_commit(batch.flush)
+
+
+@contextmanager
+def batch_permissions():
+    """
+    Collect the grant_perms() calls made in the block and insert them with one bulk_create
+    when the transaction commits. Nothing is granted if the block raises. Nested blocks
+    join the outermost one.
+    """
+    if getattr(_local, 'batch', None) is not None:
+        yield _local.batch
+        return
+    batch = _local.batch = PermissionBatch()
+    try:
+        yield batch
+    finally:
+        _local.batch = None
+    transaction.on_commit(batch.flush)
@@ -0,0 +1,71 @@
+"""
+PostgreSQL database backend with connection health checks and an optional in-process pool.
+
+The backend takes two settings besides Django's own:
+    CONN_HEALTH_CHECKS  check that a persistent connection still works the first time it is
+                        used in a request, and reconnect if it doesn't
+    POOL                a dict with MAX_IDLE and IDLE_TIMEOUT to take connections from
+                        utils.postgresql.pool.connection_pool and give them back there when
+                        Django closes them, instead of connecting to the server every request
+"""
+from django.db.backends.postgresql import base
+# earo_travel_tracker imports
+from utils.postgresql.pool import connection_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Django's PostgreSQL backend with health checks of persistent connections and pooling.
+    """
+    pool = connection_pool
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    def get_pool_settings(self):
+        """Return the POOL setting of the database, or None if connections aren't pooled."""
+        pool_settings = self.settings_dict.get('POOL')
+        if not pool_settings:
+            return None
+        return {'MAX_IDLE': 4, 'IDLE_TIMEOUT': 300, **pool_settings}
+
+    def get_pool_key(self):
+        """Return the key of the database and credentials this backend connects with."""
+        return tuple(self.settings_dict[name] for name in ('HOST', 'PORT', 'NAME', 'USER'))
+
+    def get_new_connection(self, conn_params):
+        pool_settings = self.get_pool_settings()
+        if pool_settings is not None:
+            connection = self.pool.acquire(self.get_pool_key(), pool_settings['IDLE_TIMEOUT'])
+            if connection is not None:
+                return connection
+        return super().get_new_connection(conn_params)
+
+    def _close(self):
+        pool_settings = self.get_pool_settings()
+        # a connection closed in an atomic block stays referenced by the backend until the
+        # block exits, so it can't be shared
+        if pool_settings is None or self.connection is None or self.in_atomic_block:
+            return super()._close()
+        with self.wrap_database_errors:
+            self.pool.release(self.get_pool_key(), self.connection, pool_settings['MAX_IDLE'])
+        return None
+
+    def connect(self):
+        super().connect()
+        # a new or pooled connection was just checked
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # called when a request starts and finishes
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done and
+                self.settings_dict.get('CONN_HEALTH_CHECKS')):
+            self.health_check_done = True
+            if not self.in_atomic_block and not self.is_usable():
+                self.close()
+        super().ensure_connection()
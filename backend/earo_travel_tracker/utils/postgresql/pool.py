@@ -0,0 +1,83 @@
+"""
+In-process pool of idle database connections.
+"""
+import atexit
+import threading
+import time
+
+
+class ConnectionPool:
+    """
+    Process wide pool of idle DB-API connections.
+
+    Connections are kept per key, which identifies the database and the credentials, so that
+    connections to different databases are never mixed. At most max_idle connections are kept
+    per key, and connections idle for longer than idle_timeout seconds are closed instead of
+    being reused since servers and firewalls drop idle clients. Connections in use aren't
+    counted, so the pool limits how many connections stay open rather than how many are open.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    @staticmethod
+    def discard(connection):
+        """Close a connection without raising if the server has already dropped it."""
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def is_usable(connection):
+        """Check a connection with a cheap round trip to the server."""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, key, idle_timeout):
+        """
+        Take a live connection to the database identified by key out of the pool.
+        Returns None if there is none.
+        """
+        while True:
+            with self.lock:
+                connections = self.idle.get(key)
+                if not connections:
+                    return None
+                connection, released_at = connections.pop()
+            if time.monotonic() - released_at <= idle_timeout and self.is_usable(connection):
+                return connection
+            self.discard(connection)
+
+    def release(self, key, connection, max_idle):
+        """
+        Return a connection to the pool, rolling back any transaction left open. The
+        connection is closed instead if it is broken or the pool for the key is full.
+        """
+        try:
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < max_idle:
+                connections.append((connection, time.monotonic()))
+                return
+        self.discard(connection)
+
+    def clear(self):
+        """Close all idle connections."""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                self.discard(connection)
+
+
+connection_pool = ConnectionPool()
+atexit.register(connection_pool.clear)
@@ -0,0 +1,80 @@
+"""
+A minimal threaded SMTP server that accepts and discards every message.
+
+It is used to benchmark and test the email backends without a real mail relay. It speaks
+just enough SMTP for smtplib (no STARTTLS or AUTH), so handshake_delay can be set to
+simulate the round trips those add on the real relay.
+"""
+import socketserver
+import threading
+import time
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Handle one SMTP session.
+    """
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        time.sleep(server.handshake_delay)
+        self.reply("220 localhost SMTP sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command.startswith("DATA"):
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with server.lock:
+                    server.messages += 1
+                self.reply("250 OK")
+            elif command.startswith("QUIT"):
+                self.reply("221 Bye")
+                return
+            else:
+                # MAIL, RCPT, RSET and NOOP
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    SMTP server counting the connections it accepted and the messages it received.
+    Use it as a context manager to serve on a background thread:
+
+        with SMTPSink() as sink:
+            send_mail(..., connection=get_connection(host=sink.host, port=sink.port))
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, handshake_delay=0):
+        super().__init__((host, port), _SMTPSinkHandler)
+        self.handshake_delay = handshake_delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,36 @@
+"""
+SQLite database backend tuned for concurrent requests on a single node.
+
+The backend takes two settings besides Django's own:
+    PRAGMAS           a dict of pragmas set on every new connection, such as journal_mode
+    TRANSACTION_MODE  DEFERRED, IMMEDIATE or EXCLUSIVE, the kind of transaction atomic() begins
+"""
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Django's SQLite backend setting pragmas on each connection and beginning transactions in
+    the configured mode.
+
+    With TRANSACTION_MODE IMMEDIATE a transaction takes the write lock when it begins, waiting
+    up to the busy timeout for it. A deferred transaction that reads before writing instead
+    fails right away with "database is locked" when another connection wrote meanwhile, since
+    SQLite can't wait for the lock without risking a deadlock.
+    """
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for pragma, value in self.settings_dict.get('PRAGMAS', {}).items():
+            connection.execute(f'PRAGMA {pragma} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict.get('TRANSACTION_MODE')
+        if mode is None:
+            return super()._start_transaction_under_autocommit()
+        if mode not in TRANSACTION_MODES:
+            raise ValueError(f"TRANSACTION_MODE must be one of {', '.join(TRANSACTION_MODES)}")
+        self.cursor().execute(f'BEGIN {mode}')
+        return None